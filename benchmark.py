@@ -0,0 +1,626 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for bikeshare.py
+
+Generates synthetic bikeshare data and times parts of bikeshare.py against
+the way they used to be done.
+
+Ex.
+python benchmark.py timestamps --rows 5000000
+python benchmark.py stats --rows 5000000
+python benchmark.py suite --sizes 100000 1000000 --out results.json
+python benchmark.py suite --baseline results.json --out results2.json
+python benchmark.py importtime --budget 0.1
+python benchmark.py compression --rows 1000000 --formats gzip bz2
+
+"""
+
+import time
+import os
+import sys
+import json
+import argparse
+import datetime
+import platform
+import tempfile
+import contextlib
+import subprocess
+import shutil
+import gzip
+import bz2
+import lzma
+import importlib.util
+import numpy as np
+import pandas as pd
+
+import bikeshare
+
+
+#shape of the generated data for each city
+#(number of stations, Gender/Birth Year columns, fractional Trip Duration)
+CITY_SHAPES = {
+    'chicago': {'stations': 585, 'user_columns': True, 'fractional_durations': False},
+    'new_york_city': {'stations': 635, 'user_columns': True, 'fractional_durations': False},
+    'washington': {'stations': 475, 'user_columns': False, 'fractional_durations': True},
+}
+#row counts of the generated files for the benchmark suite
+SUITE_SIZES = [100000, 1000000, 5000000, 20000000]
+#a stage is a regression if it is this many times slower than the baseline
+#(and at least REGRESSION_MIN_SECONDS slower)
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_SECONDS = 0.05
+#most seconds importing bikeshare may take (cumulative, python -X importtime)
+IMPORT_BUDGET_SECONDS = 0.1
+#row count of the generated files for the compression benchmark
+COMPRESSION_ROWS = 1000000
+#modules bikeshare should not import until data is loaded
+DEFERRED_IMPORTS = ['pandas', 'numpy', 'pyarrow', 'pkg_resources']
+
+
+def synthetic_times(rows, seed=0):
+    """
+    generates Start Time and End Time columns like the city data files
+
+    Parameters
+    ----------
+    rows : INT
+        Number of rows to generate.
+    seed : INT, optional
+        Seed for the random generator. The default is 0.
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        Start Time and End Time as 'YYYY-MM-DD HH:MM:SS' strings,
+        for the first half of 2017.
+
+    """
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2017-01-01T00:00:00') + rng.integers(0, 181 * 86400, rows).astype('timedelta64[s]')
+    end = start + rng.integers(60, 7200, rows).astype('timedelta64[s]')
+    return pd.DataFrame({'Start Time': np.datetime_as_string(start).astype(object),
+                         'End Time': np.datetime_as_string(end).astype(object)}).replace('T', ' ', regex=True)
+
+
+def synthetic_rows(rows, city='chicago', seed=0, first_index=0):
+    """
+    generates rows shaped like a city data file (before it is parsed)
+
+    Station popularity is skewed (a few busy stations, many quiet ones),
+    Trip Duration is whole seconds except for washington, and Gender and
+    Birth Year are only generated for the cities that have them
+    (see CITY_SHAPES). The same arguments always give the same rows.
+
+    Parameters
+    ----------
+    rows : INT
+        Number of rows to generate.
+    city : STR, optional
+        Key of CITY_SHAPES. The default is 'chicago'.
+    seed : INT, optional
+        Seed for the random generator. The default is 0.
+    first_index : INT, optional
+        Value of the (unnamed) index column for the first row. The default is 0.
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        Start Time and End Time as datetimes (written to csv as
+        'YYYY-MM-DD HH:MM:SS'), and the other csv columns.
+
+    """
+    shape = CITY_SHAPES[city]
+    rng = np.random.default_rng(seed)
+    start = np.datetime64('2017-01-01T00:00:00') + rng.integers(0, 181 * 86400, rows).astype('timedelta64[s]')
+    if(shape['fractional_durations']):
+        durations = rng.integers(60000, 7200000, rows) / 1000
+    else:
+        durations = rng.integers(60, 7200, rows)
+    stations = shape['stations']
+    station_names = np.array(['Station {} & Main St'.format(i) for i in range(stations)], dtype=object)
+    popularity = 1 / (np.arange(stations) + 10)
+    popularity /= popularity.sum()
+    df = pd.DataFrame({
+        'Start Time': start,
+        'End Time': start + np.ceil(durations).astype('timedelta64[s]'),
+        'Trip Duration': durations,
+        'Start Station': station_names[rng.choice(stations, rows, p=popularity)],
+        'End Station': station_names[rng.choice(stations, rows, p=popularity)],
+        'User Type': rng.choice(['Subscriber', 'Customer', 'Dependent'], rows, p=[0.8, 0.1999, 0.0001]),
+        }, index=pd.RangeIndex(first_index, first_index + rows))
+    if(shape['user_columns']):
+        df['Gender'] = rng.choice(['Male', 'Female', None], rows, p=[0.6, 0.3, 0.1])
+        birth_years = rng.integers(1930, 2002, rows).astype(float)
+        birth_years[rng.random(rows) < 0.1] = np.nan
+        df['Birth Year'] = birth_years
+    return df
+
+
+def write_synthetic_csv(csv_file, rows, city='chicago', seed=0, chunk_rows=1000000):
+    """
+    writes a synthetic city data file (see synthetic_rows),
+    chunk_rows at a time so any number of rows can be written
+    """
+    for i, first in enumerate(range(0, rows, chunk_rows)):
+        chunk = synthetic_rows(min(chunk_rows, rows - first), city, seed * 100003 + i, first)
+        chunk.to_csv(csv_file, mode='w' if i == 0 else 'a', header=(i == 0))
+
+
+def synthetic_city(rows, city='chicago', seed=0):
+    """
+    generates a dataframe shaped like the loaded (load_data) city data
+
+    Parameters
+    ----------
+    rows : INT
+        Number of rows to generate.
+    city : STR, optional
+        Key of CITY_SHAPES. The default is 'chicago'.
+    seed : INT, optional
+        Seed for the random generator. The default is 0.
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        Synthetic city data with the dtypes of bikeshare.DTYPE_PLAN.
+
+    """
+    df = synthetic_rows(rows, city, seed).reset_index(drop=True)
+    df['Month'] = df['Start Time'].dt.month
+    df['DoW'] = df['Start Time'].dt.dayofweek
+    return bikeshare.apply_dtype_plan(df)
+
+
+def legacy_stats(df):
+    """
+    calculates the statistics the way the calc_*_stats functions used to,
+    with separate passes over the columns for each statistic
+    """
+    results = {}
+    if(df['Month'].unique().size > 1):
+        results['month'] = df['Month'].mode()
+    if(df['DoW'].unique().size > 1):
+        results['dow'] = df['DoW'].mode()
+    results['hour'] = df['Start Time'].dt.hour.mode()
+    results['start'] = df['Start Station'].mode()
+    results['end'] = df['End Station'].mode()
+    station_pairs = pd.DataFrame(df['Start Station'])
+    station_pairs['End Station'] = df['End Station']
+    results['pairs'] = station_pairs.mode()
+    results['total'] = df['Trip Duration'].sum()
+    results['mean'] = df['Trip Duration'].mean()
+    results['user_types'] = df['User Type'].value_counts()
+    if(list(df.columns).count('Gender') > 0):
+        results['genders'] = df['Gender'].value_counts()
+    if(list(df.columns).count('Birth Year') > 0):
+        results['birth_years'] = (df['Birth Year'].min(), df['Birth Year'].max(), df['Birth Year'].mode())
+    return results
+
+
+def time_call(func, *args, **kwargs):
+    """
+    calls func and returns its result and the seconds it took
+    """
+    start_time = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start_time
+
+
+def bench_timestamps(rows):
+    """
+    compares parsing Start/End Time with pd.to_datetime (format inferred)
+    against bikeshare.parse_timestamps (detected fixed format)
+
+    The synthetic data is written to and read back from a csv file first,
+    so the columns are parsed the same way as in load_data.
+
+    Parameters
+    ----------
+    rows : INT
+        Number of rows in the synthetic file.
+
+    Returns
+    -------
+    results : DICT
+        Seconds taken by each method.
+
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file = os.path.join(tmp_dir, 'timestamps.csv')
+        synthetic_times(rows).to_csv(csv_file)
+        df = pd.read_csv(csv_file)
+    results = {}
+    _, results['inferred'] = time_call(lambda: [pd.to_datetime(df[col]) for col in ['Start Time', 'End Time']])
+    bikeshare.TIMESTAMP_PARSE_COUNTS.clear()
+    _, results['fixed_format'] = time_call(lambda: [bikeshare.parse_timestamps(df[col]) for col in ['Start Time', 'End Time']])
+    print(f'Parsing Start/End Time for {rows} rows:')
+    print('\tpd.to_datetime (inferred):      {:.3f} seconds'.format(results['inferred']))
+    print('\tparse_timestamps (fixed format): {:.3f} seconds'.format(results['fixed_format']))
+    print('\tvalues parsed: {}'.format(dict(bikeshare.TIMESTAMP_PARSE_COUNTS)))
+    return results
+
+
+def bench_stats(rows, workers=None):
+    """
+    compares the column-by-column statistics (legacy_stats) against
+    bikeshare.compute_stats on synthetic city data
+
+    legacy_stats is timed both on the dtypes load_data used to return and
+    on the compact dtypes of bikeshare.DTYPE_PLAN. Note legacy_stats finds
+    the most common start and end station separately for the trips, where
+    compute_stats counts every (start, end) pair.
+
+    Parameters
+    ----------
+    rows : INT
+        Number of rows of synthetic data.
+    workers : INT, optional
+        Number of processes for bikeshare.parallel_compute_stats.
+        The default is None (one per CPU).
+
+    Returns
+    -------
+    results : DICT
+        Seconds taken by each method.
+
+    """
+    df = synthetic_city(rows)
+    #the frame load_data used to return (convert_dtypes strings and Int64)
+    df_legacy = df.astype({col: object for col in bikeshare.DTYPE_PLAN
+                           if bikeshare.DTYPE_PLAN[col] == 'category' and col in df.columns}).convert_dtypes()
+    results = {}
+    _, results['legacy'] = time_call(legacy_stats, df_legacy)
+    _, results['legacy_planned_dtypes'] = time_call(legacy_stats, df)
+    _, results['compute_stats'] = time_call(bikeshare.compute_stats, df)
+    workers = workers or os.cpu_count()
+    _, results['parallel_compute_stats'] = time_call(bikeshare.parallel_compute_stats, df, workers)
+    _, results['pair_mode'] = time_call(lambda: pd.DataFrame(
+        {'Start Station': df_legacy['Start Station'], 'End Station': df_legacy['End Station']}).mode())
+    _, results['rank_station_pairs'] = time_call(bikeshare.rank_station_pairs, df['Start Station'], df['End Station'])
+    print(f'Statistics for {rows} rows:')
+    print('\tseparate column passes:                  {:.3f} seconds'.format(results['legacy']))
+    print('\tseparate column passes (planned dtypes): {:.3f} seconds'.format(results['legacy_planned_dtypes']))
+    print('\tcompute_stats (planned dtypes):          {:.3f} seconds'.format(results['compute_stats']))
+    print('\tparallel_compute_stats ({} workers):      {:.3f} seconds'.format(workers, results['parallel_compute_stats']))
+    print('\tstation pairs DataFrame.mode (copy):     {:.3f} seconds'.format(results['pair_mode']))
+    print('\trank_station_pairs (top {}):              {:.3f} seconds'.format(bikeshare.TOP_TRIPS, results['rank_station_pairs']))
+    return results
+
+
+def _clear_caches(csv_file):
+    """
+    removes every cache of csv_file so the next load reads the csv file
+    """
+    bikeshare.DATASET_CACHE.clear()
+    for cache_file in [bikeshare.columnar_cache_file(csv_file), bikeshare.stats_index_file(csv_file)]:
+        if(os.path.exists(cache_file)):
+            os.remove(cache_file)
+
+
+def run_suite(cities, sizes, work_dir, pages=20):
+    """
+    times each stage of bikeshare.py on synthetic data for each city and size
+
+    Stages timed:
+    load_data : cold load from the csv file (including writing the columnar cache)
+    load_data_columnar : load from the columnar cache (if pyarrow is installed)
+    load_data_filtered : cold load of one month and weekday (read_filtered_data)
+    compute_stats : every statistics count of the loaded data, once
+    calc_time_stats, calc_station_stats, calc_trip_stats, calc_user_stats :
+        each function given those counts (the work of the stage only)
+    view_raw : paging through the loaded data
+    view_raw_pager : paging through the csv file (RowPager)
+
+    The synthetic csv files are kept in work_dir and reused by later runs.
+
+    Parameters
+    ----------
+    cities : LIST of STR
+        Keys of CITY_SHAPES.
+    sizes : LIST of INT
+        Row counts of the files.
+    work_dir : STR
+        Directory for the synthetic csv files.
+    pages : INT, optional
+        Number of pages viewed for the view_raw stages. The default is 20.
+
+    Returns
+    -------
+    results : LIST of DICT
+        city, rows, stage, and seconds for each stage.
+
+    """
+    results = []
+    os.makedirs(work_dir, exist_ok=True)
+    #no background parse after the filtered load (see bikeshare.load_data),
+    #it would compete with the stages timed after it
+    bikeshare.FILL_CACHES_LATER = False
+    for city in cities:
+        for rows in sizes:
+            csv_file = os.path.join(work_dir, '{}_{}.csv'.format(city, rows))
+            if(not os.path.exists(csv_file)):
+                print('Generating {}...'.format(csv_file))
+                write_synthetic_csv(csv_file, rows, city)
+            timings = {}
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                _clear_caches(csv_file)
+                df, timings['load_data'] = time_call(bikeshare.load_data, csv_file)
+                if(bikeshare.pyarrow_available()):
+                    bikeshare.DATASET_CACHE.clear()
+                    df, timings['load_data_columnar'] = time_call(bikeshare.load_data, csv_file)
+                stats, timings['compute_stats'] = time_call(bikeshare.compute_stats, df)
+                for calc in [bikeshare.calc_time_stats, bikeshare.calc_station_stats,
+                             bikeshare.calc_trip_stats, bikeshare.calc_user_stats]:
+                    _, timings[calc.__name__] = time_call(calc, df, stats)
+                _, timings['view_raw'] = time_call(_view_pages, df, pages)
+                _, timings['view_raw_pager'] = time_call(_view_pages, bikeshare.RowPager(csv_file), pages)
+                del(df)
+                _clear_caches(csv_file)
+                _, timings['load_data_filtered'] = time_call(bikeshare.load_data, csv_file, (3, 'March'), (0, 'Monday'))
+                _clear_caches(csv_file)
+            for stage, seconds in timings.items():
+                results.append({'city': city, 'rows': rows, 'stage': stage, 'seconds': seconds})
+                print('{:<15}{:>10} {:<22}{:.3f} seconds'.format(city, rows, stage, seconds))
+    return results
+
+
+def bench_compression(cities, rows, work_dir, formats=None):
+    """
+    times loading compressed city files against their compression ratio
+
+    For each city a synthetic csv file is compressed with each format twice:
+    as a single stream (as gzip, bzip2, xz or zstd write it) and split into
+    members with bikeshare.compress_city_file. The time to load (parse) each
+    file with bikeshare.parse_city_csv -- no cache -- is compared to loading
+    the plain csv file.
+
+    Parameters
+    ----------
+    cities : LIST of STR
+        Keys of CITY_SHAPES.
+    rows : INT
+        Row count of the files.
+    work_dir : STR
+        Directory for the synthetic files.
+    formats : LIST of STR, optional
+        Compression formats ('gzip', 'bz2', 'xz', 'zstd'). The default is
+        None (all of them, zstd only if zstandard is installed).
+
+    Returns
+    -------
+    results : LIST of DICT
+        city, format, members (BOOL), ratio (csv size / file size),
+        and load seconds for each file.
+
+    """
+    if(formats is None):
+        formats = [name for name in bikeshare.COMPRESSION_EXTS.values()
+                   if name != 'zstd' or importlib.util.find_spec('zstandard') is not None]
+    results = []
+    os.makedirs(work_dir, exist_ok=True)
+    for city in cities:
+        csv_file = os.path.join(work_dir, '{}_{}.csv'.format(city, rows))
+        if(not os.path.exists(csv_file)):
+            print('Generating {}...'.format(csv_file))
+            write_synthetic_csv(csv_file, rows, city)
+        csv_size = os.path.getsize(csv_file)
+        files = [('csv', False, csv_file)]
+        for compression in formats:
+            ext = [ext for ext, name in bikeshare.COMPRESSION_EXTS.items() if name == compression][0]
+            stream_file = os.path.join(work_dir, '{}_{}_stream.csv{}'.format(city, rows, ext))
+            if(not os.path.exists(stream_file)):
+                _compress_stream(csv_file, stream_file, compression)
+            files.append((compression, False, stream_file))
+            member_file = csv_file + ext
+            if(bikeshare.read_member_index(member_file) is None):
+                bikeshare.compress_city_file(csv_file, compression)
+            files.append((compression, True, member_file))
+        for compression, members, data_file in files:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                _, seconds = time_call(bikeshare.parse_city_csv, data_file)
+            result = {'city': city, 'format': compression, 'members': members,
+                      'ratio': csv_size / os.path.getsize(data_file), 'seconds': seconds}
+            results.append(result)
+            print('{:<15}{:<6}{:<10}{:>6.1f}x {:.3f} seconds'.format(
+                city, compression, 'members' if members else 'stream', result['ratio'], seconds))
+    return results
+
+
+def _compress_stream(csv_file, compressed_file, compression):
+    """
+    compresses csv_file to compressed_file as a single stream
+    """
+    if(compression == 'zstd'):
+        import zstandard
+        with open(csv_file, 'rb') as src, open(compressed_file, 'wb') as out:
+            zstandard.ZstdCompressor().copy_stream(src, out)
+        return
+    openers = {'gzip': lambda f: gzip.open(f, 'wb', compresslevel=6),
+               'bz2': lambda f: bz2.open(f, 'wb'), 'xz': lambda f: lzma.open(f, 'wb')}
+    with open(csv_file, 'rb') as src, openers[compression](compressed_file) as out:
+        shutil.copyfileobj(src, out, 1024 * 1024)
+
+
+def _view_pages(data, pages):
+    """
+    views pages of rows with bikeshare.view_raw
+    """
+    start_index = 0
+    for _ in range(pages):
+        start_index = bikeshare.view_raw(data, start_index)
+        if(start_index < 0):
+            break
+
+
+def save_results(results, out_file):
+    """
+    saves benchmark results, with the versions and platform they were run on,
+    to a json file
+    """
+    with open(out_file, 'w') as f:
+        json.dump({
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'results': results,
+            }, f, indent=1)
+
+
+def compare_results(baseline_file, results, ratio=REGRESSION_RATIO):
+    """
+    compares results against the results saved in baseline_file
+
+    Parameters
+    ----------
+    baseline_file : STR
+        Results file saved by an earlier run (see save_results).
+    results : LIST of DICT
+        Results of this run.
+    ratio : FLOAT, optional
+        A stage is a regression if it is this many times slower than the
+        baseline (and at least REGRESSION_MIN_SECONDS slower).
+        The default is REGRESSION_RATIO.
+
+    Returns
+    -------
+    regressions : LIST of DICT
+        The results that regressed, with the baseline seconds added.
+
+    """
+    with open(baseline_file) as f:
+        baseline = {(r['city'], r['rows'], r['stage']): r['seconds'] for r in json.load(f)['results']}
+    regressions = []
+    for result in results:
+        before = baseline.get((result['city'], result['rows'], result['stage']))
+        if(before is None):
+            continue
+        if(result['seconds'] > before * ratio and result['seconds'] - before > REGRESSION_MIN_SECONDS):
+            regressions.append(dict(result, baseline_seconds=before))
+            print('REGRESSION {} {} {}: {:.3f} seconds (was {:.3f})'.format(
+                result['city'], result['rows'], result['stage'], result['seconds'], before))
+    return regressions
+
+
+def bench_importtime(budget=IMPORT_BUDGET_SECONDS, repeat=5, top=10):
+    """
+    measures how long importing bikeshare takes with python -X importtime
+
+    bikeshare is imported in a new interpreter repeat times and the fastest
+    import is kept. The import is over budget if it takes more than budget
+    seconds or imports any of DEFERRED_IMPORTS.
+
+    Parameters
+    ----------
+    budget : FLOAT, optional
+        Most seconds the import may take. The default is IMPORT_BUDGET_SECONDS.
+    repeat : INT, optional
+        Number of imports measured. The default is 5.
+    top : INT, optional
+        Number of slowest imported modules printed. The default is 10.
+
+    Returns
+    -------
+    results : DICT
+        'seconds' (cumulative import time of bikeshare), 'deferred' (modules of
+        DEFERRED_IMPORTS imported), and 'over_budget' (BOOL).
+
+    """
+    script_dir = os.path.dirname(os.path.realpath(__file__))
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import bikeshare'],
+                              cwd=script_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, check=True)
+        times = _parse_importtime(proc.stderr)
+        if(best is None or times['bikeshare'] < best['bikeshare']):
+            best = times
+    deferred = [module for module in DEFERRED_IMPORTS if module in best]
+    results = {'seconds': best['bikeshare'], 'deferred': deferred,
+               'over_budget': best['bikeshare'] > budget or len(deferred) > 0}
+    print('Importing bikeshare took {:.3f} seconds (budget {:.3f}, best of {}).'
+          .format(results['seconds'], budget, repeat))
+    print('Slowest imports (cumulative):')
+    for module, seconds in sorted(best.items(), key=lambda item: -item[1])[1:top + 1]:
+        print('\t{:<40}{:.4f} seconds'.format(module, seconds))
+    if(deferred):
+        print('ERROR: imported at startup: {}'.format(', '.join(deferred)))
+    if(results['seconds'] > budget):
+        print('ERROR: import time is over budget')
+    return results
+
+
+def _parse_importtime(output):
+    """
+    returns the cumulative seconds of each module imported from the
+    (stderr) output of python -X importtime
+    """
+    times = {}
+    for line in output.splitlines():
+        if(not line.startswith('import time:')):
+            continue
+        parts = line[len('import time:'):].split('|')
+        try:
+            cumulative = int(parts[1])
+        except (IndexError, ValueError):
+            #the header line
+            continue
+        times[parts[2].strip()] = cumulative / 1e6
+    return times
+
+
+def parse_args(args=None):
+    """
+    parses the command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks for bikeshare.py')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    ts_parser = subparsers.add_parser('timestamps', help='Start/End Time parsing')
+    ts_parser.add_argument('--rows', type=int, default=5000000)
+    stats_parser = subparsers.add_parser('stats', help='statistics calculations')
+    stats_parser.add_argument('--rows', type=int, default=5000000)
+    stats_parser.add_argument('--workers', type=int, default=None,
+                              help='processes for parallel_compute_stats (default one per CPU)')
+    suite_parser = subparsers.add_parser('suite', help='every stage, for each city and size')
+    suite_parser.add_argument('--cities', nargs='+', choices=list(CITY_SHAPES), default=list(CITY_SHAPES))
+    suite_parser.add_argument('--sizes', nargs='+', type=int, default=SUITE_SIZES)
+    suite_parser.add_argument('--work-dir', default=None,
+                              help='directory for the synthetic csv files (default is a temporary directory)')
+    suite_parser.add_argument('--out', default='benchmark_results.json', help='file to save the results to')
+    suite_parser.add_argument('--baseline', default=None,
+                              help='results file of an earlier run to check for regressions')
+    compress_parser = subparsers.add_parser('compression', help='load time of compressed city files')
+    compress_parser.add_argument('--cities', nargs='+', choices=list(CITY_SHAPES), default=list(CITY_SHAPES))
+    compress_parser.add_argument('--rows', type=int, default=COMPRESSION_ROWS)
+    compress_parser.add_argument('--formats', nargs='+', choices=list(bikeshare.COMPRESSION_EXTS.values()),
+                                 default=None, help='compression formats (default all available)')
+    compress_parser.add_argument('--work-dir', default=None,
+                                 help='directory for the synthetic files (default is a temporary directory)')
+    import_parser = subparsers.add_parser('importtime', help='import time of bikeshare (python -X importtime)')
+    import_parser.add_argument('--budget', type=float, default=IMPORT_BUDGET_SECONDS,
+                               help='most seconds the import may take (exit status 1 if over)')
+    import_parser.add_argument('--repeat', type=int, default=5)
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if(args.benchmark == 'timestamps'):
+        bench_timestamps(args.rows)
+    elif(args.benchmark == 'stats'):
+        bench_stats(args.rows, args.workers)
+    elif(args.benchmark == 'suite'):
+        with contextlib.ExitStack() as stack:
+            work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory())
+            results = run_suite(args.cities, args.sizes, work_dir)
+        save_results(results, args.out)
+        if(args.baseline is not None and compare_results(args.baseline, results)):
+            sys.exit(1)
+    elif(args.benchmark == 'compression'):
+        with contextlib.ExitStack() as stack:
+            work_dir = args.work_dir or stack.enter_context(tempfile.TemporaryDirectory())
+            bench_compression(args.cities, args.rows, work_dir, args.formats)
+    elif(args.benchmark == 'importtime'):
+        if(bench_importtime(args.budget, args.repeat)['over_budget']):
+            sys.exit(1)
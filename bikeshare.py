@@ -10,14 +10,505 @@ calculates statistics, and allows a view of the raw data.
 """
 
 import time
-import pandas as pd
 import os
 import datetime
-import pkg_resources as pkgr
+import collections
+import collections.abc
+import dataclasses
+import argparse
+import json
+import io
+import csv
+import sys
+import contextlib
+import array
+import heapq
+import tracemalloc
+try:
+    #not available on Windows -- peak RSS is not recorded there
+    import resource
+except ImportError:
+    resource = None
+import concurrent.futures
+import multiprocessing
+import threading
+import socket
+import urllib.parse
+import importlib
+import re
+import gzip
+import bz2
+import lzma
+import zipfile
+
+
+class _LazyModule:
+    """
+    stands in for a module that is slow to import until one of its
+    attributes is first used
+
+    The module is imported then, and the global name standing for it is
+    rebound to the module itself. pandas and numpy are only needed once
+    data is loaded, so the first prompt is shown without waiting for them.
+
+    """
+
+    def __init__(self, name, global_name):
+        self._name = name
+        self._global_name = global_name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if(self._module is None):
+            self._module = importlib.import_module(self._name)
+            globals()[self._global_name] = self._module
+        return getattr(self._module, attr)
+
+
+pd = _LazyModule('pandas', 'pd')
+np = _LazyModule('numpy', 'np')
+#optional -- used for the columnar (feather) cache of parsed city data
+#(see pyarrow_available)
+pa = _LazyModule('pyarrow', 'pa')
+feather = _LazyModule('pyarrow.feather', 'feather')
+#optional -- only needed for zstandard compressed (.csv.zst) city files
+zstandard = _LazyModule('zstandard', 'zstandard')
 
 
 AVAILABLE_CITIES = ['chicago', 'new york city', 'washington']
-PD_VERSION = '1.3.3'
+#pandas versions this script works with (at least PD_MIN_VERSION, below PD_MAX_VERSION)
+PD_MIN_VERSION = '1.3.3'
+PD_MAX_VERSION = '4.0'
+#memory budget for the parsed city datasets kept between prompts/restarts
+#(roughly one large city at a time)
+DATASET_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+#parsed city data is saved next to the csv file as <city>.csv.feather
+COLUMNAR_CACHE_EXT = '.feather'
+#statistics counts for each (month, weekday) are saved as <city>.csv.stats.npz
+STATS_INDEX_EXT = '.stats.npz'
+#format of the statistics index file -- files of another version are rebuilt
+STATS_INDEX_VERSION = 1
+#statistics index cells: months 1-12 and every month (ALL_MONTHS) by
+#weekdays 0-6 and every weekday (ALL_WEEKDAYS), see CellCounts
+CELL_GRID = (13, 8)
+CELL_COUNT = CELL_GRID[0] * CELL_GRID[1]
+ALL_MONTHS = 0
+ALL_WEEKDAYS = 7
+#extension added to a csv file name for its metadata file (see probe_city_file)
+METADATA_EXT = '.meta.json'
+#bytes at the end of a csv file recorded with its caches, to recognise a
+#later version of the file that only has rows appended
+APPEND_CHECK_BYTES = 4096
+#compression of a city file by the extension after .csv (see find_city_file)
+COMPRESSION_EXTS = collections.OrderedDict([
+    ('.gz', 'gzip'),
+    ('.bz2', 'bz2'),
+    ('.xz', 'xz'),
+    ('.zst', 'zstd'),
+])
+#offsets of the members of a compressed city file written by
+#compress_city_file are saved as <city>.csv.gz.members.json (see read_member_index)
+MEMBERS_EXT = '.members.json'
+#csv bytes compressed into each member of a file written by compress_city_file
+MEMBER_BYTES = 8 * 1024 * 1024
+#number of members of a compressed city file (de)compressed at the same time
+COMPRESS_WORKERS = os.cpu_count() or 1
+#compact dtypes for the loaded city data (columns missing from a city are skipped)
+#'Trip Duration' is stored as int32 when all durations are whole seconds
+DTYPE_PLAN = {
+    'Trip Duration': 'float32',
+    'Start Station': 'category',
+    'End Station': 'category',
+    'User Type': 'category',
+    'Gender': 'category',
+    'Birth Year': 'Int16',
+    'Month': 'int8',
+    'DoW': 'int8',
+}
+#columns of the city data needed by each statistics stage (see stage_columns)
+STAGE_COLUMNS = collections.OrderedDict([
+    ('time', ['Start Time']),
+    ('station', ['Start Station', 'End Station']),
+    ('trip', ['Trip Duration']),
+    ('user', ['User Type', 'Gender', 'Birth Year']),
+])
+#print memory usage before and after the dtype plan is applied (--memory-report)
+REPORT_MEMORY = False
+#after a filtered load of a city that is not cached, parse the whole city in
+#a background thread to fill the dataset and columnar caches for later loads
+FILL_CACHES_LATER = True
+#largest part of a csv file (bytes) read by one worker task (--workers)
+RANGE_BYTES = 64 * 1024 * 1024
+#bytes of a csv file scanned at a time when finding the rows to view
+PAGER_BLOCK_BYTES = 4 * 1024 * 1024
+#largest number of (start, end) station combinations counted with a dense
+#array (np.bincount) -- more combinations are counted by sorting
+PAIR_BINCOUNT_MAX = 1 << 22
+#categorical columns counted by their codes in parallel_compute_stats,
+#with the TripStats field they are counted in
+CODED_COLUMNS = collections.OrderedDict([
+    ('Start Station', 'start_stations'),
+    ('End Station', 'end_stations'),
+    ('User Type', 'user_types'),
+    ('Gender', 'genders'),
+])
+#number of most common trips (station pairs) reported (see TripStats.top_trips)
+TOP_TRIPS = 5
+#values (stations, station pairs) counted by each SpaceSaving summary
+#in --approx mode
+APPROX_CAPACITY = 2000
+#rows read at a time when filtering a csv file while it is read
+#(and when calculating statistics in --stream mode)
+FILTER_CHUNK_ROWS = 500000
+#number of (month, weekday, hour) groups of TimeIndexedView
+TIME_GROUP_COUNT = 12 * 7 * 24
+#number of cities loaded at the same time (see iter_city_data)
+LOAD_CONCURRENCY = len(AVAILABLE_CITIES)
+#number of statistics responses kept by the stats server (see StatsServer)
+SERVER_RESULT_CACHE_SIZE = 4096
+#timestamp layouts tried (in order) when detecting the format of a time column
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M',
+                     '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %H:%M']
+#rows used to detect the format of a time column
+TIMESTAMP_SAMPLE_ROWS = 100
+#number of values parsed with a detected format ('fast')
+#and values that fell back to format inference ('fallback')
+TIMESTAMP_PARSE_COUNTS = collections.Counter()
+
+
+class DatasetCache:
+    """
+    keeps parsed city datasets in memory between loads
+
+    Parsed dataframes are keyed by the file path and the file's modification
+    time, so a city file that changes on disk is parsed again.
+    Least recently used datasets are dropped once the total (deep) memory
+    usage of the cached dataframes is over max_bytes. The most recently
+    used dataset is always kept, even if it alone is over the budget.
+    A view made from a cached dataframe (see view) is kept in the same
+    entry, counts toward the budget, and is dropped with the dataframe.
+
+    """
+
+    def __init__(self, max_bytes=DATASET_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        #the stats server reads the cache from several threads
+        self._lock = threading.Lock()
+
+    def get(self, datafile):
+        """
+        returns the cached dataframe for datafile, None if not cached (or stale)
+        """
+        with self._lock:
+            entry = self._entries.get(datafile)
+            if(entry is None):
+                return None
+            mtime, size, df, view = entry
+            if(mtime != os.path.getmtime(datafile)):
+                #file changed since it was parsed
+                del(self._entries[datafile])
+                return None
+            self._entries.move_to_end(datafile)
+            return df
+
+    def put(self, datafile, df):
+        """
+        stores the dataframe for datafile and evicts datasets over the budget
+        """
+        size = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._entries[datafile] = (os.path.getmtime(datafile), size, df, None)
+            self._entries.move_to_end(datafile)
+            self._evict()
+
+    def view(self, datafile, df, make_view):
+        """
+        returns the view of df, the cached dataframe for datafile, made by
+        make_view(df) the first time and kept in the cache entry of df
+        (not kept if df is no longer cached)
+        """
+        with self._lock:
+            entry = self._entries.get(datafile)
+            if(entry is not None and entry[2] is df and entry[3] is not None):
+                self._entries.move_to_end(datafile)
+                return entry[3]
+        #made without the lock, other datasets can be read meanwhile
+        view = make_view(df)
+        with self._lock:
+            entry = self._entries.get(datafile)
+            if(entry is not None and entry[2] is df):
+                if(entry[3] is not None):
+                    #made by another thread meanwhile
+                    return entry[3]
+                self._entries[datafile] = (entry[0], entry[1] + view.nbytes(), df, view)
+                self._entries.move_to_end(datafile)
+                self._evict()
+        return view
+
+    def _evict(self):
+        """
+        drops the least recently used datasets over the budget (lock held)
+        """
+        while(len(self._entries) > 1 and self.nbytes() > self.max_bytes):
+            self._entries.popitem(last=False)
+
+    def nbytes(self):
+        """
+        returns the total memory (bytes) used by the cached dataframes
+        """
+        return sum(entry[1] for entry in self._entries.values())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+DATASET_CACHE = DatasetCache()
+
+
+class Instrumentation:
+    """
+    records named spans around the stages of loading, filtering and
+    calculating statistics
+
+    Each span records its name, nesting depth, perf_counter duration,
+    row count (if the stage sets one), peak RSS of the process so far, and
+    (if trace_memory is set) the peak memory allocated during the span as
+    traced by tracemalloc. Finished spans are passed to each sink
+    (see ConsoleSink and JsonLogSink). If profile_dir is set, each outermost
+    span is also profiled with cProfile and dumped to
+    <profile_dir>/<name>-<n>.prof (one span at a time -- a span starting
+    while another is profiled, in any thread, is not profiled).
+
+    """
+
+    def __init__(self, sinks=None, trace_memory=False, profile_dir=None):
+        self.sinks = list(sinks or [])
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        #nesting depth of the spans of each thread (see StatsServer)
+        self._local = threading.local()
+        self._profiled = 0
+        self._profiling = False
+        self._profile_lock = threading.Lock()
+
+    def _start_profile(self):
+        """
+        returns a started cProfile profiler, NONE if one is already running
+        """
+        with self._profile_lock:
+            if(self._profiling):
+                return None
+            self._profiling = True
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _start_trace(self):
+        """
+        starts tracing the memory allocated by a span, returns the memory
+        traced when it starts
+
+        tracemalloc keeps one peak for the process, so the peak of each span
+        still open in the thread is kept on a stack: starting a span folds
+        the peak so far into the enclosing span's before the peak is reset,
+        and a finished span passes its peak on to the enclosing one.
+        """
+        if(not tracemalloc.is_tracing()):
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        peaks = self._local.__dict__.setdefault('peaks', [])
+        if(peaks):
+            peaks[-1] = max(peaks[-1], peak)
+        peaks.append(current)
+        if(hasattr(tracemalloc, 'reset_peak')):
+            tracemalloc.reset_peak()
+        return current
+
+    def _end_trace(self):
+        """
+        returns the peak memory traced during the span ending (see _start_trace)
+        """
+        peaks = self._local.peaks
+        peak = max(peaks.pop(), tracemalloc.get_traced_memory()[1])
+        if(peaks):
+            peaks[-1] = max(peaks[-1], peak)
+        return peak
+
+    @contextlib.contextmanager
+    def span(self, name, rows=None):
+        """
+        times the code in the with block as a span named name
+
+        Yields the span record (DICT) so the stage can set 'rows'.
+        """
+        depth = getattr(self._local, 'depth', 0)
+        record = {'name': name, 'depth': depth, 'rows': rows}
+        profiler = None
+        if(self.trace_memory):
+            traced_before = self._start_trace()
+        self._local.depth = depth + 1
+        if(self.profile_dir is not None and depth == 0):
+            profiler = self._start_profile()
+        start_time = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start_time
+            if(profiler is not None):
+                profiler.disable()
+                with self._profile_lock:
+                    self._profiling = False
+                    self._profiled += 1
+                    profiled = self._profiled
+                os.makedirs(self.profile_dir, exist_ok=True)
+                record['profile'] = os.path.join(self.profile_dir, '{}-{}.prof'.format(name, profiled))
+                profiler.dump_stats(record['profile'])
+            self._local.depth = depth
+            if(self.trace_memory):
+                record['traced_peak_mb'] = (self._end_trace() - traced_before) / 1024**2
+            if(resource is not None):
+                maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                #kilobytes on linux, bytes on macOS
+                record['peak_rss_mb'] = maxrss / (1024**2 if sys.platform == 'darwin' else 1024)
+            for sink in self.sinks:
+                sink.emit(record)
+
+    def close(self):
+        """
+        closes the sinks (prints the console summary, closes log files)
+        """
+        for sink in self.sinks:
+            sink.close()
+
+
+class ConsoleSink:
+    """
+    prints how long each span took as it finishes (nested spans indented),
+    and a summary of the time spent in each stage when closed
+
+    Only spans nested at most max_depth deep are printed as they finish
+    (all spans are printed if max_depth is NONE); the summary includes all.
+    Timings go to stderr (or fp) so they do not mix with output written
+    to stdout, such as --batch records.
+    """
+
+    def __init__(self, summary=True, max_depth=None, fp=None):
+        self.summary = summary
+        self.max_depth = max_depth
+        self.fp = fp
+        self._totals = collections.OrderedDict()
+
+    def _print(self, text):
+        #sys.stderr is looked up when printing in case it is replaced
+        print(text, file=self.fp or sys.stderr)
+
+    def emit(self, record):
+        count, seconds = self._totals.get(record['name'], (0, 0.0))
+        self._totals[record['name']] = (count + 1, seconds + record['seconds'])
+        if(self.max_depth is not None and record['depth'] > self.max_depth):
+            return
+        details = []
+        if(record.get('rows') is not None):
+            details.append('{} rows'.format(record['rows']))
+        if(record.get('traced_peak_mb') is not None):
+            details.append('{:.1f} MB allocated'.format(record['traced_peak_mb']))
+        if(record.get('peak_rss_mb') is not None):
+            details.append('peak RSS {:.0f} MB'.format(record['peak_rss_mb']))
+        self._print('{}{}{} took {:.4f} seconds{}.'.format(
+            '' if record['depth'] else '\n', '  ' * record['depth'], record['name'], record['seconds'],
+            ' ({})'.format(', '.join(details)) if details else ''))
+
+    def close(self):
+        if(not self.summary or not self._totals):
+            return
+        self._print('\nTime spent by stage:')
+        for name, (count, seconds) in self._totals.items():
+            self._print('\t{:<24}{:>5} x {:>10.4f} seconds'.format(name, count, seconds))
+        self._totals.clear()
+
+
+class JsonLogSink:
+    """
+    appends each finished span to a file as one json line (with a timestamp)
+    """
+
+    def __init__(self, log_file):
+        self.fp = open(log_file, 'a')
+
+    def emit(self, record):
+        self.fp.write(json.dumps(dict(record, time=datetime.datetime.now().isoformat())) + '\n')
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+#spans of this process (see Instrumentation) -- the sinks are set from the
+#command line options in __main__
+INSTRUMENTATION = Instrumentation([ConsoleSink(summary=False, max_depth=0)])
+#statistics indexes already read, by csv file: (source signature, cells)
+_STATS_INDEX_CACHE = {}
+#metadata already read or found, by csv file (see probe_city_file)
+_METADATA_CACHE = {}
+#background threads filling the caches of a city, by csv file (see _fill_caches_later)
+_CACHE_FILLS = {}
+_CACHE_FILLS_LOCK = threading.Lock()
+
+#dataframe counted by a worker process of parallel_compute_stats, set in
+#the worker only (see _share_frame)
+_SHARED_FRAME = None
+#whether pyarrow could be imported, NONE until first checked (see pyarrow_available)
+_PYARROW_AVAILABLE = None
+
+
+def pyarrow_available():
+    """
+    checks whether pyarrow (optional, for the columnar cache) can be imported,
+    importing it the first time
+    """
+    global _PYARROW_AVAILABLE
+    if(_PYARROW_AVAILABLE is None):
+        try:
+            importlib.import_module('pyarrow.feather')
+            _PYARROW_AVAILABLE = True
+        except ImportError:
+            _PYARROW_AVAILABLE = False
+    return _PYARROW_AVAILABLE
+
+
+def pandas_version():
+    """
+    returns the installed pandas version
+
+    The version is read from the package metadata (importlib.metadata),
+    so pandas is not imported. Python 3.7 has no importlib.metadata;
+    pandas is imported to find its version there.
+    """
+    try:
+        from importlib import metadata
+    except ImportError:
+        return pd.__version__
+    try:
+        return metadata.version('pandas')
+    except metadata.PackageNotFoundError:
+        return pd.__version__
+
+
+def _version_tuple(version):
+    """
+    returns the (major, minor, micro) numbers of a version string
+    """
+    return tuple(int(part) for part in re.findall(r'\d+', version)[:3])
+
+
+def pandas_version_compatible(version):
+    """
+    checks that a pandas version is at least PD_MIN_VERSION and below PD_MAX_VERSION
+    """
+    return _version_tuple(PD_MIN_VERSION) <= _version_tuple(version) < _version_tuple(PD_MAX_VERSION)
 
 
 def get_city_file():
@@ -51,13 +542,8 @@ def get_city_file():
             #since we expect text (city name) but will handle specifically
             #the number associated with the city that was printed to the user
         finally:
-            file_name = user_city.lower().replace(' ', '_') + ".csv"
-            working_dir = os.getcwd()
-            running_dir = os.path.dirname(os.path.realpath(__file__))
-            fn = os.path.join(working_dir, file_name)
-            if(not os.path.exists(fn)):
-                fn = os.path.join(running_dir, file_name)
-            if(os.path.exists(fn)):
+            fn = find_city_file(user_city)
+            if(fn is not None):
                 city_file = fn
                 break
             else:
@@ -66,6 +552,291 @@ def get_city_file():
     return city_file
 
 
+def find_city_file(city):
+    """
+    finds the data file for a city
+
+    The file name is the (lowercase) city name with spaces converted to
+    underscores. The current working directory is checked first, then
+    the directory this file is stored in. In each, <city>.csv is used if
+    it exists, otherwise a compressed <city>.csv.gz, .csv.bz2, .csv.xz or
+    .csv.zst (see COMPRESSION_EXTS), which is decompressed as it is read.
+
+    Parameters
+    ----------
+    city : STR
+        Name of the city.
+
+    Returns
+    -------
+    city_file : STR
+        Full path to file for data in city, NONE if there is no file for the city.
+
+    """
+    file_name = city.lower().replace(' ', '_') + ".csv"
+    working_dir = os.getcwd()
+    running_dir = os.path.dirname(os.path.realpath(__file__))
+    for directory in [working_dir, running_dir]:
+        for ext in [''] + list(COMPRESSION_EXTS):
+            fn = os.path.join(directory, file_name + ext)
+            if(os.path.exists(fn)):
+                return fn
+    return None
+
+
+def city_file_compression(datafile):
+    """
+    returns the compression of a city file from its extension
+    ('gzip', 'bz2', 'xz' or 'zstd'), NONE for a plain csv file
+    """
+    return COMPRESSION_EXTS.get(os.path.splitext(datafile)[1].lower())
+
+
+def open_city_file(datafile):
+    """
+    opens a city file for reading (binary), decompressing it
+    as it is read if it is compressed (see city_file_compression)
+    """
+    compression = city_file_compression(datafile)
+    if(compression == 'gzip'):
+        return gzip.open(datafile, 'rb')
+    if(compression == 'bz2'):
+        return bz2.open(datafile, 'rb')
+    if(compression == 'xz'):
+        return lzma.open(datafile, 'rb')
+    if(compression == 'zstd'):
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(
+            open(datafile, 'rb'), read_across_frames=True, closefd=True))
+    return open(datafile, 'rb')
+
+
+@contextlib.contextmanager
+def _csv_source(datafile):
+    """
+    yields what pandas should read a city file from: a stream decompressing
+    its members in parallel if it has a current member index (see
+    read_member_index), otherwise the path itself (pandas decompresses
+    a compressed file as it reads it)
+    """
+    members = read_member_index(datafile)
+    if(members is None):
+        yield datafile
+        return
+    with io.BufferedReader(_MemberReader(datafile, members)) as stream:
+        yield stream
+
+
+def _decompress(data, compression):
+    """
+    decompresses bytes holding one or more whole members (streams or frames)
+    """
+    if(compression == 'gzip'):
+        return gzip.decompress(data)
+    if(compression == 'bz2'):
+        return bz2.decompress(data)
+    if(compression == 'xz'):
+        return lzma.decompress(data)
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+        return reader.read()
+
+
+def _compress(data, compression):
+    """
+    compresses bytes as one member, at the default level of each format's
+    command line tool
+    """
+    if(compression == 'gzip'):
+        return gzip.compress(data, compresslevel=6)
+    if(compression == 'bz2'):
+        return bz2.compress(data)
+    if(compression == 'xz'):
+        return lzma.compress(data)
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _decompress_member(datafile, compression, start, end):
+    """
+    reads and decompresses the members between the byte offsets start and end
+    """
+    with open(datafile, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return _decompress(data, compression)
+
+
+def _iter_ordered(executor, func, items, lookahead):
+    """
+    yields func(*item) for each of items in order, running at most
+    lookahead calls on executor ahead of the one yielded
+    """
+    futures = collections.deque()
+    items = iter(items)
+    try:
+        for item in items:
+            futures.append(executor.submit(func, *item))
+            if(len(futures) >= lookahead):
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+class _MemberReader(io.RawIOBase):
+    """
+    reads a city file written by compress_city_file decompressed, with its
+    members decompressed ahead of the reader by a pool of threads
+
+    zlib, bz2 and lzma release the GIL while they decompress, so up to
+    COMPRESS_WORKERS members are decompressed on separate cores while pandas
+    parses the ones before them. Memory used is about 2 * COMPRESS_WORKERS
+    decompressed members.
+
+    """
+
+    def __init__(self, datafile, members, workers=COMPRESS_WORKERS):
+        super().__init__()
+        compression = city_file_compression(datafile)
+        offsets = members['offsets']
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self._members = _iter_ordered(self._executor, _decompress_member,
+                                      [(datafile, compression, start, end)
+                                       for start, end in zip(offsets[:-1], offsets[1:])],
+                                      2 * workers)
+        self._data = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while(len(self._data) == 0):
+            data = next(self._members, None)
+            if(data is None):
+                return 0
+            self._data = memoryview(data)
+        count = min(len(buffer), len(self._data))
+        buffer[:count] = self._data[:count]
+        self._data = self._data[count:]
+        return count
+
+    def close(self):
+        if(not self.closed):
+            self._members.close()
+            self._executor.shutdown(wait=True)
+        super().close()
+
+
+def member_index_file(datafile):
+    """
+    returns the path of the member index file for a compressed city file
+    """
+    return datafile + MEMBERS_EXT
+
+
+def read_member_index(datafile):
+    """
+    reads the member index of a compressed city file (see compress_city_file)
+
+    Returns
+    -------
+    members : DICT
+        'offsets' (LIST of INT, byte offset of each member in the file and
+        the file size -- the first member is the header line) and 'sizes'
+        (LIST of INT, decompressed bytes of each member), NONE if datafile
+        is not compressed or has no index for its current version.
+
+    """
+    if(city_file_compression(datafile) is None):
+        return None
+    try:
+        with open(member_index_file(datafile)) as f:
+            members = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if(members.get('source') != _source_signature(datafile)):
+        return None
+    return members
+
+
+def compress_city_file(datafile, compression='gzip', member_bytes=MEMBER_BYTES, workers=COMPRESS_WORKERS):
+    """
+    writes a compressed copy of a city csv file that can be decompressed in parallel
+
+    The header line and then each member_bytes of whole csv lines are
+    compressed as separate members (gzip members, bz2 or xz streams, or
+    zstandard frames), which any tool for the format reads as one file.
+    The members are compressed by a pool of threads and their offsets are
+    saved next to the compressed file (see read_member_index), so loading
+    it decompresses members in parallel (see _MemberReader) and
+    parallel_stream_stats can give members to separate processes.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the (plain) CSV file.
+    compression : STR, optional
+        'gzip', 'bz2', 'xz' or 'zstd'. The default is 'gzip'.
+    member_bytes : INT, optional
+        csv bytes in each member. The default is MEMBER_BYTES.
+    workers : INT, optional
+        Number of threads compressing members. The default is COMPRESS_WORKERS.
+
+    Returns
+    -------
+    compressed_file : STR
+        Path to the compressed file (datafile with the extension of
+        compression added).
+
+    """
+    ext = [ext for ext, name in COMPRESSION_EXTS.items() if name == compression]
+    if(not ext):
+        raise ValueError("Unknown compression '{}' (choose from {})"
+                         .format(compression, ', '.join(COMPRESSION_EXTS.values())))
+    compressed_file = datafile + ext[0]
+    offsets = [0]
+    sizes = []
+    with open(datafile, 'rb') as src, open(compressed_file + '.tmp', 'wb') as out, \
+            concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        def blocks():
+            yield (src.readline(), compression)
+            while True:
+                block = src.read(member_bytes)
+                if(not block):
+                    return
+                yield (block + src.readline(), compression)
+        for data, size in _iter_ordered(executor, _compress_block, blocks(), 2 * workers):
+            out.write(data)
+            offsets.append(offsets[-1] + len(data))
+            sizes.append(size)
+    os.replace(compressed_file + '.tmp', compressed_file)
+    with open(member_index_file(compressed_file), 'w') as f:
+        json.dump({'source': _source_signature(compressed_file), 'offsets': offsets, 'sizes': sizes}, f)
+    return compressed_file
+
+
+def _compress_block(block, compression):
+    """
+    returns a block of csv lines compressed as one member and its size
+    """
+    return _compress(block, compression), len(block)
+
+
+def compress_city_files(compression='gzip', cities=AVAILABLE_CITIES):
+    """
+    writes a compressed copy of each available city csv file (see compress_city_file)
+    """
+    for city, city_file in find_city_files(cities).items():
+        if(city_file_compression(city_file) is not None):
+            print("{} is already compressed".format(city_file))
+            continue
+        start_time = time.time()
+        compressed_file = compress_city_file(city_file, compression)
+        print('Wrote {} ({:.1f} times smaller) in {:.1f} seconds.'.format(
+            compressed_file, os.path.getsize(city_file) / os.path.getsize(compressed_file),
+            time.time() - start_time))
+
+
 def get_month_filter(months=None):
     """
     prompts the USER for a month to filter data on
@@ -180,7 +951,7 @@ def get_weekday_filter(weekdays=None):
     return wkday_filter
 
 
-def get_filters(ask_count=2):
+def get_filters(ask_count=2, load_months=True):
     """
     prompts the user for parts needed to filter the data
     
@@ -193,6 +964,10 @@ def get_filters(ask_count=2):
     ask_count : INT, optional
         The number of times to ask the user after the user does not confirm filters.
         The default is 2.
+    load_months : BOOL, optional
+        Scan the city file (if not scanned before) to offer only the months
+        in the data (see probe_city_file). If False, all months are offered
+        unless already known. The default is True.
 
     Returns
     -------
@@ -206,15 +981,17 @@ def get_filters(ask_count=2):
         city_file = get_city_file()
         if(city_file is not None):
             msg = f"We're going to look at {city_file}"
-            df = None
             try:
-                #going to pre-load the csv file
-                #to get the available months for the dataset
-                df = pd.read_csv(city_file)
-                df['Start Time'] = pd.to_datetime(df['Start Time'])
-                df['Month'] = df['Start Time'].dt.month
-                df['DoW'] = df['Start Time'].dt.dayofweek
-                months = sorted(df.Month.unique())
+                #get the available months for the dataset
+                #without loading it (saved metadata after the first scan)
+                months = None
+                cells = read_stats_index(city_file)
+                if(cells is not None):
+                    months = cells.months()
+                else:
+                    metadata = probe_city_file(city_file, scan=load_months)
+                    if(metadata is not None and metadata['months']):
+                        months = metadata['months']
                 month = get_month_filter(months)
                 wkday = get_weekday_filter()
                 if(month is not None and wkday is not None):
@@ -234,215 +1011,2606 @@ def get_filters(ask_count=2):
                 filters = (city_file, month, wkday)
             except Exception as ex:
                 print("Error getting filters for {}: {}".format(city_file, ex))
-            finally:
-                if(df is not None):
-                    del(df)
     return filters
 
 
-def load_data(datafile, month=None, dow=None):
+def read_city_data(datafile, columns=None):
     """
-    loads data from csv file into a dataframe
+    reads and parses the full csv file for a city
 
-    Reads the CSV file into a dataframe and filters based on user inputs
+    Returns the cached dataframe if the file was already parsed (and has not
+    changed since), otherwise reads the CSV file and caches the result.
+    The returned dataframe is shared with the cache and should not be modified.
+    If only some columns are asked for and the file is not cached, only
+    those columns are read (and the result is not cached).
 
     Parameters
     ----------
     datafile : STR
         Path to the CSV file to load
-    month : INT, optional
-        The month to filter the loaded data on. The default is None.
-    dow : INT, optional
-        The day of the week to filter the loaded data on. The default is None.
+    columns : LIST of STR, optional
+        Columns to read (see stage_columns). The default is None (all columns).
 
     Returns
     -------
     df : PANDAS.DATAFRAME
-        Pandas.DataFrame object containing data loaded from the CSV file and
-        filtered based on parameters
+        Pandas.DataFrame object containing all data from the CSV file
+        with the Month and DoW columns added.
 
     """
-    df_csv = pd.read_csv(datafile)
-    df_csv['Start Time'] = pd.to_datetime(df_csv['Start Time'])
-    df_csv['End Time'] = pd.to_datetime(df_csv['End Time'])
-    df_csv['Month'] = df_csv['Start Time'].dt.month
-    df_csv['DoW'] = df_csv['Start Time'].dt.dayofweek
-    df = df_csv.convert_dtypes()
-    df.drop(df.columns[0], axis=1, inplace=True)
-    if(month is None and dow is None):
-        return df
-    if(month is not None):
-        df = df[df.Month == month[0]]
-    if(dow is not None):
-        df = df[df.DoW == dow[0]]
+    df = DATASET_CACHE.get(datafile)
+    if(df is None):
+        with _CACHE_FILLS_LOCK:
+            fill = _CACHE_FILLS.get(datafile)
+        if(fill is not None and fill is not threading.current_thread()):
+            #being parsed in the background (see _fill_caches_later) -- wait for it
+            fill.join()
+            df = DATASET_CACHE.get(datafile)
+    if(df is not None):
+        return _project(df, columns)
+    if(columns is not None):
+        if(_columnar_cache_is_current(datafile)):
+            with INSTRUMENTATION.span('read_columnar_cache') as span:
+                table = feather.read_table(columnar_cache_file(datafile), memory_map=True,
+                                           columns=_project_columns(columns))
+                span['rows'] = table.num_rows
+            return table.to_pandas()
+        return parse_city_csv(datafile, columns)
+    with INSTRUMENTATION.span('read_columnar_cache') as span:
+        df = read_columnar_cache(datafile)
+        span['rows'] = None if df is None else len(df)
+    if(df is None):
+        #rows appended since the cache was built -- read only those
+        df = read_appended_columnar_cache(datafile)
+    if(df is None):
+        df = parse_city_csv(datafile)
+        with INSTRUMENTATION.span('write_columnar_cache', len(df)):
+            write_columnar_cache(datafile, df)
+    DATASET_CACHE.put(datafile, df)
     return df
-      
 
-def calc_time_stats(dataframe):
+
+def parse_city_csv(datafile, columns=None):
     """
-    calculates statistics about times of bikesharing
-    
-    Calculates time statistics:
-    Most Common Month: mode of Month column (not calculated if filtered)
-    Most Common Weekday: mode of DoW column (not calculated if filtered)
-    Most Common Hour: mode of start time's hour field
+    parses the csv file for a city into a typed dataframe
+
+    Start and End Time are parsed to datetimes, Month and DoW are added
+    from the Start Time, and the columns are converted to the compact
+    dtypes of DTYPE_PLAN. The unnamed index column is not read.
 
     Parameters
     ----------
-    dataframe : PANDAS.DATAFRAME
-        Pandas DataFrame object containing data to calculate statistics for.
+    datafile : STR
+        Path to the CSV file to load
+    columns : LIST of STR, optional
+        Columns to read (see stage_columns). The default is None (all columns).
 
     Returns
     -------
-    None.
+    df : PANDAS.DATAFRAME
+        Pandas.DataFrame object containing all data from the CSV file.
 
     """
-    if(dataframe is None):
-        return
-    print('Calculating the Most Frequent Times of Travel...\n')
-    start_time = time.time()
-    if(dataframe['Month'].unique().size > 1):
-        most_month = dataframe['Month'].mode()
-        if(most_month.size > 1):
-            #tie for most frequent month
-            month_names = []
-            mm = most_month.array
-            for i in range(mm.size):
-                name = datetime.datetime(1990, mm[i], 1).strftime('%B')
-                month_names.append(name)
-            print('Most common Months:    {}'.format(', '.join(month_names)))
-        else:
-            most_month_name = datetime.datetime(1990, most_month, 1).strftime('%B')
-            print('Most common Month:    {}'.format(most_month_name))
-    if(dataframe['DoW'].unique().size > 1):
-        most_wkday = dataframe['DoW'].mode()
-        if(most_wkday.size > 1):
-            #tie for most frequent weekday
-            wkday_names = []
-            mw = most_wkday.array
-            for i in range(mw.size):
-                name = datetime.datetime(1990, 1, mw[i] + 1).strftime('%A')
-                wkday_names.append(name)
-            print('Most common Weekdays:  {}'.format(', '.join(wkday_names)))
-        else:
-            most_wkday_name =datetime.datetime(1990, 1, most_wkday + 1).strftime('%A')
-            print('Most common Weekday:  {}'.format(most_wkday_name))
-    most_hour = dataframe['Start Time'].dt.hour.mode()
-    if(most_hour.size > 1):
-        hours = []
-        mh = most_hour.array
-        for i in range(mh.size):
-            hour = mh[i]
-            am_pm = 'AM'
-            if(mh[i] >= 12):
-                hour -= 12
-                am_pm = 'PM'
-                hours.append(f'{hour}{am_pm}')
-        print('Most common Hours:     {}'.format(', '.join(hours)))
-    else:
-        hour = most_hour.array[0]
-        am_pm = 'AM'
-        if(hour >= 12):
-            hour -= 12
-            am_pm = 'PM'
-        print('Most common Hour:     {}{}'.format(hour, am_pm))
-    print(f'\nThis took {time.time() - start_time} seconds.')
-    print('-=-'*15)
-    
-    
-def calc_station_stats(dataframe):
+    with INSTRUMENTATION.span('read_csv') as span, _csv_source(datafile) as source:
+        df_csv = pd.read_csv(source, usecols=columns or city_columns(datafile))
+        span['rows'] = len(df_csv)
+    return _prepare_city_frame(df_csv)
+
+
+def city_columns(datafile):
     """
-    calculates statistics about stations
-    
-    Calculates station statistics:
-    Most Popular Start Station(s): most used station to start a trip
-    Most Popular End Station(s): most used station to end a trip
-    Most Popular Station Pair(s): most used start-end station pairings
+    returns the data columns of a city csv file, read from its header
+    (without the unnamed index column)
+    """
+    return pd.read_csv(datafile, nrows=0).columns.tolist()[1:]
+
+
+def stage_columns(datafile, stages=None):
+    """
+    returns the columns of a city csv file needed for statistics stages
+
+    Start Time is always needed (the month and weekday filters use it).
+    Columns a city does not have (ex. Gender) are left out, as found from
+    the file header.
 
     Parameters
     ----------
-    dataframe : PANDAS.DATAFRAME
-        Pandas DataFrame object containing data to calculate statistics for.
+    datafile : STR
+        Path to the CSV file
+    stages : LIST of STR, optional
+        Statistics stages (keys of STAGE_COLUMNS). The default is None (all stages).
 
     Returns
     -------
-    None.
+    columns : LIST of STR
+        Columns to read, NONE if every column is needed.
 
     """
-    if(dataframe is None):
-        return
-    print('Calculating the Most Popular Stations...\n')
-    start_time = time.time()
-    station1 = dataframe['Start Station'].mode()
-    if(station1.size > 1):
-        s1 = station1.array
-        stations = []
-        for i in range(s1.size):
-            stations.append(s1[i])
-        print('Most frequent Start Stations: {}'.format(', '.join(stations)))
-    else:
-        print('Most frequent Start Station: {}'.format(station1.iloc[0]))
-    station2 = dataframe['End Station'].mode()
-    if(station2.size > 1):
-        s2 = station2.array
-        stations = []
-        for i in range(s2.size):
-            stations.append(s2[i])
-        print('Most Frequent End Stations: {}'.format(', '.join(stations)))
-    else:
-        print('Most Frequent End Station: {}'.format(station2.iloc[0]))
-    station_pairs = pd.DataFrame(dataframe['Start Station'])
-    station_pairs['End Station'] = dataframe['End Station']
-    station_pairs.columns = ['Start', 'End']
-    pairs = station_pairs.mode()
-    spairs = []
-    for i in range(len(pairs)):
-        spairs.append('\t{} to {}'.format(pairs.iloc[i,0], pairs.iloc[i,1]))
-    print('Most Frequent Trips:\n{}'.format('\n'.join(spairs)))
-    print(f'\nThis took {time.time() - start_time} seconds.')
-    print('-=-'*15)
-    
+    if(stages is None or set(stages) >= set(STAGE_COLUMNS)):
+        return None
+    needed = set(['Start Time'])
+    for stage in stages:
+        needed.update(STAGE_COLUMNS[stage])
+    return [col for col in city_columns(datafile) if col in needed]
+
 
-def calc_trip_stats(dataframe):
+def parse_stages(value):
     """
-    calculates statistics about the trips taken
-    
-    Calculates trip statistics:
-    Total trip duration: total time the bikes were used
-    Mean trip duration: average time of a trip
+    parses a comma separated list of statistics stages (keys of STAGE_COLUMNS),
+    NONE for 'all' (raises a ValueError for an unknown stage)
+    """
+    if(value is None or value.lower() == 'all'):
+        return None
+    stages = [v.strip().lower() for v in value.split(',') if v.strip()]
+    for stage in stages:
+        if(stage not in STAGE_COLUMNS):
+            raise ValueError("Unknown stage '{}' (expected {})".format(stage, ', '.join(STAGE_COLUMNS)))
+    return stages
+
+
+def _project_columns(columns):
+    """
+    returns the parsed columns (with Month and DoW) for the csv columns
+    """
+    return list(columns) + ['Month', 'DoW']
+
+
+def _project(df, columns):
+    """
+    returns only the columns of a parsed dataframe (and Month and DoW),
+    all of df if columns is NONE
+    """
+    if(columns is None):
+        return df
+    return df[[col for col in df.columns if col in _project_columns(columns)]]
+
+
+def _prepare_city_frame(df_csv):
+    """
+    converts the raw csv columns (without the index column) to the
+    typed columns used for the statistics
+    Start Time is only parsed if it is not already a datetime column.
+    """
+    with INSTRUMENTATION.span('parse_timestamps', len(df_csv)):
+        if(not pd.api.types.is_datetime64_any_dtype(df_csv['Start Time'])):
+            df_csv['Start Time'] = parse_timestamps(df_csv['Start Time'])
+        if('End Time' in df_csv.columns):
+            df_csv['End Time'] = parse_timestamps(df_csv['End Time'])
+        df_csv['Month'] = df_csv['Start Time'].dt.month
+        df_csv['DoW'] = df_csv['Start Time'].dt.dayofweek
+    with INSTRUMENTATION.span('apply_dtype_plan', len(df_csv)):
+        return apply_dtype_plan(df_csv, report=REPORT_MEMORY)
+
+
+def get_dtype_plan(df):
+    """
+    returns the DTYPE_PLAN entries for the columns in df
+
+    Trip Duration is planned as int32 if every duration is a whole number
+    of seconds (chicago and new york city), float32 otherwise (washington).
 
     Parameters
     ----------
-    dataframe : PANDAS.DATAFRAME
-        Pandas DataFrame object containing data to calculate statistics for.
+    df : PANDAS.DATAFRAME
+        City data with the raw csv dtypes.
 
     Returns
     -------
-    None.
+    plan : DICT of STR to STR
+        dtype for each column of df found in DTYPE_PLAN.
 
     """
-    if(dataframe is None):
-        return
-    print('Calculating Trip Duration...\n')
-    start_time = time.time()
-    total_time_span = dataframe['Trip Duration'].sum()
-    mean_time_span = dataframe['Trip Duration'].mean()
-    tt_d, tt_h, tt_m, tt_s = secs_to_full(total_time_span)
-    mt_d, mt_h, mt_m, mt_s = secs_to_full(mean_time_span)
-    time_str = '{} Days, {} Hours, {} Minutes and {} Seconds'.format(tt_d, tt_h, tt_m, tt_s)
-    print('Total time of Trip Durations: {}'.format(time_str))
-    if(mt_d > 0):
-        time_str2 = '{} Days, {} Hours, {} Minutes and {} Seconds'.format(mt_d, mt_h, mt_m, mt_s)
-    elif(mt_h > 0):
-        time_str2 = '{} Hours, {} Minutes and {} Seconds'.format(mt_h, mt_m, mt_s)
-    else:
-        time_str2 = '{} Minutes and {} Seconds'.format(mt_m, mt_s)
-    print('Mean time of Trip Durations: {}'.format(time_str2))
-    print(f'\nThis took {time.time() - start_time} seconds.')
-    print('-=-'*15)
+    plan = {col: dtype for col, dtype in DTYPE_PLAN.items() if col in df.columns}
+    if('Trip Duration' in plan):
+        durations = df['Trip Duration']
+        if(durations.notna().all() and (durations % 1 == 0).all()
+           and durations.abs().max() < 2 ** 31):
+            plan['Trip Duration'] = 'int32'
+    return plan
+
+
+def apply_dtype_plan(df, report=False):
+    """
+    converts the columns of df to the compact dtypes of the dtype plan
+
+    Parameters
+    ----------
+    df : PANDAS.DATAFRAME
+        City data with the raw csv dtypes.
+    report : BOOL, optional
+        Print the memory used by df before and after converting.
+        The default is False.
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        City data with the planned dtypes.
+
+    """
+    if(report):
+        before = df.memory_usage(deep=True).sum()
+    df = df.astype(get_dtype_plan(df))
+    if(report):
+        after = df.memory_usage(deep=True).sum()
+        print('Memory used for {} rows: {:.1f} MB (was {:.1f} MB)'
+              .format(len(df), after / 1024**2, before / 1024**2))
+    return df
+
+
+def read_filtered_data(datafile, month=None, dow=None, columns=None):
+    """
+    reads only the rows of the city data matching the month and weekday
+
+    If the columnar cache for datafile is current, the Month and DoW columns
+    are filtered before the other (memory-mapped) columns are converted.
+    Otherwise the CSV file is read in chunks of FILTER_CHUNK_ROWS rows: only
+    the Start Time column is parsed for each chunk and rows not matching the
+    filters are dropped before the other columns are converted.
+    Memory used is then based on the filtered rows, not the whole file.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file to load
+    month : TUPLE of INT and STRING, optional
+        The month to filter the loaded data on. The default is None.
+    dow : TUPLE of INT and STRING, optional
+        The day of the week to filter the loaded data on. The default is None.
+    columns : LIST of STR, optional
+        Columns to read (see stage_columns). The default is None (all columns).
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        Pandas.DataFrame object containing the matching rows.
+
+    """
+    with INSTRUMENTATION.span('read_filtered_data') as span:
+        df = _read_filtered_data(datafile, month, dow, columns)
+        span['rows'] = len(df)
+    return df
+
+
+def _read_filtered_data(datafile, month=None, dow=None, columns=None):
+    """
+    reads the rows matching the filters (see read_filtered_data)
+    """
+    if(_columnar_cache_is_current(datafile)):
+        import pyarrow.compute as pc
+        table = feather.read_table(columnar_cache_file(datafile), memory_map=True,
+                                   columns=None if columns is None else _project_columns(columns))
+        mask = None
+        if(month is not None):
+            mask = pc.equal(table['Month'], month[0])
+        if(dow is not None):
+            dow_mask = pc.equal(table['DoW'], dow[0])
+            mask = dow_mask if mask is None else pc.and_(mask, dow_mask)
+        if(mask is not None):
+            table = table.filter(mask)
+        return table.to_pandas()
+    pieces = list(_iter_filtered_chunks(datafile, month, dow, columns=columns))
+    df_csv = pd.concat(pieces, ignore_index=True)
+    return _prepare_city_frame(df_csv)
+
+
+def _iter_filtered_chunks(datafile, month=None, dow=None, chunksize=FILTER_CHUNK_ROWS, columns=None):
+    """
+    reads columns (all but the index column if NONE) of the csv file in
+    chunks of chunksize rows and yields the rows of each chunk matching the
+    filters, with only the Start Time column parsed
+    """
+    with _csv_source(datafile) as source:
+        chunks = pd.read_csv(source, usecols=columns or city_columns(datafile), chunksize=chunksize)
+        yield from _filter_chunks(chunks, month, dow)
+
+
+def _filter_chunks(chunks, month=None, dow=None):
+    """
+    yields the rows of each raw csv chunk (read without the index column)
+    matching the filters, with only the Start Time column parsed
+    """
+    fmt = None
+    for chunk in chunks:
+        if(fmt is None):
+            fmt = detect_timestamp_format(chunk['Start Time'])
+        start_times = parse_timestamps(chunk['Start Time'], fmt)
+        mask = pd.Series(True, index=chunk.index)
+        if(month is not None):
+            mask &= start_times.dt.month == month[0]
+        if(dow is not None):
+            mask &= start_times.dt.dayofweek == dow[0]
+        chunk = chunk[mask].copy()
+        chunk['Start Time'] = start_times[mask]
+        yield chunk
+
+
+def _chunk_stats(chunk):
+    """
+    calculates the statistics counts for a filtered chunk (see _filter_chunks)
+    """
+    chunk['Month'] = chunk['Start Time'].dt.month
+    chunk['DoW'] = chunk['Start Time'].dt.dayofweek
+    return compute_stats(apply_dtype_plan(chunk))
+
+
+def stream_stats(datafile, month=None, dow=None, chunksize=FILTER_CHUNK_ROWS, columns=None):
+    """
+    calculates the statistics counts for a csv file without loading all of it
+
+    The file is read chunksize rows at a time; the rows of each chunk that
+    match the filters are counted and merged into the result, so memory used
+    depends on the chunk size and the number of distinct stations (and
+    station pairs), not on the size of the file.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file
+    month : TUPLE of INT and STRING, optional
+        The month to filter the data on. The default is None.
+    dow : TUPLE of INT and STRING, optional
+        The day of the week to filter the data on. The default is None.
+    chunksize : INT, optional
+        Rows read at a time. The default is FILTER_CHUNK_ROWS.
+    columns : LIST of STR, optional
+        Columns to read (see stage_columns). The default is None (all columns).
+
+    Returns
+    -------
+    stats : TripStats
+        Counts, sums, and extremes for the matching rows (see compute_stats).
+
+    """
+    stats = TripStats()
+    with INSTRUMENTATION.span('stream_stats') as span:
+        for chunk in _iter_filtered_chunks(datafile, month, dow, chunksize, columns):
+            stats.merge(_chunk_stats(chunk))
+        span['rows'] = stats.rows
+    return stats
+
+
+def approx_stream_stats(datafile, month=None, dow=None, capacity=APPROX_CAPACITY,
+                        chunksize=FILTER_CHUNK_ROWS, columns=None):
+    """
+    calculates the statistics counts for a csv file in one pass, with the
+    station counts kept in fixed size summaries
+
+    Like stream_stats, but the start station, end station and station pair
+    counts are kept in SpaceSaving summaries of at most capacity values,
+    so memory used does not grow with the number of distinct station pairs.
+    Their counts are estimates with known error bounds (see SpaceSaving);
+    when a summary never had to drop a value its counts are exact.
+    The other counts (months, weekdays, hours, user types, genders, birth
+    years) and the trip duration sum have a small, fixed number of values
+    and are counted exactly.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file
+    month : TUPLE of INT and STRING, optional
+        The month to filter the data on. The default is None.
+    dow : TUPLE of INT and STRING, optional
+        The day of the week to filter the data on. The default is None.
+    capacity : INT, optional
+        Values kept by each summary. The default is APPROX_CAPACITY.
+    chunksize : INT, optional
+        Rows read at a time. The default is FILTER_CHUNK_ROWS.
+    columns : LIST of STR, optional
+        Columns to read (see stage_columns). The default is None (all columns).
+
+    Returns
+    -------
+    stats : TripStats
+        Counts for the matching rows, with the station counts estimated
+        and their summaries in stats.sketches.
+
+    """
+    stats = TripStats()
+    sketches = {name: SpaceSaving(capacity) for name in TripStats.SKETCHED}
+    with INSTRUMENTATION.span('approx_stream_stats') as span:
+        for chunk in _iter_filtered_chunks(datafile, month, dow, chunksize, columns):
+            chunk_stats = _chunk_stats(chunk)
+            for name, sketch in sketches.items():
+                sketch.update(getattr(chunk_stats, name))
+                setattr(chunk_stats, name, collections.Counter())
+            stats.merge(chunk_stats)
+        span['rows'] = stats.rows
+    for name, sketch in sketches.items():
+        setattr(stats, name, collections.Counter(sketch.counts))
+    stats.sketches = sketches
+    return stats
+
+
+def parallel_stream_stats(datafile, month=None, dow=None, workers=None, columns=None):
+    """
+    calculates the statistics counts for a csv file with a pool of processes
+
+    The file (after the header) is split into byte ranges of at most
+    RANGE_BYTES, each starting and ending on a line boundary. Each worker
+    process reads and counts its ranges (as stream_stats does) and the
+    partial counts are merged in file order, so the result is the same as
+    stream_stats (assumes no line breaks inside quoted csv values).
+
+    A compressed file is split between its members instead (see
+    compress_city_file); one without a member index can only be read
+    from the start and is counted by stream_stats.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file
+    month : TUPLE of INT and STRING, optional
+        The month to filter the data on. The default is None.
+    dow : TUPLE of INT and STRING, optional
+        The day of the week to filter the data on. The default is None.
+    workers : INT, optional
+        Number of worker processes. The default is None (one per CPU).
+    columns : LIST of STR, optional
+        Columns to read (see stage_columns). The default is None (all columns).
+
+    Returns
+    -------
+    stats : TripStats
+        Counts, sums, and extremes for the matching rows (see compute_stats).
+
+    """
+    workers = workers or os.cpu_count()
+    compression = city_file_compression(datafile)
+    if(compression is None):
+        ranges = _csv_byte_ranges(datafile, workers)
+    else:
+        members = read_member_index(datafile)
+        if(members is None):
+            return stream_stats(datafile, month, dow, columns=columns)
+        ranges = _member_ranges(members, workers)
+    names = pd.read_csv(datafile, nrows=0).columns.tolist()
+    stats = TripStats()
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        futures = [executor.submit(_range_stats, datafile, start, end, names, month, dow, columns, compression)
+                   for start, end in ranges]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+def _csv_byte_ranges(datafile, workers):
+    """
+    splits the rows of a csv file into (start, end) byte ranges
+    on line boundaries, at least one range per worker
+    """
+    size = os.path.getsize(datafile)
+    with open(datafile, 'rb') as f:
+        f.readline()
+        data_start = f.tell()
+        parts = max(workers, -(-(size - data_start) // RANGE_BYTES))
+        bounds = [data_start]
+        for i in range(1, parts):
+            f.seek(data_start + (size - data_start) * i // parts)
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+        bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def _member_ranges(members, workers):
+    """
+    groups the members of a compressed city file (after the header member)
+    into (start, end) byte ranges of at most RANGE_BYTES decompressed,
+    at least one range per worker (see read_member_index)
+    """
+    offsets, sizes = members['offsets'][1:], members['sizes'][1:]
+    parts = max(workers, -(-sum(sizes) // RANGE_BYTES))
+    per_part = max(1, -(-len(sizes) // parts))
+    return [(offsets[i], offsets[min(i + per_part, len(sizes))]) for i in range(0, len(sizes), per_part)]
+
+
+def _range_stats(datafile, start, end, names, month=None, dow=None, columns=None, compression=None):
+    """
+    calculates the statistics counts for the csv lines in a byte range
+    (run in the worker processes of parallel_stream_stats); names are the
+    header columns, columns the ones read (all but the index column if NONE),
+    and compression that of the whole members in the range, if any
+    """
+    if(compression is None):
+        with open(datafile, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+    else:
+        data = _decompress_member(datafile, compression, start, end)
+    chunks = pd.read_csv(io.BytesIO(data), header=None, names=names, usecols=columns or names[1:],
+                         chunksize=FILTER_CHUNK_ROWS)
+    stats = TripStats()
+    for chunk in _filter_chunks(chunks, month, dow):
+        stats.merge(_chunk_stats(chunk))
+    return stats
+
+
+def parallel_compute_stats(dataframe, workers=None):
+    """
+    calculates compute_stats for a loaded dataframe with a pool of processes
+
+    The worker processes are forked with the dataframe in memory (handed
+    to them by the pool initializer, see _share_frame, and inherited rather
+    than pickled), so each is only sent the bounds of its rows. Each counts
+    its rows into numpy arrays indexed by the category codes every row
+    shares (and by month, weekday, hour and birth year); the arrays are
+    summed and made into a TripStats once, giving the same counts as
+    compute_stats. Where processes can not be forked (Windows) or a
+    counted column is not categorical, compute_stats is used instead.
+    Calls from several threads at once are safe: each pool is given its
+    own dataframe, and no state of this process is changed.
+
+    Parameters
+    ----------
+    dataframe : PANDAS.DATAFRAME
+        Pandas DataFrame object containing data to calculate statistics for.
+    workers : INT, optional
+        Number of worker processes. The default is None (one per CPU).
+
+    Returns
+    -------
+    stats : TripStats
+        Counts, sums, and extremes for the data.
+
+    """
+    workers = workers or os.cpu_count()
+    coded = [col for col in CODED_COLUMNS if col in dataframe.columns]
+    if(workers < 2 or 'fork' not in multiprocessing.get_all_start_methods()
+       or not all(isinstance(dataframe[col].dtype, pd.CategoricalDtype) for col in coded)):
+        return compute_stats(dataframe)
+    year_low = year_count = 0
+    if('Birth Year' in dataframe.columns and dataframe['Birth Year'].notna().any()):
+        year_low = int(dataframe['Birth Year'].min())
+        year_count = int(dataframe['Birth Year'].max()) - year_low + 1
+    bounds = [len(dataframe) * i // workers for i in range(workers + 1)]
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'),
+                                                initializer=_share_frame, initargs=(dataframe,)) as executor:
+        parts = list(executor.map(_part_counts, bounds[:-1], bounds[1:],
+                                  [year_low] * workers, [year_count] * workers))
+    totals = {name: sum(part[name] for part in parts) for name in parts[0] if name != 'station_pairs'}
+    stats = TripStats(rows=len(dataframe))
+    stats.months = _counter_from_counts(totals['months'])
+    stats.weekdays = _counter_from_counts(totals['weekdays'])
+    stats.hours = _counter_from_counts(totals['hours'])
+    for col, name in CODED_COLUMNS.items():
+        if(name in totals):
+            setattr(stats, name, _counter_from_counts(totals[name], dataframe[col].cat.categories.tolist()))
+    if('start_stations' in totals):
+        starts = dataframe['Start Station'].cat.categories
+        ends = dataframe['End Station'].cat.categories
+        pairs = [part['station_pairs'] for part in parts]
+        if(len(starts) * len(ends) <= PAIR_BINCOUNT_MAX):
+            counts = sum(pairs)
+            keys = np.flatnonzero(counts)
+            counts = counts[keys]
+        else:
+            keys, inverse = np.unique(np.concatenate([part_keys for part_keys, _ in pairs]), return_inverse=True)
+            counts = np.bincount(inverse, weights=np.concatenate([part_counts for _, part_counts in pairs]))
+            counts = counts.astype(np.int64)
+        stats.station_pairs = PairCounts(keys, counts, starts, ends)
+    if('birth_years' in totals):
+        stats.birth_years = _counter_from_counts(totals['birth_years'], low=year_low)
+    if('duration_count' in totals):
+        stats.duration_count = int(totals['duration_count'])
+        stats.duration_sum = float(totals['duration_sum']) if stats.duration_count > 0 else 0.0
+    return stats
+
+
+def _share_frame(dataframe):
+    """
+    keeps the dataframe of parallel_compute_stats in a worker process
+    (the pool initializer -- with forked workers, dataframe is inherited)
+    """
+    global _SHARED_FRAME
+    _SHARED_FRAME = dataframe
+
+
+def _part_counts(start, end, year_low, year_count):
+    """
+    counts rows start to end of _SHARED_FRAME into arrays (run in the worker
+    processes of parallel_compute_stats): months, weekdays and hours indexed
+    by their value, the coded columns by category code, station pairs as a
+    dense array of pair keys (see _count_pair_keys) or (keys, counts), and
+    birth years from year_low
+    """
+    part = _SHARED_FRAME.iloc[start:end]
+    counts = {
+        'months': np.bincount(part['Month'].to_numpy(), minlength=13),
+        'weekdays': np.bincount(part['DoW'].to_numpy(), minlength=7),
+        'hours': np.bincount(_start_hours(part['Start Time']), minlength=24),
+        }
+    for col, name in CODED_COLUMNS.items():
+        if(col in part.columns):
+            codes = np.asarray(part[col].cat.codes)
+            counts[name] = np.bincount(codes[codes >= 0], minlength=len(part[col].cat.categories))
+    if('Start Station' in part.columns):
+        start_codes = np.asarray(part['Start Station'].cat.codes)
+        end_codes = np.asarray(part['End Station'].cat.codes)
+        start_count = len(part['Start Station'].cat.categories)
+        end_count = len(part['End Station'].cat.categories)
+        keys, key_counts = _count_pair_keys(start_codes, end_codes, start_count, end_count)
+        if(start_count * end_count <= PAIR_BINCOUNT_MAX):
+            dense = np.zeros(start_count * end_count, dtype=np.int64)
+            dense[keys] = key_counts
+            counts['station_pairs'] = dense
+        else:
+            counts['station_pairs'] = (keys, key_counts)
+    if('Birth Year' in part.columns):
+        years = part['Birth Year'].to_numpy(dtype=np.float64, na_value=np.nan)
+        years = years[~np.isnan(years)].astype(np.int64)
+        counts['birth_years'] = np.bincount(years - year_low, minlength=year_count)
+    if('Trip Duration' in part.columns):
+        durations = part['Trip Duration']
+        counts['duration_count'] = int(durations.count())
+        counts['duration_sum'] = float(durations.astype(np.float64).sum())
+    return counts
+
+
+def _counter_from_counts(counts, values=None, low=0):
+    """
+    returns a Counter of the non-zero counts of an array indexed by
+    value - low (or by code, for the values list)
+    """
+    index = np.flatnonzero(counts)
+    if(values is None):
+        labels = (index + low).tolist()
+    else:
+        labels = [values[i] for i in index.tolist()]
+    return collections.Counter(dict(zip(labels, counts[index].tolist())))
+
+
+def detect_timestamp_format(values):
+    """
+    detects the layout of the timestamps in a column
+
+    Tries each of TIMESTAMP_FORMATS on the first TIMESTAMP_SAMPLE_ROWS
+    (non-missing) values and picks the one matching the most values.
+
+    Parameters
+    ----------
+    values : PANDAS.SERIES
+        Timestamp strings.
+
+    Returns
+    -------
+    fmt : STR
+        strftime format matching most of the sampled values,
+        NONE if no format matched.
+
+    """
+    sample = values.dropna().head(TIMESTAMP_SAMPLE_ROWS)
+    best_fmt = None
+    best_count = 0
+    for fmt in TIMESTAMP_FORMATS:
+        count = int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+        if(count > best_count):
+            best_fmt = fmt
+            best_count = count
+    #a format has to match most of the sample to be used
+    if(best_count * 2 > sample.size):
+        return best_fmt
+    return None
+
+
+def parse_timestamps(values, fmt=None):
+    """
+    parses a column of timestamp strings
+
+    Values are parsed with a fixed format (detected if not given), which is
+    much faster than letting pandas infer the format for every value.
+    Only values that do not match the format are parsed with inference.
+    TIMESTAMP_PARSE_COUNTS keeps count of the values parsed each way.
+
+    Parameters
+    ----------
+    values : PANDAS.SERIES
+        Timestamp strings.
+    fmt : STR, optional
+        strftime format of the values. The default is None (detected).
+
+    Returns
+    -------
+    timestamps : PANDAS.SERIES
+        Parsed datetime values.
+
+    """
+    if(fmt is None):
+        fmt = detect_timestamp_format(values)
+    if(fmt is None):
+        TIMESTAMP_PARSE_COUNTS['fallback'] += int(values.notna().sum())
+        return _infer_timestamps(values)
+    timestamps = pd.to_datetime(values, format=fmt, errors='coerce')
+    failed = timestamps.isna() & values.notna()
+    fallback_count = int(failed.sum())
+    TIMESTAMP_PARSE_COUNTS['fast'] += int(values.notna().sum()) - fallback_count
+    if(fallback_count > 0):
+        TIMESTAMP_PARSE_COUNTS['fallback'] += fallback_count
+        timestamps[failed] = _infer_timestamps(values[failed])
+    return timestamps
+
+
+def _infer_timestamps(values):
+    """
+    parses timestamp strings letting pandas infer the format,
+    value by value if the values do not share one format
+    """
+    try:
+        return pd.to_datetime(values)
+    except ValueError:
+        return values.map(pd.Timestamp, na_action='ignore').astype('datetime64[ns]')
+
+
+def columnar_cache_file(datafile):
+    """
+    returns the path of the columnar (feather) cache file for datafile
+    """
+    return datafile + COLUMNAR_CACHE_EXT
+
+
+def _source_signature(datafile):
+    """
+    returns the modification time and size of datafile, used to check
+    whether a cache built from the file is still current
+    """
+    stat = os.stat(datafile)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def _source_tail(datafile, size):
+    """
+    returns the last APPEND_CHECK_BYTES bytes of datafile before size (hex)
+    """
+    with open(datafile, 'rb') as f:
+        f.seek(max(0, size - APPEND_CHECK_BYTES))
+        return f.read(size - f.tell()).hex()
+
+
+def appended_offset(datafile, source, tail):
+    """
+    checks whether rows were only appended to datafile since a cache was built
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file
+    source : DICT
+        Signature of datafile the cache was built from (see _source_signature).
+    tail : STR
+        End of datafile the cache was built from (see _source_tail).
+
+    Returns
+    -------
+    offset : INT
+        Byte offset of the first appended row, NONE if the file was not
+        only appended to (or was not changed).
+
+    """
+    if(source is None or not tail or not tail.endswith('0a')):
+        #the cached version must end with a whole line
+        return None
+    if(city_file_compression(datafile) is not None):
+        #rows can not be read from an offset of a compressed file
+        return None
+    size = source['size']
+    if(os.path.getsize(datafile) <= size or _source_tail(datafile, size) != tail):
+        return None
+    return size
+
+
+def _iter_appended_chunks(datafile, offset, size, chunksize=FILTER_CHUNK_ROWS):
+    """
+    reads the rows of datafile between the byte offsets offset and size in
+    chunks, yielding them as _filter_chunks does
+    """
+    names = pd.read_csv(datafile, nrows=0).columns.tolist()
+    with open(datafile, 'rb') as f:
+        f.seek(offset)
+        data = f.read(size - offset)
+    chunks = pd.read_csv(io.BytesIO(data), header=None, names=names, usecols=names[1:], chunksize=chunksize)
+    return _filter_chunks(chunks)
+
+
+def read_columnar_cache(datafile):
+    """
+    reads the parsed data for datafile from its columnar cache file
+
+    The cache file is memory-mapped. It is only used if it was built from the
+    current version (modification time and size) of datafile.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file the cache was built from
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        Pandas.DataFrame object containing the cached data,
+        NONE if pyarrow is not installed or there is no current cache file.
+
+    """
+    if(not _columnar_cache_is_current(datafile)):
+        return None
+    try:
+        table = feather.read_table(columnar_cache_file(datafile), memory_map=True)
+        return table.to_pandas()
+    except (pa.ArrowException, OSError):
+        #unreadable cache -- it will be rebuilt from the csv file
+        return None
+
+
+def _columnar_cache_is_current(datafile):
+    """
+    checks that pyarrow is available and the columnar cache file for datafile
+    was built from the current version (modification time and size) of datafile
+    """
+    metadata = _columnar_cache_metadata(datafile)
+    if(metadata is None or b'bikeshare_source' not in metadata):
+        return False
+    return json.loads(metadata[b'bikeshare_source']) == _source_signature(datafile)
+
+
+def _columnar_cache_metadata(datafile):
+    """
+    returns the schema metadata of the columnar cache file for datafile,
+    NONE if pyarrow is not installed or there is no readable cache file
+    """
+    cache_file = columnar_cache_file(datafile)
+    if(not pyarrow_available() or not os.path.exists(cache_file)):
+        return None
+    try:
+        with pa.memory_map(cache_file) as source:
+            return pa.ipc.open_file(source).schema.metadata or {}
+    except (pa.ArrowException, OSError):
+        return None
+
+
+def read_appended_columnar_cache(datafile):
+    """
+    reads the parsed data for datafile from a columnar cache file built
+    before rows were appended to datafile
+
+    Only the appended rows are read from the csv file; they are added to the
+    cached data and the cache file is rewritten.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file the cache was built from
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        Pandas.DataFrame object containing all data from the CSV file,
+        NONE if there is no cache file or datafile was not only appended to.
+
+    """
+    metadata = _columnar_cache_metadata(datafile)
+    if(metadata is None or b'bikeshare_source' not in metadata or b'bikeshare_tail' not in metadata):
+        return None
+    signature = _source_signature(datafile)
+    offset = appended_offset(datafile, json.loads(metadata[b'bikeshare_source']),
+                             metadata[b'bikeshare_tail'].decode())
+    if(offset is None):
+        return None
+    try:
+        df = feather.read_table(columnar_cache_file(datafile), memory_map=True).to_pandas()
+    except (pa.ArrowException, OSError):
+        return None
+    with INSTRUMENTATION.span('read appended rows') as span:
+        rows = _prepare_city_frame(pd.concat(list(_iter_appended_chunks(datafile, offset, signature['size'])),
+                                             ignore_index=True))
+        span['rows'] = len(rows)
+    df = _append_rows(df, rows)
+    write_columnar_cache(datafile, df, signature)
+    return df
+
+
+def _append_rows(df, rows):
+    """
+    returns the rows of df followed by rows (parsed the same way), keeping
+    the categorical columns of df categorical (new values are added as
+    categories, existing codes are unchanged) and the other columns in
+    the dtypes planned for all the rows (see get_dtype_plan)
+    """
+    head = {}
+    tail = {}
+    for column in df.columns:
+        values = df[column]
+        appended = rows[column]
+        if(isinstance(values.dtype, pd.CategoricalDtype)):
+            new_values = pd.Index(appended.dropna().unique()).difference(values.cat.categories)
+            values = values.cat.add_categories(new_values)
+            appended = appended.astype(values.dtype)
+        head[column] = values
+        tail[column] = appended
+    df = pd.concat([pd.DataFrame(head), pd.DataFrame(tail)], ignore_index=True)
+    #the other columns are planned again from all the rows, as for a new
+    #cache (ex. int32 and float32 Trip Durations are float32, not float64)
+    plan = {column: dtype for column, dtype in get_dtype_plan(df).items() if dtype != 'category'}
+    return df.astype(plan)
+
+
+def write_columnar_cache(datafile, df, source=None):
+    """
+    writes the parsed data for datafile to its columnar cache file
+
+    The file is written uncompressed so it can be memory-mapped, and records
+    the modification time and size of datafile it was built from.
+    Nothing is written if pyarrow is not installed or the file cannot be written.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file df was parsed from
+    df : PANDAS.DATAFRAME
+        Parsed data (see parse_city_csv)
+    source : DICT, optional
+        Signature of datafile df was parsed from (see _source_signature).
+        The default is None (the current signature).
+
+    Returns
+    -------
+    cache_file : STR
+        Path to the cache file, NONE if it was not written.
+
+    """
+    if(not pyarrow_available()):
+        return None
+    source = source or _source_signature(datafile)
+    cache_file = columnar_cache_file(datafile)
+    tmp_file = cache_file + '.tmp'
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'bikeshare_source'] = json.dumps(source).encode()
+        metadata[b'bikeshare_tail'] = _source_tail(datafile, source['size']).encode()
+        table = table.replace_schema_metadata(metadata)
+        feather.write_feather(table, tmp_file, compression='uncompressed')
+        os.replace(tmp_file, cache_file)
+    except (pa.ArrowException, OSError) as ex:
+        print("Could not write cache for {}: {}".format(datafile, ex))
+        return None
+    return cache_file
+
+
+def build_columnar_caches(cities=AVAILABLE_CITIES):
+    """
+    builds (or rebuilds) the columnar cache file for each available city
+
+    Parameters
+    ----------
+    cities : LIST of STR, optional
+        City names to build the cache for. The default is AVAILABLE_CITIES.
+
+    Returns
+    -------
+    None.
+
+    """
+    if(not pyarrow_available()):
+        print("ERROR: pyarrow is required to build the cache files")
+        return
+    for city in cities:
+        city_file = find_city_file(city)
+        if(city_file is None):
+            print("No data for city '{}'".format(city.title()))
+            continue
+        start_time = time.time()
+        cache_file = write_columnar_cache(city_file, parse_city_csv(city_file))
+        if(cache_file is not None):
+            print(f'Built {cache_file} in {time.time() - start_time} seconds.')
+
+
+def load_data(datafile, month=None, dow=None, columns=None):
+    """
+    loads data from csv file into a dataframe
+
+    Reads the CSV file into a dataframe and filters based on user inputs.
+    Uses the cached dataset if the city was already loaded. Otherwise, with
+    a month or weekday filter, only the matching rows are read (see
+    read_filtered_data), and the whole city is parsed afterwards in the
+    background to fill the caches (see _fill_caches_later).
+    The filtered rows are numbered from 0 either way.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file to load
+    month : INT, optional
+        The month to filter the loaded data on. The default is None.
+    dow : INT, optional
+        The day of the week to filter the loaded data on. The default is None.
+    columns : LIST of STR, optional
+        Columns to load (see stage_columns). The default is None (all columns).
+
+    Returns
+    -------
+    df : PANDAS.DATAFRAME
+        Pandas.DataFrame object containing data loaded from the CSV file and
+        filtered based on parameters
+
+    """
+    with INSTRUMENTATION.span('load_data') as span:
+        df = DATASET_CACHE.get(datafile)
+        if(df is None and (month is not None or dow is not None)):
+            #the full dataset is not needed -- filter while reading
+            df = read_filtered_data(datafile, month, dow, columns)
+            span['rows'] = len(df)
+            if(FILL_CACHES_LATER):
+                _fill_caches_later(datafile)
+            return df
+        if(df is None):
+            df = read_city_data(datafile, columns)
+        else:
+            df = _project(df, columns)
+        if(month is not None or dow is not None):
+            with INSTRUMENTATION.span('filter', len(df)):
+                if(month is not None):
+                    df = df[df.Month == month[0]]
+                if(dow is not None):
+                    df = df[df.DoW == dow[0]]
+                #numbered as the rows read by read_filtered_data are
+                df = df.reset_index(drop=True)
+        span['rows'] = len(df)
+        return df
+
+
+def _fill_caches_later(datafile):
+    """
+    parses the whole city data of datafile in a background thread, filling
+    the dataset and columnar caches (see read_city_data), if it is expected
+    to fit in the dataset cache and is not being parsed already
+
+    Returns the thread, NONE if none was started.
+    """
+    if(not _fits_dataset_cache(datafile)):
+        return None
+    with _CACHE_FILLS_LOCK:
+        if(datafile in _CACHE_FILLS):
+            return None
+
+        def fill():
+            try:
+                #the stages of the parse are timed as part of this one
+                with INSTRUMENTATION.span('fill caches'):
+                    read_city_data(datafile)
+            finally:
+                with _CACHE_FILLS_LOCK:
+                    del(_CACHE_FILLS[datafile])
+
+        #a daemon thread -- exiting does not wait for it (the caches are
+        #written to temporary files first)
+        thread = threading.Thread(target=fill, name='fill caches', daemon=True)
+        _CACHE_FILLS[datafile] = thread
+        thread.start()
+    return thread
+
+
+def _fits_dataset_cache(datafile):
+    """
+    returns True if the csv text of datafile fits in the dataset cache
+    budget (read_csv holds the raw text columns before they are converted),
+    found from the member index of a compressed file -- a compressed file
+    without one is assumed not to fit
+    """
+    if(city_file_compression(datafile) is None):
+        return os.path.getsize(datafile) <= DATASET_CACHE.max_bytes
+    members = read_member_index(datafile)
+    return members is not None and sum(members['sizes']) <= DATASET_CACHE.max_bytes
+
+
+def find_city_files(cities=AVAILABLE_CITIES):
+    """
+    returns the data file of each city (see find_city_file) by city name,
+    printing a message for each city without data
+    """
+    city_files = collections.OrderedDict()
+    for city in cities:
+        city_file = find_city_file(city)
+        if(city_file is None):
+            print("No data for city '{}'".format(city.title()))
+        else:
+            city_files[city] = city_file
+    return city_files
+
+
+def iter_city_data(cities=AVAILABLE_CITIES, month=None, dow=None, max_concurrency=LOAD_CONCURRENCY, stages=None):
+    """
+    loads several cities concurrently, yielding each as soon as it is loaded
+
+    Each city is loaded with load_data in a thread pool of max_concurrency
+    threads (reading and parsing the csv files overlap), so the statistics
+    of the first city loaded can be calculated while the others are still
+    loading (see run_batch). Closing the generator (ex. breaking out of the
+    loop) cancels the cities not yet started; an error loading a city is
+    raised when it is reached.
+
+    Parameters
+    ----------
+    cities : LIST of STR, optional
+        City names to load. The default is AVAILABLE_CITIES.
+    month : TUPLE of INT and STRING, optional
+        The month to filter the data on. The default is None.
+    dow : TUPLE of INT and STRING, optional
+        The day of the week to filter the data on. The default is None.
+    max_concurrency : INT, optional
+        Number of cities loaded at the same time. The default is LOAD_CONCURRENCY.
+    stages : LIST of STR, optional
+        Only load the columns needed for these statistics stages (see
+        stage_columns). The default is None (all columns).
+
+    Yields
+    ------
+    city : STR
+        Name of the city.
+    df : PANDAS.DATAFRAME
+        Data for the city (see load_data).
+
+    """
+    return _iter_completed(_load_city_stages, find_city_files(cities), max_concurrency, month, dow, stages)
+
+
+def _load_city_stages(city_file, month=None, dow=None, stages=None):
+    """
+    loads the columns of city_file needed for stages (see load_data)
+    """
+    return load_data(city_file, month, dow, stage_columns(city_file, stages))
+
+
+def _iter_completed(func, city_files, max_concurrency, *args):
+    """
+    calls func(city_file, *args) for each city in a thread pool, yielding
+    (city, result) in the order they finish
+    """
+    executor = concurrent.futures.ThreadPoolExecutor(max(1, max_concurrency))
+    futures = {executor.submit(func, city_file, *args): city for city, city_file in city_files.items()}
+    try:
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.result()
+    finally:
+        #stopped early (or a city failed) -- do not start the remaining cities
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class TimeIndexedView:
+    """
+    city data ordered by Start Time, answering date range, month, weekday
+    and hour filters without scanning the whole dataframe
+
+    The rows are sorted by Start Time once (no copy if they already are),
+    so a date range is found with a binary search (searchsorted) and
+    returned as a slice of the sorted dataframe -- no rows are copied.
+    Month, weekday and hour filters are answered from row positions grouped
+    by (month, weekday, hour), found the first time they are needed.
+
+    """
+
+    def __init__(self, dataframe):
+        start_times = dataframe['Start Time']
+        self._copied = not start_times.is_monotonic_increasing
+        if(self._copied):
+            #stable, so rows with the same Start Time keep their file order
+            order = np.argsort(np.asarray(start_times, dtype='datetime64[ns]').view(np.int64), kind='stable')
+            dataframe = dataframe.take(order)
+        #rows are selected by position, the index is left as it is
+        self.df = dataframe
+        self._times = np.asarray(self.df['Start Time'], dtype='datetime64[ns]')
+        #row positions ordered by (month, weekday, hour) key, and the
+        #start of each key's positions (see _group_positions)
+        self._group_rows = None
+        self._group_starts = None
+
+    def nbytes(self):
+        """
+        returns the memory (bytes) used by the view, besides the dataframe
+        it was made from (its sorted copy, if the rows were not in order)
+        """
+        if(not self._copied):
+            return 0
+        return int(self.df.memory_usage(deep=True).sum())
+
+    def _bounds(self, start=None, end=None):
+        """
+        returns the first and last (exclusive) row of start <= Start Time < end
+        """
+        low = 0 if start is None else int(np.searchsorted(self._times, np.datetime64(pd.Timestamp(start)), 'left'))
+        high = len(self._times) if end is None else int(np.searchsorted(self._times, np.datetime64(pd.Timestamp(end)), 'left'))
+        return low, max(low, high)
+
+    def date_range(self, start=None, end=None):
+        """
+        returns the rows with start <= Start Time < end as a slice of the
+        sorted dataframe (no rows are copied)
+
+        Parameters
+        ----------
+        start : STR or DATETIME, optional
+            Earliest Start Time. The default is None (from the first row).
+        end : STR or DATETIME, optional
+            Start Time to stop before. The default is None (to the last row).
+
+        Returns
+        -------
+        df : PANDAS.DATAFRAME
+            The rows in the range.
+
+        """
+        low, high = self._bounds(start, end)
+        return self.df.iloc[low:high]
+
+    def select(self, start=None, end=None, months=None, weekdays=None, hours=None):
+        """
+        returns the rows in a date range matching month, weekday and hour filters
+
+        Only the date range is needed (see date_range) if there are no other
+        filters. Otherwise the row positions of each matching (month, weekday,
+        hour) group within the range are found with binary searches and only
+        those rows are copied.
+
+        Parameters
+        ----------
+        start : STR or DATETIME, optional
+            Earliest Start Time. The default is None.
+        end : STR or DATETIME, optional
+            Start Time to stop before. The default is None.
+        months : LIST of INT, optional
+            Months to keep (1 = January). The default is None (all).
+        weekdays : LIST of INT, optional
+            Weekdays to keep (0 = Monday). The default is None (all).
+        hours : LIST of INT, optional
+            Start hours to keep (0 to 23). The default is None (all).
+
+        Returns
+        -------
+        df : PANDAS.DATAFRAME
+            The matching rows, in Start Time order.
+
+        """
+        if(months is None and weekdays is None and hours is None):
+            return self.date_range(start, end)
+        low, high = self._bounds(start, end)
+        group_rows, group_starts = self._group_positions()
+        pieces = []
+        for month in (range(1, 13) if months is None else months):
+            for dow in (range(7) if weekdays is None else weekdays):
+                for hour in (range(24) if hours is None else hours):
+                    key = _time_group_key(month, dow, hour)
+                    rows = group_rows[group_starts[key]:group_starts[key + 1]]
+                    #positions of a group are in row order -- keep those in the range
+                    pieces.append(rows[np.searchsorted(rows, low):np.searchsorted(rows, high)])
+        rows = np.sort(np.concatenate(pieces)) if pieces else np.array([], dtype=np.int64)
+        return self.df.take(rows)
+
+    def _group_positions(self):
+        """
+        returns the row positions ordered by (month, weekday, hour) group
+        and the start of each group's positions (found on first use)
+        """
+        if(self._group_rows is None):
+            start_times = self.df['Start Time']
+            keys = _time_group_key(start_times.dt.month.to_numpy(dtype=np.float64, na_value=np.nan),
+                                   start_times.dt.dayofweek.to_numpy(dtype=np.float64, na_value=np.nan),
+                                   start_times.dt.hour.to_numpy(dtype=np.float64, na_value=np.nan))
+            #rows without a Start Time are put after every group
+            keys = np.where(np.isnan(keys), TIME_GROUP_COUNT, keys).astype(np.int64)
+            self._group_rows = np.argsort(keys, kind='stable')
+            self._group_starts = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=TIME_GROUP_COUNT + 1))])
+        return self._group_rows, self._group_starts
+
+
+def _time_group_key(month, dow, hour):
+    """
+    returns the (month, weekday, hour) group number used by TimeIndexedView
+    """
+    return ((month - 1) * 7 + dow) * 24 + hour
+
+
+def city_view(datafile):
+    """
+    returns the TimeIndexedView of a city's full data, kept with the parsed
+    data in DATASET_CACHE (and dropped with it)
+    """
+    return DATASET_CACHE.view(datafile, read_city_data(datafile), TimeIndexedView)
+
+
+@dataclasses.dataclass
+class TripStats:
+    """
+    counts, sums and extremes the bikeshare statistics are calculated from
+
+    Every field can be added up across parts of the data, so statistics for
+    a whole dataset can be found by merging the TripStats of its parts
+    (see merge). The most common values (modes) are found from the counts.
+    genders and birth_years are NONE when the data has no such column.
+
+    sketches holds the SpaceSaving summary of each field in SKETCHED when
+    those counts are estimates (see approx_stream_stats), NONE otherwise.
+
+    """
+    #fields counted with SpaceSaving summaries by approx_stream_stats
+    SKETCHED = ('start_stations', 'end_stations', 'station_pairs')
+
+    rows: int = 0
+    months: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    weekdays: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    hours: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    start_stations: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    end_stations: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    #keyed by (start station, end station) -- a PairCounts from compute_stats
+    station_pairs: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    user_types: collections.Counter = dataclasses.field(default_factory=collections.Counter)
+    genders: collections.Counter = None
+    birth_years: collections.Counter = None
+    duration_sum: float = 0.0
+    duration_count: int = 0
+    sketches: dict = None
+
+    def merge(self, other):
+        """
+        adds the counts of other to these stats and returns these stats
+        """
+        self.rows += other.rows
+        for name in ['months', 'weekdays', 'hours', 'start_stations', 'end_stations',
+                     'station_pairs', 'user_types', 'genders', 'birth_years']:
+            counts = getattr(other, name)
+            if(counts is None):
+                continue
+            if(isinstance(counts, PairCounts)):
+                counts = counts.to_counter()
+            mine = getattr(self, name)
+            if(mine is None):
+                setattr(self, name, collections.Counter())
+            elif(isinstance(mine, PairCounts)):
+                setattr(self, name, mine.to_counter())
+            getattr(self, name).update(counts)
+        self.duration_sum += other.duration_sum
+        self.duration_count += other.duration_count
+        return self
+
+    def mean_duration(self):
+        """
+        returns the mean trip duration, NONE if there are no trips
+        """
+        if(self.duration_count == 0):
+            return None
+        return self.duration_sum / self.duration_count
+
+    def time_stats(self):
+        """
+        returns the time statistics (see calc_time_stats)
+        """
+        return TimeStats(
+            months=most_common(self.months) if len(self.months) > 1 else None,
+            weekdays=most_common(self.weekdays) if len(self.weekdays) > 1 else None,
+            hours=most_common(self.hours))
+
+    def station_stats(self):
+        """
+        returns the station statistics (see calc_station_stats)
+        """
+        return StationStats(
+            start_stations=most_common(self.start_stations),
+            end_stations=most_common(self.end_stations),
+            trips=most_common(self.station_pairs),
+            top_trips=self.top_trips())
+
+    def top_trips(self, n=TOP_TRIPS, start_station=None):
+        """
+        returns the n most common trips as (start station, end station, count),
+        most common first (ties in station order)
+
+        If start_station is given, only trips from it are ranked
+        (its most common destinations). Raises a ValueError if n is below 1.
+        """
+        if(n < 1):
+            raise ValueError("Invalid n '{}' (must be at least 1)".format(n))
+        if(isinstance(self.station_pairs, PairCounts)):
+            return self.station_pairs.top(n, start_station)
+        pairs = self.station_pairs.items()
+        if(start_station is not None):
+            pairs = ((pair, count) for pair, count in pairs if pair[0] == start_station)
+        return [(start, end, count) for (start, end), count
+                in heapq.nsmallest(n, pairs, key=lambda item: (-item[1], item[0]))]
+
+    def trip_stats(self):
+        """
+        returns the trip duration statistics (see calc_trip_stats)
+        """
+        return TripDurationStats(
+            trips=self.duration_count,
+            total_seconds=self.duration_sum,
+            mean_seconds=self.mean_duration())
+
+    def user_stats(self):
+        """
+        returns the user statistics (see calc_user_stats)
+        """
+        result = UserStats(user_types=dict(self.user_types.most_common()))
+        if(self.genders is not None):
+            result.genders = dict(self.genders.most_common())
+        if(self.birth_years):
+            result.min_birth_year = min(self.birth_years)
+            result.max_birth_year = max(self.birth_years)
+            result.birth_years = most_common(self.birth_years)
+        return result
+
+
+class SpaceSaving:
+    """
+    Space-Saving summary of the most frequent values of a stream
+
+    At most capacity values are kept with a count. A value not kept that
+    shows up is added with the smallest count that was dropped (floor)
+    plus its own count, so a kept count is never too low and is too high
+    by at most its error; a value not kept was seen at most floor times.
+    The bounds are certain (not a confidence level). While no value has
+    been dropped (floor is 0) every count is exact.
+
+    Values are added in batches of counts (one chunk of the data at a time),
+    keeping the summary a fixed size between batches.
+
+    """
+
+    def __init__(self, capacity=APPROX_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+
+    def update(self, counts):
+        """
+        adds a batch of counts (value -> count) to the summary
+        """
+        for value, count in counts.items():
+            if(value in self.counts):
+                self.counts[value] += count
+            else:
+                self.counts[value] = self.floor + count
+                self.errors[value] = self.floor
+        if(len(self.counts) > self.capacity):
+            #values tied with the (capacity + 1)th largest count are dropped too
+            counts = np.fromiter(self.counts.values(), dtype=np.int64, count=len(self.counts))
+            dropped = int(-np.partition(-counts, self.capacity)[self.capacity])
+            self.floor = max(self.floor, dropped)
+            self.counts = {value: count for value, count in self.counts.items() if count > dropped}
+            self.errors = {value: self.errors[value] for value in self.counts}
+        return self
+
+    @property
+    def exact(self):
+        """
+        TRUE if every count is exact (no value was dropped)
+        """
+        return self.floor == 0
+
+    def bounds(self, value):
+        """
+        returns the (lowest, highest) number of times value may have been seen
+        """
+        if(value in self.counts):
+            return self.counts[value] - self.errors[value], self.counts[value]
+        return 0, self.floor
+
+    def proves_top(self, values):
+        """
+        returns TRUE if each of values was certainly seen at least as many
+        times as any other value
+        """
+        if(self.exact):
+            return True
+        values = set(values)
+        lowest = min(self.bounds(value)[0] for value in values)
+        others = [count for value, count in self.counts.items() if value not in values]
+        return lowest >= max(others + [self.floor])
+
+
+@dataclasses.dataclass
+class TimeStats:
+    """
+    most common month(s), weekday(s) (NONE when filtered to one)
+    and start hour(s) of the trips
+    """
+    months: list = None
+    weekdays: list = None
+    hours: list = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class StationStats:
+    """
+    most common start station(s), end station(s), and (start, end) trip(s),
+    and the TOP_TRIPS most common trips with their counts
+    """
+    start_stations: list = dataclasses.field(default_factory=list)
+    end_stations: list = dataclasses.field(default_factory=list)
+    trips: list = dataclasses.field(default_factory=list)
+    top_trips: list = dataclasses.field(default_factory=list)
+
+
+@dataclasses.dataclass
+class TripDurationStats:
+    """
+    number of trips with a duration, and total and mean duration (seconds)
+    """
+    trips: int = 0
+    total_seconds: float = 0.0
+    mean_seconds: float = None
+
+
+@dataclasses.dataclass
+class UserStats:
+    """
+    count of each user type and gender (most common first), and the
+    min, max, and most common birth year(s)
+    genders and birth years are NONE when not in the data
+    """
+    user_types: dict = dataclasses.field(default_factory=dict)
+    genders: dict = None
+    min_birth_year: int = None
+    max_birth_year: int = None
+    birth_years: list = None
+
+
+def compute_stats(dataframe):
+    """
+    calculates the counts needed for all statistics of the dataframe
+
+    Each column is counted once with a vectorized pass over its
+    (categorical or factorized) integer codes, and the station pairs are
+    counted from a single integer key combining the two station codes.
+
+    Parameters
+    ----------
+    dataframe : PANDAS.DATAFRAME
+        Pandas DataFrame object containing data to calculate statistics for.
+
+    Returns
+    -------
+    stats : TripStats
+        Counts, sums, and extremes for the data.
+
+    """
+    stats = TripStats(rows=len(dataframe))
+    stats.months = _count_values(dataframe['Month'])
+    stats.weekdays = _count_values(dataframe['DoW'])
+    stats.hours = _count_hours(dataframe['Start Time'])
+    #columns not loaded (see stage_columns) are not counted
+    if('Start Station' in dataframe.columns):
+        stats.start_stations = _count_values(dataframe['Start Station'])
+        stats.end_stations = _count_values(dataframe['End Station'])
+        stats.station_pairs = _count_pairs(dataframe['Start Station'], dataframe['End Station'])
+    if('User Type' in dataframe.columns):
+        stats.user_types = _count_values(dataframe['User Type'])
+    if('Gender' in dataframe.columns):
+        stats.genders = _count_values(dataframe['Gender'])
+    if('Birth Year' in dataframe.columns):
+        stats.birth_years = _count_values(dataframe['Birth Year'])
+    if('Trip Duration' in dataframe.columns):
+        durations = dataframe['Trip Duration']
+        stats.duration_count = int(durations.count())
+        if(stats.duration_count > 0):
+            #float32 durations are summed as float64 to keep the total exact
+            stats.duration_sum = float(durations.astype(np.float64).sum())
+    return stats
+
+
+def _codes(series):
+    """
+    returns integer codes (-1 for missing values) and the value for each code
+    """
+    if(isinstance(series.dtype, pd.CategoricalDtype)):
+        return np.asarray(series.cat.codes), series.cat.categories
+    codes, uniques = pd.factorize(series)
+    return codes, uniques
+
+
+def _count_values(series):
+    """
+    counts each (non-missing) value of series
+    """
+    if(pd.api.types.is_integer_dtype(series.dtype)
+       and not isinstance(series.dtype, pd.CategoricalDtype)):
+        if(series.hasnans):
+            #nullable integers (Birth Year)
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            return _count_ints(values[~np.isnan(values)].astype(np.int64))
+        return _count_ints(series.to_numpy(dtype=np.int64))
+    codes, uniques = _codes(series)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    return collections.Counter({value: int(count) for value, count
+                                in zip(uniques.tolist(), counts.tolist()) if count > 0})
+
+
+def _count_ints(values):
+    """
+    counts each value of an integer array (months, weekdays, hours, years)
+    with a dense count from the smallest to the largest value
+    """
+    if(values.size == 0):
+        return collections.Counter()
+    low = int(values.min())
+    counts = np.bincount(values - low)
+    return collections.Counter({low + i: int(counts[i]) for i in np.flatnonzero(counts).tolist()})
+
+
+def _count_hours(start_times):
+    """
+    counts the trips starting in each hour of the day
+    """
+    return _count_ints(_start_hours(start_times))
+
+
+def _start_hours(start_times):
+    """
+    returns the hour of each (non-missing) start time as an integer array
+    """
+    if(start_times.hasnans):
+        start_times = start_times.dropna()
+    nanoseconds = np.asarray(start_times, dtype='datetime64[ns]').view(np.int64)
+    return nanoseconds // (3600 * 10**9) % 24
+
+
+def _count_pairs(start, end):
+    """
+    counts each (start, end) pair of values, skipping pairs with a missing value
+    """
+    start_codes, start_values = _codes(start)
+    end_codes, end_values = _codes(end)
+    keys, counts = _count_pair_keys(start_codes, end_codes, len(start_values), len(end_values))
+    return PairCounts(keys, counts, start_values, end_values)
+
+
+class PairCounts(collections.abc.Mapping):
+    """
+    counts of (start station, end station) pairs kept as numpy arrays
+
+    A read-only mapping of (start, end) to count standing in for a Counter.
+    The pairs are kept as int64 keys (start code * number of end values +
+    end code, see _count_pair_keys) with their counts, and only the pairs
+    ranked (see modes and top) are turned back into station names -- all
+    of them are only named, once, if the mapping is read item by item.
+
+    """
+
+    def __init__(self, keys, counts, start_values, end_values):
+        self.keys = np.asarray(keys, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.start_values = np.asarray(start_values, dtype=object)
+        self.end_values = np.asarray(end_values, dtype=object)
+        self._pairs = None
+
+    def _names(self, keys):
+        """
+        returns the (start, end) station names of keys
+        """
+        return list(zip(self.start_values[keys // len(self.end_values)].tolist(),
+                        self.end_values[keys % len(self.end_values)].tolist()))
+
+    def _dict(self):
+        if(self._pairs is None):
+            self._pairs = dict(zip(self._names(self.keys), self.counts.tolist()))
+        return self._pairs
+
+    def __getitem__(self, pair):
+        return self._dict()[pair]
+
+    def __iter__(self):
+        return iter(self._dict())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def items(self):
+        return self._dict().items()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pairs'] = None
+        return state
+
+    def to_counter(self):
+        """
+        returns the counts as a (new) Counter
+        """
+        return collections.Counter(self._dict())
+
+    def modes(self):
+        """
+        returns the most common pair(s), sorted (see most_common)
+        """
+        if(len(self.counts) == 0):
+            return []
+        return sorted(self._names(self.keys[self.counts == self.counts.max()]))
+
+    def top(self, n=TOP_TRIPS, start_station=None):
+        """
+        returns the n most common pairs as (start station, end station, count)
+        (see TripStats.top_trips)
+        """
+        keys, counts = self.keys, self.counts
+        if(start_station is not None):
+            code = pd.Index(self.start_values).get_indexer([start_station])[0]
+            keep = keys // len(self.end_values) == code
+            keys, counts = keys[keep], counts[keep]
+        return _rank_pair_keys(keys, counts, self.start_values, self.end_values, n)
+
+
+def _count_pair_keys(start_codes, end_codes, start_count, end_count):
+    """
+    counts the (start code, end code) pairs as single int64 keys
+    (start code * end_count + end code), skipping missing (-1) codes
+
+    Returns the distinct keys (sorted) and their counts.
+    """
+    valid = (start_codes >= 0) & (end_codes >= 0)
+    keys = start_codes[valid].astype(np.int64) * end_count + end_codes[valid]
+    if(start_count * end_count <= PAIR_BINCOUNT_MAX):
+        counts = np.bincount(keys, minlength=start_count * end_count)
+        keys = np.flatnonzero(counts)
+        return keys, counts[keys]
+    return np.unique(keys, return_counts=True)
+
+
+def rank_station_pairs(start, end, n=TOP_TRIPS, start_station=None):
+    """
+    ranks the (start, end) station pairs of two station columns by count
+
+    The stations are counted by their integer codes combined into a single
+    int64 key (see _count_pair_keys), and only the top n keys are turned
+    back into station names -- no copy of the columns is made, and memory
+    used is O(distinct pairs).
+
+    Parameters
+    ----------
+    start : PANDAS.SERIES
+        Start Station column.
+    end : PANDAS.SERIES
+        End Station column.
+    n : INT, optional
+        Number of pairs returned, at least 1. The default is TOP_TRIPS.
+    start_station : STR, optional
+        Only rank the trips from this station (its most common destinations).
+        The default is None (all trips).
+
+    Returns
+    -------
+    trips : LIST of TUPLE
+        (start station, end station, count) of the n most common pairs,
+        most common first (ties in station order).
+
+    """
+    start_codes, start_values = _codes(start)
+    end_codes, end_values = _codes(end)
+    if(start_station is not None):
+        #trips from other stations are skipped as missing (-1)
+        code = pd.Index(start_values).get_indexer([start_station])[0]
+        start_codes = np.where(start_codes == code, start_codes, -1)
+    keys, counts = _count_pair_keys(start_codes, end_codes, len(start_values), len(end_values))
+    return _rank_pair_keys(keys, counts, start_values, end_values, n)
+
+
+def _rank_pair_keys(keys, counts, start_values, end_values, n):
+    """
+    returns the n most common pair keys (see _count_pair_keys) as
+    (start value, end value, count), most common first (ties in name order)
+
+    Raises a ValueError if n is below 1.
+    """
+    if(n < 1):
+        raise ValueError("Invalid n '{}' (must be at least 1)".format(n))
+    if(n < len(keys)):
+        #every pair tied with the n-th count is kept, then ordered by name
+        nth_count = np.partition(counts, len(counts) - n)[len(counts) - n]
+        keep = counts >= nth_count
+        keys, counts = keys[keep], counts[keep]
+    starts = np.asarray(start_values, dtype=object)[keys // len(end_values)]
+    ends = np.asarray(end_values, dtype=object)[keys % len(end_values)]
+    trips = sorted(zip(starts.tolist(), ends.tolist(), counts.tolist()), key=lambda trip: (-trip[2], trip[0], trip[1]))
+    return trips[:n]
+
+
+def most_common(counts):
+    """
+    returns the most common value(s) in counts, sorted (as pandas mode does)
+
+    Parameters
+    ----------
+    counts : COLLECTIONS.COUNTER
+        Count for each value.
+
+    Returns
+    -------
+    modes : LIST
+        Values with the highest count (more than one if tied),
+        empty if there are no counts.
+
+    """
+    if(isinstance(counts, PairCounts)):
+        return counts.modes()
+    if(not counts):
+        return []
+    top = max(counts.values())
+    return sorted(value for value, count in counts.items() if count == top)
+
+
+def month_name(month):
+    return datetime.datetime(1990, month, 1).strftime('%B')
+
+
+def weekday_name(dow):
+    #January 1st, 1990 was a Monday (dow 0)
+    return datetime.datetime(1990, 1, dow + 1).strftime('%A')
+
+
+def hour_name(hour):
+    #midnight and noon are 12AM and 12PM (printed as 0AM and 0PM before
+    #the statistics were calculated from counts)
+    am_pm = 'AM'
+    if(hour >= 12):
+        am_pm = 'PM'
+    return '{}{}'.format(hour % 12 or 12, am_pm)
+
+
+class CellCounts:
+    """
+    statistics counts for each (month, weekday) kept as code-indexed arrays
+
+    The counts are kept on a grid of 13 months (1-12, and ALL_MONTHS for
+    every month) by 8 weekdays (0-6, and ALL_WEEKDAYS for every weekday).
+    The margins are added up once when the counts are made, so the counts
+    for any month/weekday filter are read from a single cell (see stats).
+
+    Station, user type, gender and birth year counts have one column per
+    value in values (fields not counted are left out). The station pairs
+    of every cell are kept as pair keys (see _count_pair_keys) with their
+    counts, sorted by cell and key, the pairs of cell c (month * 8 +
+    weekday) being pair_keys[pair_offsets[c]:pair_offsets[c + 1]].
+
+    """
+    #counted columns with the TripStats field they are counted in
+    COUNTED = collections.OrderedDict(list(CODED_COLUMNS.items()) + [('Birth Year', 'birth_years')])
+    #counts kept for every column
+    GRIDS = ('rows', 'hours', 'duration_sum', 'duration_count')
+
+    def __init__(self):
+        self.rows = np.zeros(CELL_GRID, dtype=np.int64)
+        self.hours = np.zeros(CELL_GRID + (24,), dtype=np.int64)
+        self.duration_sum = np.zeros(CELL_GRID, dtype=np.float64)
+        self.duration_count = np.zeros(CELL_GRID, dtype=np.int64)
+        self.values = {}
+        self.counts = {}
+        self.pair_keys = None
+        self.pair_counts = None
+        self.pair_offsets = None
+
+    @classmethod
+    def from_frame(cls, dataframe):
+        """
+        counts the rows of dataframe (with Month and DoW columns) in each cell
+        """
+        cells = cls()
+        cell_ids = (dataframe['Month'].to_numpy(dtype=np.int64) * CELL_GRID[1]
+                    + dataframe['DoW'].to_numpy(dtype=np.int64))
+        cells.rows = np.bincount(cell_ids, minlength=CELL_COUNT).reshape(CELL_GRID)
+        #every row has a month, so no Start Time is missing
+        cells.hours = _count_cell_codes(cell_ids, _start_hours(dataframe['Start Time']), 24)
+        if('Trip Duration' in dataframe.columns):
+            durations = dataframe['Trip Duration'].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(durations)
+            cells.duration_count = np.bincount(cell_ids[valid], minlength=CELL_COUNT).reshape(CELL_GRID)
+            cells.duration_sum = np.bincount(cell_ids[valid], weights=durations[valid],
+                                             minlength=CELL_COUNT).reshape(CELL_GRID)
+        codes = {}
+        for column, field in cls.COUNTED.items():
+            if(column in dataframe.columns):
+                codes[field], values = _codes(dataframe[column])
+                cells.values[field] = np.asarray(values.tolist())
+                cells.counts[field] = _count_cell_codes(cell_ids, codes[field], len(values))
+        if('start_stations' in codes):
+            end_count = len(cells.values['end_stations'])
+            pair_count = max(len(cells.values['start_stations']) * end_count, 1)
+            valid = (codes['start_stations'] >= 0) & (codes['end_stations'] >= 0)
+            keys, counts = np.unique(cell_ids[valid] * pair_count
+                                     + codes['start_stations'][valid].astype(np.int64) * end_count
+                                     + codes['end_stations'][valid], return_counts=True)
+            cells._set_pairs(keys // pair_count, keys % pair_count, counts, pair_count)
+        for grid in [getattr(cells, name) for name in cls.GRIDS] + list(cells.counts.values()):
+            _add_margins(grid)
+        return cells
+
+    def _set_pairs(self, cell_ids, keys, counts, pair_count, margins=True):
+        """
+        keeps the (cell, pair key) counts, adding the margin cells if margins
+        """
+        if(margins):
+            months, dows = cell_ids // CELL_GRID[1], cell_ids % CELL_GRID[1]
+            parts = [(cell_ids, keys, counts)]
+            for margin_ids in [ALL_MONTHS * CELL_GRID[1] + dows, months * CELL_GRID[1] + ALL_WEEKDAYS,
+                               np.full_like(cell_ids, ALL_MONTHS * CELL_GRID[1] + ALL_WEEKDAYS)]:
+                margin_keys, margin_counts = _sum_keys(margin_ids * pair_count + keys, counts)
+                parts.append((margin_keys // pair_count, margin_keys % pair_count, margin_counts))
+            cell_ids, keys, counts = (np.concatenate(arrays) for arrays in zip(*parts))
+        order = np.argsort(cell_ids * pair_count + keys, kind='stable')
+        self.pair_keys = keys[order]
+        self.pair_counts = counts[order]
+        self.pair_offsets = np.concatenate([[0], np.cumsum(np.bincount(cell_ids, minlength=CELL_COUNT))])
+
+    def merge(self, other):
+        """
+        returns the counts of these and other added up (as new CellCounts)
+        """
+        merged = CellCounts()
+        for name in self.GRIDS:
+            setattr(merged, name, getattr(self, name) + getattr(other, name))
+        indexers = {}
+        for field in self.COUNTED.values():
+            if(field not in self.values and field not in other.values):
+                continue
+            mine = self.values.get(field, other.values[field][:0])
+            merged.values[field], indexers[field] = _union_values(mine, other.values.get(field, mine[:0]))
+            counts = np.zeros(CELL_GRID + (len(merged.values[field]),), dtype=np.int64)
+            if(field in self.counts):
+                counts[:, :, :len(mine)] += self.counts[field]
+            if(field in other.counts):
+                counts[:, :, indexers[field]] += other.counts[field]
+            merged.counts[field] = counts
+        if(self.pair_offsets is None and other.pair_offsets is None):
+            return merged
+        end_count = len(merged.values['end_stations'])
+        pair_count = max(len(merged.values['start_stations']) * end_count, 1)
+        parts = []
+        for cells, indexer in [(self, None), (other, indexers)]:
+            if(cells.pair_offsets is None):
+                continue
+            starts = cells.pair_keys // len(cells.values['end_stations'])
+            ends = cells.pair_keys % len(cells.values['end_stations'])
+            if(indexer is not None):
+                starts, ends = indexer['start_stations'][starts], indexer['end_stations'][ends]
+            cell_ids = np.repeat(np.arange(CELL_COUNT), np.diff(cells.pair_offsets))
+            parts.append((cell_ids * pair_count + starts * end_count + ends, cells.pair_counts))
+        #the margin cells of both are added up like the others
+        keys, counts = _sum_keys(*(np.concatenate(arrays) for arrays in zip(*parts)))
+        merged._set_pairs(keys // pair_count, keys % pair_count, counts, pair_count, margins=False)
+        return merged
+
+    def stats(self, month=None, dow=None):
+        """
+        returns the TripStats of the rows matching the month and weekday
+        filters ((number, name), NONE for no filter)
+        """
+        m = ALL_MONTHS if month is None else month[0]
+        d = ALL_WEEKDAYS if dow is None else dow[0]
+        stats = TripStats(rows=int(self.rows[m, d]), duration_sum=float(self.duration_sum[m, d]),
+                          duration_count=int(self.duration_count[m, d]))
+        if(month is None):
+            stats.months = _counter_from_counts(self.rows[1:, d], low=1)
+        else:
+            stats.months = _counter_from_counts(self.rows[m:m + 1, d], low=m)
+        if(dow is None):
+            stats.weekdays = _counter_from_counts(self.rows[m, :ALL_WEEKDAYS])
+        else:
+            stats.weekdays = _counter_from_counts(self.rows[m, d:d + 1], low=d)
+        stats.hours = _counter_from_counts(self.hours[m, d])
+        for field, values in self.values.items():
+            setattr(stats, field, _counter_from_counts(self.counts[field][m, d], values.tolist()))
+        if(self.pair_offsets is not None):
+            cell = m * CELL_GRID[1] + d
+            pairs = slice(self.pair_offsets[cell], self.pair_offsets[cell + 1])
+            stats.station_pairs = PairCounts(self.pair_keys[pairs], self.pair_counts[pairs],
+                                             self.values['start_stations'], self.values['end_stations'])
+        return stats
+
+    def total_rows(self):
+        """
+        returns the number of rows counted
+        """
+        return int(self.rows[ALL_MONTHS, ALL_WEEKDAYS])
+
+    def months(self):
+        """
+        returns the months with rows, in order
+        """
+        return [m for m in range(1, 13) if self.rows[m, ALL_WEEKDAYS] > 0]
+
+    def weekdays(self):
+        """
+        returns the weekdays with rows, in order
+        """
+        return [d for d in range(7) if self.rows[ALL_MONTHS, d] > 0]
+
+    def to_arrays(self):
+        """
+        returns the counts as a dict of numpy arrays (see from_arrays)
+        """
+        arrays = {name: getattr(self, name) for name in self.GRIDS}
+        for field, values in self.values.items():
+            arrays['values.' + field] = values
+            arrays['counts.' + field] = self.counts[field]
+        if(self.pair_offsets is not None):
+            arrays.update(pair_keys=self.pair_keys, pair_counts=self.pair_counts, pair_offsets=self.pair_offsets)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        returns the CellCounts saved as arrays (see to_arrays)
+        """
+        cells = cls()
+        for name in arrays:
+            if(name.startswith('values.')):
+                field = name[len('values.'):]
+                cells.values[field] = arrays[name]
+                cells.counts[field] = arrays['counts.' + field]
+            elif(name in cls.GRIDS or name.startswith('pair_')):
+                setattr(cells, name, arrays[name])
+        return cells
+
+
+def _count_cell_codes(cell_ids, codes, width):
+    """
+    counts the codes (0 to width - 1, -1 for missing) of the rows in each
+    cell as an array of the cell grid by code
+    """
+    valid = codes >= 0
+    counts = np.bincount(cell_ids[valid] * width + codes[valid], minlength=CELL_COUNT * width)
+    return counts.reshape(CELL_GRID + (width,))
+
+
+def _add_margins(grid):
+    """
+    fills the ALL_MONTHS and ALL_WEEKDAYS cells of grid (indexed by month
+    and weekday first) with the sums of the other cells
+    """
+    grid[ALL_MONTHS] = grid[1:].sum(axis=0)
+    grid[:, ALL_WEEKDAYS] = grid[:, :ALL_WEEKDAYS].sum(axis=1)
+
+
+def _sum_keys(keys, counts):
+    """
+    adds up the counts of equal keys, returning the distinct keys (sorted)
+    and their counts
+    """
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse.ravel(), weights=counts, minlength=len(keys)).astype(np.int64)
+
+
+def _union_values(values, other):
+    """
+    returns values followed by the values of other not in it, with the
+    position of each value of other in that list
+    """
+    if(len(values) == 0):
+        return other, np.arange(len(other))
+    new = other[pd.Index(values).get_indexer(other) < 0]
+    union = np.concatenate([values, new])
+    return union, pd.Index(union).get_indexer(other)
+
+
+def compute_cell_stats(dataframe):
+    """
+    calculates the statistics counts separately for each (month, weekday)
+
+    Parameters
+    ----------
+    dataframe : PANDAS.DATAFRAME
+        Pandas DataFrame object containing data to calculate statistics for.
+
+    Returns
+    -------
+    cells : CellCounts
+        Counts for the rows of each (Month, DoW) in the data, and for
+        every month and every weekday.
+
+    """
+    return CellCounts.from_frame(dataframe)
+
+
+def stats_index_file(datafile):
+    """
+    returns the path of the statistics index file for datafile
+    """
+    return datafile + STATS_INDEX_EXT
+
+
+def build_stats_index(datafile):
+    """
+    builds the statistics index file for a city
+
+    The csv file is read in chunks (as stream_stats does) and the statistics
+    counts for each (month, weekday) are saved next to it (stats_index_file),
+    with the modification time, size and last bytes of the csv file they
+    were built from (see refresh_stats_index).
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file
+
+    Returns
+    -------
+    cells : CellCounts
+        Counts for each (month, weekday), see compute_cell_stats.
+
+    """
+    signature = _source_signature(datafile)
+    cells = _count_cells(_iter_filtered_chunks(datafile))
+    _write_stats_index(datafile, cells, signature)
+    return cells
+
+
+def refresh_stats_index(datafile):
+    """
+    brings the statistics index for a city up to date with its csv file
+
+    If rows were only appended to the csv file since the index was built
+    (see appended_offset), only the appended rows are read and their counts
+    are added to the index. Otherwise (no index, or the file was changed
+    in other ways) the index is built again (see build_stats_index).
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file
+
+    Returns
+    -------
+    cells : CellCounts
+        Counts for each (month, weekday), see compute_cell_stats.
+
+    """
+    signature = _source_signature(datafile)
+    index = _load_stats_index(datafile)
+    if(index is not None and index.get('source') == signature):
+        _STATS_INDEX_CACHE[datafile] = (signature, index['cells'])
+        return index['cells']
+    offset = None
+    if(index is not None):
+        offset = appended_offset(datafile, index.get('source'), index.get('tail'))
+    if(offset is None):
+        return build_stats_index(datafile)
+    with INSTRUMENTATION.span('refresh_stats_index') as span:
+        appended = _count_cells(_iter_appended_chunks(datafile, offset, signature['size']))
+        #the cells read before are shared (ex. with the stats server) -- merge returns new counts
+        cells = index['cells'].merge(appended)
+        span['rows'] = appended.total_rows()
+    _write_stats_index(datafile, cells, signature)
+    return cells
+
+
+def _count_cells(chunks):
+    """
+    calculates the statistics counts for each (month, weekday) of the
+    filtered csv chunks (see _filter_chunks)
+    """
+    cells = CellCounts()
+    for chunk in chunks:
+        chunk['Month'] = chunk['Start Time'].dt.month
+        chunk['DoW'] = chunk['Start Time'].dt.dayofweek
+        cells = cells.merge(compute_cell_stats(apply_dtype_plan(chunk)))
+    return cells
+
+
+def _write_stats_index(datafile, cells, source):
+    """
+    saves the statistics index for datafile, built from the version of
+    datafile with the signature source
+
+    The index is saved as numpy arrays only (no pickled objects), with
+    the STATS_INDEX_VERSION it was written in.
+    """
+    index_file = stats_index_file(datafile)
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, version=np.array(STATS_INDEX_VERSION), source=np.array(json.dumps(source)),
+                 tail=np.array(_source_tail(datafile, source['size'])), **cells.to_arrays())
+    os.replace(tmp_file, index_file)
+    _STATS_INDEX_CACHE[datafile] = (source, cells)
+
+
+def read_stats_index(datafile):
+    """
+    reads the statistics index for datafile
+
+    The index is only used if it was built from the current version
+    (modification time and size) of datafile.
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file the index was built from
+
+    Returns
+    -------
+    cells : CellCounts
+        Counts for each (month, weekday), see compute_cell_stats,
+        NONE if there is no current index file.
+
+    """
+    if(not os.path.exists(stats_index_file(datafile))):
+        return None
+    signature = _source_signature(datafile)
+    cached = _STATS_INDEX_CACHE.get(datafile)
+    if(cached is not None and cached[0] == signature):
+        return cached[1]
+    index = _load_stats_index(datafile)
+    if(index is None or index.get('source') != signature):
+        return None
+    _STATS_INDEX_CACHE[datafile] = (signature, index['cells'])
+    return index['cells']
+
+
+def _load_stats_index(datafile):
+    """
+    reads the statistics index file for datafile (current or not),
+    NONE if there is no readable index file of the current STATS_INDEX_VERSION
+    """
+    try:
+        with np.load(stats_index_file(datafile), allow_pickle=False) as arrays:
+            if(arrays['version'] != STATS_INDEX_VERSION):
+                return None
+            return {'source': json.loads(str(arrays['source'])), 'tail': str(arrays['tail']),
+                    'cells': CellCounts.from_arrays({name: arrays[name] for name in arrays.files})}
+    except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+        return None
+
+
+def build_stats_indexes(cities=AVAILABLE_CITIES, refresh=False):
+    """
+    builds (or rebuilds) the statistics index file for each available city
+
+    Parameters
+    ----------
+    cities : LIST of STR, optional
+        City names to build the index for. The default is AVAILABLE_CITIES.
+    refresh : BOOL, optional
+        Only bring existing indexes up to date, reading just the rows appended
+        since they were built (see refresh_stats_index). The default is False.
+
+    Returns
+    -------
+    None.
+
+    """
+    for city in cities:
+        city_file = find_city_file(city)
+        if(city_file is None):
+            print("No data for city '{}'".format(city.title()))
+            continue
+        start_time = time.time()
+        if(refresh):
+            refresh_stats_index(city_file)
+            print(f'Refreshed {stats_index_file(city_file)} in {time.time() - start_time} seconds.')
+        else:
+            build_stats_index(city_file)
+            print(f'Built {stats_index_file(city_file)} in {time.time() - start_time} seconds.')
+
+
+def city_metadata_file(datafile):
+    """
+    returns the path of the metadata file for datafile (see probe_city_file)
+    """
+    return datafile + METADATA_EXT
+
+
+def probe_city_file(datafile, scan=True):
+    """
+    returns metadata about a city csv file without loading it
+
+    The metadata is found with one scan of the Start Time column (of the
+    columnar cache if current, otherwise of the csv file) and saved next to
+    the csv file (city_metadata_file) with the modification time and size of
+    the file it was found from, so later calls only read the saved metadata.
+    If rows were only appended since, only those rows are scanned
+    (see appended_offset).
+
+    Parameters
+    ----------
+    datafile : STR
+        Path to the CSV file
+    scan : BOOL, optional
+        Scan the file if there is no current saved metadata. The default is True.
+
+    Returns
+    -------
+    metadata : DICT
+        'rows' (INT), 'first_start' and 'last_start' (STR, earliest and latest
+        Start Time), 'months' and 'weekdays' (LIST of INT, 1 = January and
+        0 = Monday), and 'columns' (LIST of STR, see city_columns),
+        NONE if scan is False and there is no current saved metadata.
+
+    """
+    signature = _source_signature(datafile)
+    cached = _METADATA_CACHE.get(datafile)
+    if(cached is not None and cached['source'] == signature):
+        return cached
+    saved = None
+    try:
+        with open(city_metadata_file(datafile)) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        pass
+    if(saved is not None and saved.get('source') == signature):
+        _METADATA_CACHE[datafile] = saved
+        return saved
+    if(not scan):
+        return None
+    with INSTRUMENTATION.span('probe_city_file') as span:
+        offset = None
+        if(saved is not None):
+            offset = appended_offset(datafile, saved.get('source'), saved.get('tail'))
+        if(offset is not None):
+            appended = _scan_start_times(_iter_appended_chunks(datafile, offset, signature['size']))
+            metadata = _merge_metadata(saved, appended)
+        elif(_columnar_cache_is_current(datafile)):
+            table = feather.read_table(columnar_cache_file(datafile), memory_map=True, columns=['Start Time'])
+            metadata = _scan_start_times([table.to_pandas()])
+        else:
+            metadata = _scan_start_times(_iter_filtered_chunks(datafile, columns=['Start Time']))
+        span['rows'] = metadata['rows']
+    metadata['columns'] = city_columns(datafile)
+    metadata['source'] = signature
+    metadata['tail'] = _source_tail(datafile, signature['size'])
+    metadata_file = city_metadata_file(datafile)
+    try:
+        with open(metadata_file + '.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(metadata_file + '.tmp', metadata_file)
+    except OSError as ex:
+        print("Could not write metadata for {}: {}".format(datafile, ex))
+    _METADATA_CACHE[datafile] = metadata
+    return metadata
+
+
+def _scan_start_times(chunks):
+    """
+    returns the rows, earliest and latest Start Time, months and weekdays
+    of chunks with a parsed Start Time column (see probe_city_file)
+    """
+    rows = 0
+    first_start = last_start = None
+    months = set()
+    weekdays = set()
+    for chunk in chunks:
+        start_times = chunk['Start Time'].dropna()
+        rows += len(chunk)
+        if(len(start_times) == 0):
+            continue
+        chunk_first, chunk_last = start_times.min(), start_times.max()
+        first_start = chunk_first if first_start is None else min(first_start, chunk_first)
+        last_start = chunk_last if last_start is None else max(last_start, chunk_last)
+        months.update(int(m) for m in start_times.dt.month.unique())
+        weekdays.update(int(d) for d in start_times.dt.dayofweek.unique())
+    return {'rows': rows,
+            'first_start': None if first_start is None else str(first_start),
+            'last_start': None if last_start is None else str(last_start),
+            'months': sorted(months), 'weekdays': sorted(weekdays)}
+
+
+def _merge_metadata(metadata, other):
+    """
+    returns the metadata (see _scan_start_times) of two parts of a file together
+    """
+    starts = [s for s in [metadata['first_start'], other['first_start']] if s is not None]
+    ends = [s for s in [metadata['last_start'], other['last_start']] if s is not None]
+    return {'rows': metadata['rows'] + other['rows'],
+            'first_start': min(starts) if starts else None,
+            'last_start': max(ends) if ends else None,
+            'months': sorted(set(metadata['months']) | set(other['months'])),
+            'weekdays': sorted(set(metadata['weekdays']) | set(other['weekdays']))}
+
+
+def stage_stats(dataframe, stage):
+    """
+    calculates only the counts of dataframe needed for a statistics stage
+    (a key of STAGE_COLUMNS), see compute_stats
+
+    The Start Time counts (months, weekdays, hours) are always calculated.
+    Calculating every count once with compute_stats is faster when more
+    than one stage is printed.
+    """
+    return compute_stats(_project(dataframe, ['Start Time'] + STAGE_COLUMNS[stage]))
+
+
+def calc_time_stats(dataframe, stats=None):
+    """
+    calculates statistics about times of bikesharing
+    
+    Calculates time statistics:
+    Most Common Month: mode of Month column (not calculated if filtered)
+    Most Common Weekday: mode of DoW column (not calculated if filtered)
+    Most Common Hour: mode of start time's hour field
+
+    Parameters
+    ----------
+    dataframe : PANDAS.DATAFRAME
+        Pandas DataFrame object containing data to calculate statistics for.
+    stats : TripStats, optional
+        Counts already calculated for the data (see compute_stats).
+        The default is None (only the counts of this stage are calculated
+        from dataframe, see stage_stats).
+
+    Returns
+    -------
+    result : TimeStats
+        The statistics printed, NONE if there is no data.
+
+    """
+    if(dataframe is None and stats is None):
+        return
+    print('Calculating the Most Frequent Times of Travel...\n')
+    with INSTRUMENTATION.span('calc_time_stats') as span:
+        if(stats is None):
+            stats = stage_stats(dataframe, 'time')
+        span['rows'] = stats.rows
+        result = stats.time_stats()
+        if(result.months is not None):
+            month_names = [month_name(m) for m in result.months]
+            if(len(month_names) > 1):
+                #tie for most frequent month
+                print('Most common Months:    {}'.format(', '.join(month_names)))
+            else:
+                print('Most common Month:    {}'.format(month_names[0]))
+        if(result.weekdays is not None):
+            wkday_names = [weekday_name(d) for d in result.weekdays]
+            if(len(wkday_names) > 1):
+                #tie for most frequent weekday
+                print('Most common Weekdays:  {}'.format(', '.join(wkday_names)))
+            else:
+                print('Most common Weekday:  {}'.format(wkday_names[0]))
+        hours = [hour_name(h) for h in result.hours]
+        if(len(hours) > 1):
+            print('Most common Hours:     {}'.format(', '.join(hours)))
+        elif(len(hours) == 1):
+            print('Most common Hour:     {}'.format(hours[0]))
+        else:
+            print('No trips to calculate statistics for.')
+    print('-=-'*15)
+    return result
+    
+    
+def calc_station_stats(dataframe, stats=None):
+    """
+    calculates statistics about stations
+    
+    Calculates station statistics:
+    Most Popular Start Station(s): most used station to start a trip
+    Most Popular End Station(s): most used station to end a trip
+    Most Popular Station Pair(s): most used start-end station pairings
+    Top Trips: the TOP_TRIPS most used pairings and their counts
+
+    When the station counts are estimates (see approx_stream_stats),
+    the range of each estimated count is printed with it.
+
+    Parameters
+    ----------
+    dataframe : PANDAS.DATAFRAME
+        Pandas DataFrame object containing data to calculate statistics for.
+    stats : TripStats, optional
+        Counts already calculated for the data (see compute_stats).
+        The default is None (only the counts of this stage are calculated
+        from dataframe, see stage_stats).
+
+    Returns
+    -------
+    result : StationStats
+        The statistics printed, NONE if there is no data.
+
+    """
+    if(dataframe is None and stats is None):
+        return
+    print('Calculating the Most Popular Stations...\n')
+    with INSTRUMENTATION.span('calc_station_stats') as span:
+        if(stats is None):
+            stats = stage_stats(dataframe, 'station')
+        span['rows'] = stats.rows
+        result = stats.station_stats()
+        sketches = stats.sketches or {}
+        start_note = _approx_note(sketches.get('start_stations'), result.start_stations)
+        end_note = _approx_note(sketches.get('end_stations'), result.end_stations)
+        if(len(result.start_stations) > 1):
+            print('Most frequent Start Stations: {}{}'.format(', '.join(result.start_stations), start_note))
+        else:
+            print('Most frequent Start Station: {}{}'.format(', '.join(result.start_stations), start_note))
+        if(len(result.end_stations) > 1):
+            print('Most Frequent End Stations: {}{}'.format(', '.join(result.end_stations), end_note))
+        else:
+            print('Most Frequent End Station: {}{}'.format(', '.join(result.end_stations), end_note))
+        spairs = []
+        for start, end in result.trips:
+            spairs.append('\t{} to {}'.format(start, end))
+        print('Most Frequent Trips:{}\n{}'.format(
+            _approx_note(sketches.get('station_pairs'), result.trips), '\n'.join(spairs)))
+        if(len(result.top_trips) > 1):
+            pairs = sketches.get('station_pairs')
+            top_trips = ['\t{} to {}: {}'.format(start, end, _approx_count(pairs, (start, end), count))
+                         for start, end, count in result.top_trips]
+            print('Top {} Trips:\n{}'.format(len(top_trips), '\n'.join(top_trips)))
+    print('-=-'*15)
+    return result
+    
+
+def _approx_note(sketch, values):
+    """
+    returns the estimated count range of the most common values (and whether
+    they are certainly the most common) to print after them, or an empty
+    string if the counts of sketch are exact (or there is no sketch)
+    """
+    if(sketch is None or sketch.exact or not values):
+        return ''
+    bounds = [sketch.bounds(value) for value in values]
+    proven = sketch.proves_top(values)
+    if(proven and all(low == high for low, high in bounds)):
+        return ''
+    note = ' (approximate: {} to {} trips'.format(min(low for low, high in bounds),
+                                                max(high for low, high in bounds))
+    if(not proven):
+        note += ', may not be the most frequent'
+    return note + ')'
+
+
+def _approx_count(sketch, value, count):
+    """
+    returns count, or its range when sketch only has an estimate of it
+    """
+    if(sketch is None or sketch.exact):
+        return count
+    low, high = sketch.bounds(value)
+    if(low == high):
+        return count
+    return '{} to {} (approximate)'.format(low, high)
+
+
+def calc_trip_stats(dataframe, stats=None):
+    """
+    calculates statistics about the trips taken
+    
+    Calculates trip statistics:
+    Total trip duration: total time the bikes were used
+    Mean trip duration: average time of a trip
+
+    Parameters
+    ----------
+    dataframe : PANDAS.DATAFRAME
+        Pandas DataFrame object containing data to calculate statistics for.
+    stats : TripStats, optional
+        Counts already calculated for the data (see compute_stats).
+        The default is None (only the counts of this stage are calculated
+        from dataframe, see stage_stats).
+
+    Returns
+    -------
+    result : TripDurationStats
+        The statistics printed, NONE if there is no data.
+
+    """
+    if(dataframe is None and stats is None):
+        return
+    print('Calculating Trip Duration...\n')
+    with INSTRUMENTATION.span('calc_trip_stats') as span:
+        if(stats is None):
+            stats = stage_stats(dataframe, 'trip')
+        span['rows'] = stats.rows
+        result = stats.trip_stats()
+        tt_d, tt_h, tt_m, tt_s = secs_to_full(result.total_seconds)
+        mt_d, mt_h, mt_m, mt_s = secs_to_full(result.mean_seconds or 0)
+        time_str = '{} Days, {} Hours, {} Minutes and {} Seconds'.format(tt_d, tt_h, tt_m, tt_s)
+        print('Total time of Trip Durations: {}'.format(time_str))
+        if(mt_d > 0):
+            time_str2 = '{} Days, {} Hours, {} Minutes and {} Seconds'.format(mt_d, mt_h, mt_m, mt_s)
+        elif(mt_h > 0):
+            time_str2 = '{} Hours, {} Minutes and {} Seconds'.format(mt_h, mt_m, mt_s)
+        else:
+            time_str2 = '{} Minutes and {} Seconds'.format(mt_m, mt_s)
+        print('Mean time of Trip Durations: {}'.format(time_str2))
+    print('-=-'*15)
+    return result
     
 
-def calc_user_stats(dataframe):
+def calc_user_stats(dataframe, stats=None):
     """
     calculates statistics about the users
     
@@ -455,48 +3623,169 @@ def calc_user_stats(dataframe):
     ----------
     dataframe : PANDAS.DATAFRAME
         Pandas DataFrame containing data to calculate statistics for.
+    stats : TripStats, optional
+        Counts already calculated for the data (see compute_stats).
+        The default is None (only the counts of this stage are calculated
+        from dataframe, see stage_stats).
 
     Returns
     -------
-    None.
+    result : UserStats
+        The statistics printed, NONE if there is no data.
 
     """
-    if(dataframe is None):
+    if(dataframe is None and stats is None):
         return
     print('Calculating User Stats...\n')
-    start_time = time.time()
-    counts = dataframe['User Type'].value_counts()
-    user_types = counts.index
-    user_type_counts = []
-    for i in range(user_types.size):
-        ut = '\t{}: {}'.format(user_types[i], counts.iloc[i])
-        user_type_counts.append(ut)
-    print('User Types and Counts:\n{}'.format('\n'.join(user_type_counts)))
-    if(list(dataframe.columns).count('Gender') > 0):
-        counts2 = dataframe['Gender'].value_counts()
-        genders = counts2.index
-        gender_counts = []
-        for i in range(genders.size):
-            g = '\t{}: {}'.format(genders[i], counts2.iloc[i])
-            gender_counts.append(g)
-        print('Genders and Counts:\n{}'.format('\n'.join(gender_counts)))
-    if(list(dataframe.columns).count('Birth Year') > 0):
-        min_birth_year = dataframe['Birth Year'].min()
-        max_birth_year = dataframe['Birth Year'].max()
-        most_common_birth_year = None
-        common_birth_year = dataframe['Birth Year'].mode()
-        if(common_birth_year.size > 1):
-            cby = common_birth_year.array
-            commons = []
-            for i in range(cby.size):
-                commons.append(str(cby[i]))
-            most_common_birth_year = ', '.join(commons)
-        else:
-            most_common_birth_year = common_birth_year.iloc[0]
-        print('Min Birth Year: {}\nMax Birth Year: {}\nMost Common Birth Year: {}'
-              .format(min_birth_year, max_birth_year, most_common_birth_year))
-    print(f'\nThis took {time.time() - start_time} seconds.')
+    with INSTRUMENTATION.span('calc_user_stats') as span:
+        if(stats is None):
+            stats = stage_stats(dataframe, 'user')
+        span['rows'] = stats.rows
+        result = stats.user_stats()
+        user_type_counts = []
+        for user_type, count in result.user_types.items():
+            user_type_counts.append('\t{}: {}'.format(user_type, count))
+        print('User Types and Counts:\n{}'.format('\n'.join(user_type_counts)))
+        if(result.genders is not None):
+            gender_counts = []
+            for gender, count in result.genders.items():
+                gender_counts.append('\t{}: {}'.format(gender, count))
+            print('Genders and Counts:\n{}'.format('\n'.join(gender_counts)))
+        if(result.birth_years):
+            print('Min Birth Year: {}\nMax Birth Year: {}\nMost Common Birth Year: {}'
+                  .format(result.min_birth_year, result.max_birth_year,
+                          ', '.join(str(y) for y in result.birth_years)))
     print('-=-'*15)
+    return result
+
+
+#function calculating and printing each statistics stage (see STAGE_COLUMNS)
+STAGE_FUNCTIONS = collections.OrderedDict([
+    ('time', calc_time_stats),
+    ('station', calc_station_stats),
+    ('trip', calc_trip_stats),
+    ('user', calc_user_stats),
+])
+
+
+def stats_record(city, month, dow, stats, stages=None):
+    """
+    returns the statistics for a city and filters as a plain (json ready) dict
+
+    Parameters
+    ----------
+    city : STR
+        Name of the city.
+    month : TUPLE of INT and STRING
+        The month filter, NONE for all months.
+    dow : TUPLE of INT and STRING
+        The day of the week filter, NONE for all weekdays.
+    stats : TripStats
+        Counts for the filtered data.
+    stages : LIST of STR, optional
+        Statistics stages to include. The default is None (all stages).
+
+    Returns
+    -------
+    record : DICT
+        city, month, weekday, rows, and the time, station, trip,
+        and user statistics (see TimeStats, StationStats,
+        TripDurationStats, and UserStats).
+
+    """
+    record = {
+        'city': city,
+        'month': month[1] if month else None,
+        'weekday': dow[1] if dow else None,
+        'rows': stats.rows,
+        }
+    stage_stats = {'time': stats.time_stats, 'station': stats.station_stats,
+                   'trip': stats.trip_stats, 'user': stats.user_stats}
+    for stage in STAGE_COLUMNS:
+        if(stages is None or stage in stages):
+            record[stage] = dataclasses.asdict(stage_stats[stage]())
+    return record
+
+
+class StatsWriter:
+    """
+    writes statistics records (see stats_record) to a file as they are made
+
+    Formats:
+    json : one JSON array of records
+    ndjson : one JSON record per line
+    csv : one row per statistic value --
+          city, month, weekday, stage, statistic, value
+          (dict statistics are written as 'statistic.key', list statistics
+          as one row per item, station pairs as 'start to end', and the
+          count of a top trip in a 'statistic.count' row after it)
+
+    Records are written immediately, so a batch of any size is never
+    held in memory. Use as a context manager (or call close) to finish
+    the json array.
+
+    """
+
+    FORMATS = ['json', 'ndjson', 'csv']
+
+    def __init__(self, fp, fmt='ndjson'):
+        if(fmt not in self.FORMATS):
+            raise ValueError("Unknown format '{}' (expected one of {})".format(fmt, ', '.join(self.FORMATS)))
+        self.fp = fp
+        self.fmt = fmt
+        self.count = 0
+        if(fmt == 'csv'):
+            self._csv = csv.writer(fp)
+            self._csv.writerow(['city', 'month', 'weekday', 'stage', 'statistic', 'value'])
+
+    def write(self, record):
+        if(self.fmt == 'json'):
+            self.fp.write('[\n' if self.count == 0 else ',\n')
+            self.fp.write(json.dumps(record))
+        elif(self.fmt == 'ndjson'):
+            self.fp.write(json.dumps(record) + '\n')
+        else:
+            keys = [record['city'], record['month'], record['weekday']]
+            self._csv.writerow(keys + ['data', 'rows', record['rows']])
+            for stage in STAGE_COLUMNS:
+                for statistic, value in record.get(stage, {}).items():
+                    for name, item in self._flatten(statistic, value):
+                        self._csv.writerow(keys + [stage, name, item])
+        self.count += 1
+
+    @staticmethod
+    def _flatten(statistic, value):
+        """
+        yields (statistic name, value) rows for a statistic
+        """
+        if(value is None):
+            return
+        if(isinstance(value, dict)):
+            for key, item in value.items():
+                yield '{}.{}'.format(statistic, key), item
+        elif(isinstance(value, list)):
+            for item in value:
+                if(isinstance(item, (tuple, list)) and len(item) == 3):
+                    #(start, end, count) of top_trips
+                    yield statistic, '{} to {}'.format(item[0], item[1])
+                    yield '{}.count'.format(statistic), item[2]
+                elif(isinstance(item, (tuple, list))):
+                    yield statistic, ' to '.join(str(i) for i in item)
+                else:
+                    yield statistic, item
+        else:
+            yield statistic, value
+
+    def close(self):
+        if(self.fmt == 'json'):
+            self.fp.write('[]\n' if self.count == 0 else '\n]\n')
+        self.fp.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
 
 def secs_to_full(seconds):
@@ -512,17 +3801,157 @@ def secs_to_full(seconds):
     return (int(days), int(hours), int(mins), int(secs))
 
 
+class RowPager:
+    """
+    pages through the rows of a city csv file matching the filters
+    without loading the file
+
+    The file is scanned PAGER_BLOCK_BYTES at a time (only the Start Time
+    column is parsed) to find the byte offset of each matching line, and only
+    as far as needed for the requested page. A page is read by seeking to the
+    offsets of its lines, so memory used depends on the number of matching
+    rows (8 bytes each), not on the size of the file.
+    Assumes no line breaks inside quoted csv values.
+
+    A compressed file can not be read at an offset, so it is decompressed
+    as it is scanned (from a stream kept open) and the matching lines
+    themselves are kept instead of their offsets.
+
+    """
+
+    def __init__(self, datafile, month=None, dow=None):
+        self.datafile = datafile
+        self.month = month
+        self.dow = dow
+        self.columns = pd.read_csv(datafile, nrows=0).columns.tolist()
+        #byte offset of each matching line found so far
+        self._offsets = array.array('q')
+        #matching lines found so far and the stream scanned (compressed files)
+        self._lines = None
+        self._stream = None
+        if(city_file_compression(datafile) is not None):
+            self._lines = []
+            self._stream = open_city_file(datafile)
+            self._scan_pos = len(self._stream.readline())
+            #not known until the end of the stream is reached
+            self._size = None
+        else:
+            with open(datafile, 'rb') as f:
+                f.readline()
+                self._scan_pos = f.tell()
+            self._size = os.path.getsize(datafile)
+        self._fmt = None
+
+    def scanned(self):
+        """
+        returns True once the whole file has been scanned for matching rows
+        """
+        return self._size is not None and self._scan_pos >= self._size
+
+    def _found(self):
+        """
+        returns the number of matching lines found so far
+        """
+        return len(self._offsets) if self._lines is None else len(self._lines)
+
+    def _scan(self, rows):
+        """
+        scans the file for matching lines until rows offsets are known
+        (or the end of the file is reached)
+        """
+        with contextlib.ExitStack() as stack:
+            f = self._stream or stack.enter_context(open(self.datafile, 'rb'))
+            while(self._found() < rows and not self.scanned()):
+                if(self._stream is None):
+                    f.seek(self._scan_pos)
+                block = f.read(PAGER_BLOCK_BYTES)
+                end = block.rfind(b'\n') + 1
+                if(self._stream is not None):
+                    #the size is not known -- read on to the end of the last line
+                    block = block + f.readline()
+                    end = len(block)
+                    if(end == 0):
+                        self._size = self._scan_pos
+                        break
+                elif(end == 0 or self._scan_pos + len(block) >= self._size):
+                    #last line of the file (or a single line longer than a block)
+                    block = block + f.readline()
+                    end = len(block)
+                block = block[:end]
+                newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+                starts = np.concatenate([[0], newlines + 1])
+                if(starts[-1] >= len(block)):
+                    starts = starts[:-1]
+                start_times = pd.read_csv(io.BytesIO(block), header=None, names=self.columns,
+                                          usecols=['Start Time'], skip_blank_lines=False)['Start Time']
+                if(self._fmt is None):
+                    self._fmt = detect_timestamp_format(start_times)
+                start_times = parse_timestamps(start_times, self._fmt)
+                mask = np.ones(len(start_times), dtype=bool)
+                if(self.month is not None):
+                    mask &= (start_times.dt.month == self.month[0]).to_numpy()
+                if(self.dow is not None):
+                    mask &= (start_times.dt.dayofweek == self.dow[0]).to_numpy()
+                if(self._lines is None):
+                    self._offsets.extend((starts[mask] + self._scan_pos).tolist())
+                else:
+                    ends = np.append(starts[1:], len(block))
+                    self._lines.extend(block[start:end] for start, end
+                                       in zip(starts[mask].tolist(), ends[mask].tolist()))
+                self._scan_pos += len(block)
+
+    def page(self, start_index, count):
+        """
+        reads the matching rows start_index to start_index + count
+
+        Parameters
+        ----------
+        start_index : INT
+            index (among the matching rows) of the first row
+        count : INT
+            number of rows to read
+
+        Returns
+        -------
+        page : PANDAS.DATAFRAME
+            the rows (as load_data would return them), indexed by their
+            position among the matching rows -- empty past the last row
+
+        """
+        self._scan(start_index + count)
+        if(self._lines is not None):
+            lines = self._lines[start_index:start_index + count]
+        else:
+            offsets = self._offsets[start_index:start_index + count]
+            lines = []
+            with open(self.datafile, 'rb') as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    lines.append(f.readline())
+        if(len(lines) == 0):
+            return pd.DataFrame(columns=self.columns[1:])
+        page = pd.read_csv(io.BytesIO(b''.join(lines)), header=None, names=self.columns)
+        page.drop(columns=page.columns[0], inplace=True)
+        page['Start Time'] = parse_timestamps(page['Start Time'], self._fmt)
+        page['End Time'] = parse_timestamps(page['End Time'])
+        page['Month'] = page['Start Time'].dt.month
+        page['DoW'] = page['Start Time'].dt.dayofweek
+        page.index = range(start_index, start_index + len(page))
+        return apply_dtype_plan(page)
+
+
 def view_raw(dataframe, start_index, count=5):
     """
     prints the raw data in the dataframe
     
     Prints to the console the raw data from the dataframe from the
-    start_index to start_index + 5
+    start_index to start_index + count
 
     Parameters
     ----------
-    dataframe : PANDAS.DATAFRAME
-        Pandas DataFrame object containing data to print
+    dataframe : PANDAS.DATAFRAME or RowPager
+        Pandas DataFrame object containing data to print,
+        or a RowPager to read the rows from the csv file
     start_index : INT
         starting index of raw data
     count : INT, optional
@@ -532,13 +3961,20 @@ def view_raw(dataframe, start_index, count=5):
     -------
     INT
         the ending index for use in consecutive calls
-        -1 if the dataframe is NONE
+        -1 if the dataframe is NONE or there are no more rows
 
     """
     if(dataframe is None):
         return -1
-    end_index = start_index + 5
-    print(dataframe.iloc[start_index:end_index])
+    end_index = start_index + count
+    if(isinstance(dataframe, RowPager)):
+        rows = dataframe.page(start_index, count)
+    else:
+        rows = dataframe.iloc[start_index:end_index]
+    if(len(rows) == 0):
+        print('No more data to view.')
+        return -1
+    print(rows)
     return end_index
 
 
@@ -564,22 +4000,85 @@ def prompt_T_F(msg):
     return True
 
 
-def main():
+def main(stream=False, workers=1, stages=None, date_range=None, hours=None, approx=None):
     """
     The main execution of this script.
+
+    Statistics are answered from the statistics index of a city when there
+    is a current one (see build_stats_index). If the statistics did not need
+    the data loaded, viewing the data reads only the viewed rows (RowPager).
+
+    Parameters
+    ----------
+    stream : BOOL, optional
+        Calculate the statistics reading the city file in chunks (stream_stats)
+        instead of loading it. The default is False.
+    workers : INT, optional
+        Number of processes used to calculate the statistics. The default is 1.
+    stages : LIST of STR, optional
+        Statistics stages to calculate (keys of STAGE_COLUMNS); only the
+        columns they need are loaded. The default is None (all stages).
+    date_range : TUPLE of TIMESTAMP, optional
+        Only trips with start <= Start Time < end (either may be NONE).
+        The default is None.
+    hours : LIST of INT, optional
+        Only trips starting in these hours. The default is None.
+    approx : INT, optional
+        Calculate the statistics in one pass over the city file, estimating
+        the station counts with summaries of approx values each
+        (approx_stream_stats), when there is no statistics index.
+        The default is None (exact counts).
+
+    With a date range or hours, the full city data is loaded and filtered
+    with its TimeIndexedView (see city_view).
     """
     print("Hello! Let's explore some US bikeshare data!\n")
     
     while True:
-        filters = get_filters()
+        filters = get_filters(load_months=not (stream or approx is not None))
         if(filters is None):
             break
         file, month, wkday = filters
-        df = load_data(file, month, wkday)
-        calc_time_stats(df)
-        calc_station_stats(df)
-        calc_trip_stats(df)
-        calc_user_stats(df)
+        columns = stage_columns(file, stages)
+        cells = read_stats_index(file)
+        if(date_range is not None or hours is not None):
+            start, end = date_range or (None, None)
+            with INSTRUMENTATION.span('select') as span:
+                df = city_view(file).select(start, end, [month[0]] if month else None,
+                                            [wkday[0]] if wkday else None, hours)
+                span['rows'] = len(df)
+            with INSTRUMENTATION.span('compute_stats', len(df)):
+                stats = compute_stats(_project(df, columns))
+        elif(cells is not None):
+            #answered from the statistics index -- no need to load the data
+            df = None
+            with INSTRUMENTATION.span('cell stats') as span:
+                stats = cells.stats(month, wkday)
+                span['rows'] = stats.rows
+        elif(approx is not None):
+            df = None
+            stats = approx_stream_stats(file, month, wkday, approx, columns=columns)
+        elif(stream and workers > 1):
+            df = None
+            with INSTRUMENTATION.span('parallel_stream_stats') as span:
+                stats = parallel_stream_stats(file, month, wkday, workers, columns)
+                span['rows'] = stats.rows
+        elif(stream):
+            df = None
+            stats = stream_stats(file, month, wkday, columns=columns)
+        else:
+            df = load_data(file, month, wkday, columns)
+            with INSTRUMENTATION.span('compute_stats', len(df)):
+                if(workers > 1):
+                    stats = parallel_compute_stats(df, workers)
+                else:
+                    stats = compute_stats(df)
+            if(columns is not None):
+                #only some columns loaded -- the rows viewed are read from the file
+                df = None
+        for stage, calc_stats in STAGE_FUNCTIONS.items():
+            if(stages is None or stage in stages):
+                calc_stats(df, stats)
         view_data = input("\nWould you like to view this city's data?  ")
         if(view_data is None or view_data != ''):
             if(view_data.lower().startswith('n')):
@@ -587,10 +4086,15 @@ def main():
                     continue
                 else:
                     break
-        pd.set_option('display.max_columns', df.columns.size)
+        if(df is None):
+            #statistics did not need the data loaded -- read only the rows viewed
+            df = RowPager(file, month, wkday)
+        pd.set_option('display.max_columns', None)
         start_index = 0
         while start_index > -1:
             start_index = view_raw(df, start_index)
+            if(start_index < 0):
+                break
             stop = input('\nWould you like to view more?  ')
             if(stop is not None and stop != ''):
                 if(stop.lower().startswith('n')):
@@ -604,10 +4108,560 @@ def main():
     print('\n')
                     
 
+def parse_batch_spec(items):
+    """
+    parses the key=value items of the --batch option
+
+    cities : comma separated city names, or 'all' (AVAILABLE_CITIES)
+    months : comma separated month names/numbers (names may be abbreviated,
+             ex. 'feb'), 'all' (every month in the data, and all months
+             together), or 'none' (all months together)
+    weekdays : comma separated weekday names/numbers (0 = Monday, ex. 'wed'),
+               'all' (every weekday, and all weekdays together), or 'none'
+    format : text (the default -- as printed by the calc_*_stats functions),
+             json, ndjson, or csv (see StatsWriter)
+    out : file to write the report to (default is the console)
+    stages : comma separated statistics stages (time, station, trip, user),
+             or 'all' (the default)
+
+    Parameters
+    ----------
+    items : LIST of STR
+        key=value items, Ex. ['cities=chicago,washington', 'months=all'].
+
+    Returns
+    -------
+    spec : DICT
+        'cities' (LIST of STR), 'months' and 'weekdays' (LIST of (number, name)
+        filters, NONE standing for no filter -- NONE for 'all'), 'format' (STR),
+        'out' (STR, NONE for the console), and 'stages' (LIST of STR, NONE for all).
+
+    Raises a ValueError for an invalid option, including an unknown month
+    or weekday (checked before any city is loaded).
+
+    """
+    names = {'months': {m: month_name(m) for m in range(1, 13)},
+             'weekdays': {d: weekday_name(d) for d in range(7)}}
+    spec = {'cities': list(AVAILABLE_CITIES), 'months': [None], 'weekdays': [None],
+            'format': 'text', 'out': None, 'stages': None}
+    for item in items:
+        key, sep, value = item.partition('=')
+        if(not sep or key not in spec):
+            raise ValueError("Invalid batch option '{}' (expected cities=, months=, weekdays=, "
+                             "format=, out= or stages=)".format(item))
+        if(key == 'format'):
+            if(value != 'text' and value not in StatsWriter.FORMATS):
+                raise ValueError("Unknown format '{}'".format(value))
+            spec['format'] = value
+        elif(key == 'out'):
+            spec['out'] = value
+        elif(key == 'stages'):
+            spec['stages'] = parse_stages(value)
+        elif(value.lower() == 'all'):
+            spec[key] = list(AVAILABLE_CITIES) if key == 'cities' else None
+        elif(key == 'cities'):
+            spec[key] = [v.strip() for v in value.split(',') if v.strip()]
+        else:
+            spec[key] = [None if v.strip().lower() == 'none' else parse_filter_value(v.strip(), names[key])
+                         for v in value.split(',') if v.strip()]
+    return spec
+
+
+def parse_filter_value(value, names):
+    """
+    returns the (number, name) filter for a month/weekday value: a number,
+    a name, or an abbreviation of at least 3 letters (ex. 'feb', 'wed')
+
+    Raises a ValueError if value is none of names.
+    """
+    try:
+        num = int(value)
+    except ValueError:
+        matches = [num for num, name in names.items()
+                   if len(value) >= 3 and name.lower().startswith(value.lower())]
+        if(not matches):
+            raise ValueError("Unknown month/weekday '{}'".format(value))
+        num = matches[0]
+    if(num not in names):
+        raise ValueError("Unknown month/weekday '{}'".format(value))
+    return (num, names[num])
+
+
+def _batch_filters(filters, names, available):
+    """
+    returns the (number, name) filters for a batch months/weekdays option
+    (see parse_batch_spec), NONE standing for no filter -- for 'all', no
+    filter and every available month/weekday
+    """
+    if(filters is None):
+        return [None] + [(num, names[num]) for num in sorted(available)]
+    return filters
+
+
+def _city_cell_stats(city_file, stages=None):
+    """
+    returns the (month, weekday) statistics counts for a city file, from its
+    statistics index if there is one, otherwise by loading the file once
+    (only the columns needed for stages)
+    """
+    if(os.path.exists(stats_index_file(city_file))):
+        #rows appended since the index was built are counted and added to it
+        return refresh_stats_index(city_file)
+    return compute_cell_stats(read_city_data(city_file, stage_columns(city_file, stages)))
+
+
+def run_batch(spec, workers=1):
+    """
+    calculates statistics for every city, month, and weekday combination of spec
+
+    Each city file is loaded (or its statistics index read) only once and
+    counted per (month, weekday); every combination is then answered from
+    a single cell of those counts (see CellCounts). Cities without an index
+    are loaded concurrently (see iter_city_data), each counted as soon as it
+    is loaded. With more than one worker, the cities are loaded and counted
+    in parallel processes instead.
+
+    Parameters
+    ----------
+    spec : DICT
+        Batch options, see parse_batch_spec.
+    workers : INT, optional
+        Number of processes used for the cities. The default is 1.
+
+    Returns
+    -------
+    None.
+
+    """
+    city_files = find_city_files(spec['cities'])
+    if(workers > 1 and len(city_files) > 1):
+        with concurrent.futures.ProcessPoolExecutor(min(workers, len(city_files))) as executor:
+            all_cells = dict(zip(city_files, executor.map(_city_cell_stats, city_files.values(),
+                                                          [spec['stages']] * len(city_files))))
+    else:
+        all_cells = {city: refresh_stats_index(city_file) for city, city_file in city_files.items()
+                     if os.path.exists(stats_index_file(city_file))}
+        for city, df in iter_city_data([city for city in city_files if city not in all_cells],
+                                       stages=spec['stages']):
+            all_cells[city] = compute_cell_stats(df)
+        #reported in the order of the cities option
+        all_cells = {city: all_cells[city] for city in city_files}
+    month_names = {m: month_name(m) for m in range(1, 13)}
+    weekday_names = {d: weekday_name(d) for d in range(7)}
+    with contextlib.ExitStack() as stack:
+        out = sys.stdout
+        if(spec['out'] is not None):
+            out = stack.enter_context(open(spec['out'], 'w', newline=''))
+        writer = None
+        if(spec['format'] == 'text'):
+            stack.enter_context(contextlib.redirect_stdout(out))
+        else:
+            writer = stack.enter_context(StatsWriter(out, spec['format']))
+        for city, cells in all_cells.items():
+            months = _batch_filters(spec['months'], month_names, cells.months())
+            weekdays = _batch_filters(spec['weekdays'], weekday_names, cells.weekdays())
+            for month in months:
+                for wkday in weekdays:
+                    stats = cells.stats(month, wkday)
+                    if(writer is not None):
+                        writer.write(stats_record(city, month, wkday, stats, spec['stages']))
+                        continue
+                    print('*'*45)
+                    print('{} -- month: {}, weekday: {}\n'.format(
+                        city.title(), month[1] if month else 'all', wkday[1] if wkday else 'all'))
+                    for stage, calc_stats in STAGE_FUNCTIONS.items():
+                        if(spec['stages'] is None or stage in spec['stages']):
+                            calc_stats(None, stats)
+
+
+class StatsServer:
+    """
+    answers statistics requests over HTTP from warm, in-memory city data
+
+    Each city is counted once per (month, weekday) (from its statistics
+    index if current, otherwise by loading the city file, which is kept in
+    DATASET_CACHE) and a request is answered by merging the counts of its
+    filters -- the same statistics as the calc_* functions. Responses are
+    cached by (city file, modification time, month, weekday), so a city
+    file that changes on disk is counted again on its next request.
+    Requests are handled in threads.
+
+    Requests:
+    GET /stats?city=chicago&month=2&weekday=wed
+        The statistics record (see stats_record) as json. month and
+        weekday are optional (number or name, all if not given).
+    GET /trips?city=chicago&start=Streeter Dr %26 Grand Ave&n=10
+        The n (default TOP_TRIPS) most common trips as json
+        [start station, end station, count] lists; only the trips from
+        start (its most common destinations) if given. month and weekday
+        filter as for /stats.
+    GET /cities
+        The available cities as json.
+
+    """
+
+    def __init__(self, cities=AVAILABLE_CITIES, cache_size=SERVER_RESULT_CACHE_SIZE):
+        self.cities = list(cities)
+        self.cache_size = cache_size
+        self._results = collections.OrderedDict()
+        self._results_lock = threading.Lock()
+        #city file: (modification time, cells), and a lock for each city file
+        self._cells = {}
+        self._cells_locks = collections.defaultdict(threading.Lock)
+        self._month_names = {m: month_name(m) for m in range(1, 13)}
+        self._weekday_names = {d: weekday_name(d) for d in range(7)}
+
+    def warm(self):
+        """
+        counts every available city up front, so the first requests are fast
+        """
+        with INSTRUMENTATION.span('warm'):
+            for city, cells in _iter_completed(self.city_cells, find_city_files(self.cities), LOAD_CONCURRENCY):
+                print('Counted {} ({} rows)'.format(city.title(), cells.total_rows()))
+
+    def city_cells(self, city_file):
+        """
+        returns the (month, weekday) counts of city_file (see compute_cell_stats),
+        counting the file again if it changed on disk
+        """
+        mtime = os.path.getmtime(city_file)
+        entry = self._cells.get(city_file)
+        if(entry is not None and entry[0] == mtime):
+            return entry[1]
+        with self._cells_locks[city_file]:
+            #another request may have counted it while waiting on the lock
+            entry = self._cells.get(city_file)
+            if(entry is None or entry[0] != mtime):
+                entry = (mtime, _city_cell_stats(city_file))
+                self._cells[city_file] = entry
+        return entry[1]
+
+    def parse_filter(self, value, names):
+        """
+        returns the (number, name) filter for a month/weekday query value,
+        NONE for no filter (raises a ValueError if unknown)
+        """
+        if(value is None or value.lower() in ('', 'all')):
+            return None
+        return parse_filter_value(value, names)
+
+    def stats(self, city, month=None, weekday=None):
+        """
+        returns the statistics response (json BYTES) for a city and its
+        month/weekday query values
+
+        Raises a LookupError for an unknown city and a ValueError for an
+        unknown month or weekday.
+        """
+        city_file, month, weekday = self._request_filters(city, month, weekday)
+        key = (city_file, os.path.getmtime(city_file),
+               month[0] if month else None, weekday[0] if weekday else None)
+        body = self._cached_result(key)
+        if(body is not None):
+            return body
+        with INSTRUMENTATION.span('server stats') as span:
+            stats = self.city_cells(city_file).stats(month, weekday)
+            body = json.dumps(stats_record(city.lower(), month, weekday, stats)).encode('utf-8')
+            span['rows'] = stats.rows
+        return self._cache_result(key, body)
+
+    def trips(self, city, month=None, weekday=None, start=None, n=None):
+        """
+        returns the most common trips response (json BYTES) for a city, its
+        month/weekday query values, and (optionally) start station
+
+        Raises a LookupError for an unknown city and a ValueError for an
+        unknown month or weekday or an invalid n (not a number of at least 1).
+        """
+        city_file, month, weekday = self._request_filters(city, month, weekday)
+        try:
+            n = TOP_TRIPS if n is None else int(n)
+        except ValueError:
+            raise ValueError("Invalid n '{}'".format(n))
+        if(n < 1):
+            raise ValueError("Invalid n '{}' (must be at least 1)".format(n))
+        key = ('trips', city_file, os.path.getmtime(city_file),
+               month[0] if month else None, weekday[0] if weekday else None, start, n)
+        body = self._cached_result(key)
+        if(body is not None):
+            return body
+        with INSTRUMENTATION.span('server trips') as span:
+            stats = self.city_cells(city_file).stats(month, weekday)
+            body = json.dumps(stats.top_trips(n, start)).encode('utf-8')
+            span['rows'] = stats.rows
+        return self._cache_result(key, body)
+
+    def _request_filters(self, city, month, weekday):
+        """
+        returns the city file and month/weekday filters for request query values
+        """
+        if(city is None or city.lower() not in self.cities):
+            raise LookupError("Unknown city '{}'".format(city))
+        city_file = find_city_file(city.lower())
+        if(city_file is None):
+            raise LookupError("No data for city '{}'".format(city))
+        return (city_file, self.parse_filter(month, self._month_names),
+                self.parse_filter(weekday, self._weekday_names))
+
+    def _cached_result(self, key):
+        """
+        returns the cached response for key, NONE if not cached
+        """
+        with self._results_lock:
+            body = self._results.get(key)
+            if(body is not None):
+                self._results.move_to_end(key)
+            return body
+
+    def _cache_result(self, key, body):
+        """
+        caches the response for key (dropping the least recently used
+        over cache_size) and returns it
+        """
+        with self._results_lock:
+            self._results[key] = body
+            while(len(self._results) > self.cache_size):
+                self._results.popitem(last=False)
+        return body
+
+    def serve(self, address):
+        """
+        serves requests on address until interrupted
+
+        Parameters
+        ----------
+        address : STR
+            [HOST:]PORT to listen on (HOST defaults to 127.0.0.1), or
+            unix:PATH for a Unix socket.
+
+        Returns
+        -------
+        None.
+
+        """
+        server = _make_http_server(address, _StatsRequestHandler)
+        server.stats_server = self
+        print('Serving bikeshare statistics on {} (Ctrl+C to stop)'.format(address))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if(address.startswith('unix:')):
+                os.remove(address[5:])
+
+
+class _StatsRequestHandler:
+    """
+    handles the requests of a StatsServer (combined with
+    http.server.BaseHTTPRequestHandler by _make_http_server, so http.server
+    is only imported when serving)
+    """
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = {key: values[-1] for key, values in urllib.parse.parse_qs(url.query).items()}
+        stats_server = self.server.stats_server
+        try:
+            if(url.path == '/stats'):
+                body = stats_server.stats(query.get('city'), query.get('month'), query.get('weekday'))
+            elif(url.path == '/trips'):
+                body = stats_server.trips(query.get('city'), query.get('month'), query.get('weekday'),
+                                          query.get('start'), query.get('n'))
+            elif(url.path == '/cities'):
+                body = json.dumps(stats_server.cities).encode('utf-8')
+            else:
+                raise LookupError("Unknown path '{}'".format(url.path))
+        except LookupError as ex:
+            self._send_json(404, json.dumps({'error': str(ex)}).encode('utf-8'))
+        except ValueError as ex:
+            self._send_json(400, json.dumps({'error': str(ex)}).encode('utf-8'))
+        else:
+            self._send_json(200, body)
+
+    def _send_json(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        #Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+def _make_http_server(address, handler):
+    """
+    returns a threaded http server listening on [HOST:]PORT or unix:PATH
+    """
+    import http.server
+    import socketserver
+    handler = type(handler.__name__, (handler, http.server.BaseHTTPRequestHandler), {})
+    if(address.startswith('unix:')):
+        if(not hasattr(socket, 'AF_UNIX')):
+            raise ValueError('Unix sockets are not available on this platform')
+
+        class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        return UnixHTTPServer(address[5:], handler)
+    host, _, port = address.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        raise ValueError("Invalid address '{}' (expected [HOST:]PORT or unix:PATH)".format(address))
+    return http.server.ThreadingHTTPServer((host or '127.0.0.1', port), handler)
+
+
+def parse_date(value, end=False):
+    """
+    parses a --from/--to date (or date and time)
+
+    A date without a time given as the end of a range includes the whole
+    day (the range stops before the next day).
+    """
+    try:
+        date = pd.Timestamp(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date '{}'".format(value))
+    if(end and date == date.normalize() and len(value.strip()) <= 10):
+        date += pd.Timedelta(days=1)
+    return date
+
+
+def parse_hours(value):
+    """
+    parses an --hours window 'START-END' (END excluded, ex. '7-9' for
+    7:00 to 8:59, '22-2' wraps past midnight) or a single hour, into the
+    list of hours it covers
+    """
+    start, sep, end = value.partition('-')
+    try:
+        start = int(start)
+        end = int(end) if sep else start + 1
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid hours '{}' (expected START-END)".format(value))
+    if(not (0 <= start < 24 and 0 <= end <= 24)):
+        raise argparse.ArgumentTypeError("invalid hours '{}' (hours are 0 to 24)".format(value))
+    if(end == start):
+        #an empty window, not every hour (use '0-24' for every hour)
+        raise argparse.ArgumentTypeError("invalid hours '{}' (END must differ from START)".format(value))
+    if(end > start):
+        return list(range(start, end))
+    return list(range(start, 24)) + list(range(0, end))
+
+
+def parse_args(args=None):
+    """
+    parses the command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Explore US bikeshare data.')
+    parser.add_argument('--build-cache', action='store_true',
+                        help='build the columnar cache file for each city and exit')
+    parser.add_argument('--build-index', action='store_true',
+                        help='build the statistics index file for each city and exit')
+    parser.add_argument('--refresh-index', action='store_true',
+                        help='add the rows appended to each city file since its statistics '
+                        'index was built to the index and exit')
+    parser.add_argument('--compress', choices=list(COMPRESSION_EXTS.values()), metavar='FORMAT',
+                        help='write a compressed copy of each city csv file (gzip, bz2, xz or zstd) '
+                        'that is decompressed in parallel when loaded, and exit')
+    parser.add_argument('--memory-report', action='store_true',
+                        help='print the memory used by the data when it is loaded')
+    parser.add_argument('--stream', action='store_true',
+                        help='calculate statistics reading the city file in chunks '
+                        '(for files larger than memory)')
+    parser.add_argument('--approx', nargs='?', type=int, const=APPROX_CAPACITY, metavar='COUNTERS',
+                        help='calculate statistics in one pass over the city file, estimating the '
+                        'station counts with COUNTERS values each (default {}); the range of '
+                        'each estimate is printed with it'.format(APPROX_CAPACITY))
+    parser.add_argument('--stages', type=parse_stages, metavar='STAGE,...',
+                        help='statistics to calculate: time, station, trip and/or user '
+                        '(only the columns they need are read; default all)')
+    parser.add_argument('--from', dest='date_from', type=parse_date, metavar='DATE',
+                        help='only trips starting on or after DATE (ex. 2017-03-05)')
+    parser.add_argument('--to', dest='date_to', type=lambda value: parse_date(value, end=True), metavar='DATE',
+                        help='only trips starting before the end of DATE (ex. 2017-04-20)')
+    parser.add_argument('--hours', type=parse_hours, metavar='START-END',
+                        help='only trips starting in the hour window (ex. 7-9 for 7:00 to 8:59)')
+    parser.add_argument('--workers', type=int, default=1, metavar='N',
+                        help='number of processes used to calculate statistics')
+    parser.add_argument('--batch', nargs='*', metavar='KEY=VALUE',
+                        help='calculate statistics without prompts for every combination of '
+                        'cities=..., months=..., weekdays=... (all, none, or comma separated) '
+                        'and write them to the console or out=FILE')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='serve statistics over http on [HOST:]PORT (or unix:PATH) '
+                        'from warm, in-memory city data')
+    parser.add_argument('--timing-depth', type=int, default=0, metavar='N',
+                        help='print the time of stages nested at most N deep (-1 for none)')
+    parser.add_argument('--timing-summary', action='store_true',
+                        help='print the total time spent in each stage on exit')
+    parser.add_argument('--profile-json', metavar='FILE',
+                        help='append the time, rows and memory of each stage to FILE as json lines')
+    parser.add_argument('--profile-dir', metavar='DIR',
+                        help='write a cProfile file to DIR for each outermost stage')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record the memory allocated by each stage (tracemalloc, slower)')
+    return parser.parse_args(args)
+
+
+def configure_instrumentation(args):
+    """
+    sets the sinks and options of INSTRUMENTATION from the command line arguments
+    """
+    sinks = []
+    if(args.timing_depth >= 0 or args.timing_summary):
+        #a negative depth prints nothing as it finishes
+        sinks.append(ConsoleSink(summary=args.timing_summary, max_depth=args.timing_depth))
+    if(args.profile_json):
+        sinks.append(JsonLogSink(args.profile_json))
+    INSTRUMENTATION.sinks = sinks
+    INSTRUMENTATION.trace_memory = args.trace_memory
+    INSTRUMENTATION.profile_dir = args.profile_dir
+
+
 if __name__ == '__main__':
-    pd_version = pkgr.get_distribution('pandas').version
-    if(pd_version != PD_VERSION):
-        print("ERROR: Pandas version is not compatible. Must be {}".format(PD_VERSION))
+    try:
+        pd_version = pandas_version()
+    except ImportError:
+        pd_version = None
+    args = parse_args()
+    REPORT_MEMORY = args.memory_report
+    configure_instrumentation(args)
+    if(pd_version is None):
+        print("ERROR: Pandas is not installed")
+    elif(not pandas_version_compatible(pd_version)):
+        print("ERROR: Pandas version {} is not compatible. Must be at least {} and below {}"
+              .format(pd_version, PD_MIN_VERSION, PD_MAX_VERSION))
+    elif(args.build_cache):
+        build_columnar_caches()
+    elif(args.compress is not None):
+        compress_city_files(args.compress)
+    elif(args.build_index or args.refresh_index):
+        build_stats_indexes(refresh=args.refresh_index)
+    elif(args.serve is not None):
+        try:
+            stats_server = StatsServer()
+            stats_server.warm()
+            stats_server.serve(args.serve)
+        except ValueError as ex:
+            print("ERROR: {}".format(ex))
+    elif(args.batch is not None):
+        try:
+            spec = parse_batch_spec(args.batch)
+            if(spec['stages'] is None):
+                spec['stages'] = args.stages
+            run_batch(spec, workers=args.workers)
+        except ValueError as ex:
+            print("ERROR: {}".format(ex))
     else:
-        main()
+        date_range = None
+        if(args.date_from is not None or args.date_to is not None):
+            date_range = (args.date_from, args.date_to)
+        main(stream=args.stream, workers=args.workers, stages=args.stages,
+             date_range=date_range, hours=args.hours, approx=args.approx)
+    INSTRUMENTATION.close()
         
\ No newline at end of file
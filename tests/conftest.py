@@ -0,0 +1,78 @@
+import math
+import os
+import shutil
+import sys
+
+import pytest
+
+#bikeshare.py and benchmark.py are scripts at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark  # noqa: E402
+import bikeshare  # noqa: E402
+
+#rows of the synthetic city files (January to June 2017)
+CITY_ROWS = 20000
+#month/weekday filters checked against the full computation
+FILTERS = [(None, None), ((3, 'March'), None), (None, (2, 'Wednesday')), ((5, 'May'), (6, 'Sunday'))]
+
+
+def assert_same_stats(stats, expected):
+    """
+    asserts that two TripStats hold the same counts (the duration sums only
+    up to float rounding, as they are added up in a different order)
+    """
+    assert math.isclose(stats.duration_sum, expected.duration_sum, rel_tol=1e-9)
+    stats.duration_sum = expected.duration_sum
+    assert stats == expected
+    assert stats.station_stats() == expected.station_stats()
+    assert stats.user_stats() == expected.user_stats()
+
+
+def filter_frame(df, month=None, dow=None):
+    """
+    returns the rows of a loaded city frame matching the filters, numbered from 0
+    """
+    if(month is not None):
+        df = df[df['Month'] == month[0]]
+    if(dow is not None):
+        df = df[df['DoW'] == dow[0]]
+    return df.reset_index(drop=True)
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    """
+    empty in-memory caches for each test, and no background parsing
+    """
+    monkeypatch.setattr(bikeshare, 'FILL_CACHES_LATER', False)
+    for cache in [bikeshare._STATS_INDEX_CACHE, bikeshare._METADATA_CACHE]:
+        cache.clear()
+    bikeshare.DATASET_CACHE.clear()
+    yield
+    bikeshare.DATASET_CACHE.clear()
+
+
+@pytest.fixture(scope='session')
+def synthetic_files(tmp_path_factory):
+    """
+    synthetic chicago (with Gender and Birth Year) and washington
+    (fractional durations) shaped city files, written once
+    """
+    directory = tmp_path_factory.mktemp('synthetic')
+    files = {}
+    for city in ['chicago', 'washington']:
+        files[city] = str(directory / (city + '.csv'))
+        benchmark.write_synthetic_csv(files[city], CITY_ROWS, city)
+    return files
+
+
+@pytest.fixture(params=['chicago', 'washington'])
+def city_csv(request, synthetic_files, tmp_path):
+    """
+    a copy of a synthetic city file in its own directory (its cache files
+    are written next to it)
+    """
+    path = str(tmp_path / (request.param + '.csv'))
+    shutil.copy(synthetic_files[request.param], path)
+    return path
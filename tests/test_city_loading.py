@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+import pytest
+
+import bikeshare
+
+
+@pytest.fixture
+def city_files(tmp_path, monkeypatch):
+    """
+    empty city files in the working directory, loaded by a slow fake load_data
+    """
+    monkeypatch.chdir(tmp_path)
+    for city in bikeshare.AVAILABLE_CITIES:
+        (tmp_path / (city.replace(' ', '_') + '.csv')).touch()
+    return tmp_path
+
+
+def fake_loader(monkeypatch, seconds, fail=None):
+    """
+    replaces load_data with a sleep of seconds[city file name], recording
+    the most cities loaded at the same time
+    """
+    state = {'running': 0, 'most': 0, 'started': []}
+    lock = threading.Lock()
+
+    def load_data(city_file, month=None, dow=None, columns=None):
+        name = os.path.basename(city_file)
+        with lock:
+            state['running'] += 1
+            state['most'] = max(state['most'], state['running'])
+            state['started'].append(name)
+        time.sleep(seconds[name])
+        with lock:
+            state['running'] -= 1
+        if(name == fail):
+            raise ValueError('bad file ' + name)
+        return name
+
+    monkeypatch.setattr(bikeshare, 'load_data', load_data)
+    return state
+
+
+def test_iter_city_data_yields_in_finish_order(city_files, monkeypatch):
+    fake_loader(monkeypatch, {'chicago.csv': 0.3, 'new_york_city.csv': 0.0, 'washington.csv': 0.15})
+    cities = [city for city, df in bikeshare.iter_city_data()]
+    assert cities == ['new york city', 'washington', 'chicago']
+
+
+def test_iter_city_data_concurrency_limit(city_files, monkeypatch):
+    state = fake_loader(monkeypatch, dict.fromkeys(['chicago.csv', 'new_york_city.csv', 'washington.csv'], 0.1))
+    assert len(list(bikeshare.iter_city_data(max_concurrency=2))) == 3
+    assert state['most'] == 2
+    state = fake_loader(monkeypatch, dict.fromkeys(['chicago.csv', 'new_york_city.csv', 'washington.csv'], 0.1))
+    assert len(list(bikeshare.iter_city_data(max_concurrency=1))) == 3
+    assert state['most'] == 1
+
+
+def test_iter_city_data_close_cancels_cities_not_started(city_files, monkeypatch):
+    state = fake_loader(monkeypatch, dict.fromkeys(['chicago.csv', 'new_york_city.csv', 'washington.csv'], 0.1))
+    loads = bikeshare.iter_city_data(max_concurrency=1)
+    next(loads)
+    loads.close()
+    time.sleep(0.3)
+    #a city already loading finishes, the last one is never started
+    assert state['started'][0] == 'chicago.csv'
+    assert 'washington.csv' not in state['started']
+
+
+def test_iter_city_data_raises_load_errors(city_files, monkeypatch):
+    fake_loader(monkeypatch, {'chicago.csv': 0.0, 'new_york_city.csv': 0.0, 'washington.csv': 0.0},
+                fail='new_york_city.csv')
+    with pytest.raises(ValueError, match='new_york_city'):
+        list(bikeshare.iter_city_data(max_concurrency=1))
@@ -0,0 +1,40 @@
+import concurrent.futures
+import multiprocessing
+
+import pytest
+
+import bikeshare
+from conftest import FILTERS, assert_same_stats
+
+needs_fork = pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(),
+                                reason='parallel_compute_stats forks its workers')
+
+
+@needs_fork
+def test_parallel_compute_stats_matches_compute_stats(city_csv):
+    df = bikeshare.load_data(city_csv)
+    assert_same_stats(bikeshare.parallel_compute_stats(df, 3), bikeshare.compute_stats(df))
+
+
+@needs_fork
+def test_parallel_compute_stats_from_threads(synthetic_files):
+    #each pool must count its own dataframe
+    frames = [bikeshare.load_data(datafile) for datafile in synthetic_files.values()]
+    frames.append(frames[0].iloc[:5000])
+    with concurrent.futures.ThreadPoolExecutor(len(frames)) as executor:
+        results = list(executor.map(bikeshare.parallel_compute_stats, frames, [2] * len(frames)))
+    for stats, df in zip(results, frames):
+        assert_same_stats(stats, bikeshare.compute_stats(df))
+
+
+@pytest.mark.parametrize('month, dow', FILTERS)
+def test_parallel_stream_stats_matches_stream_stats(city_csv, month, dow):
+    stats = bikeshare.parallel_stream_stats(city_csv, month, dow, workers=3)
+    assert_same_stats(stats, bikeshare.stream_stats(city_csv, month, dow))
+
+
+def test_parallel_stream_stats_of_compressed_members(city_csv):
+    compressed_file = bikeshare.compress_city_file(city_csv, member_bytes=100000)
+    assert len(bikeshare.read_member_index(compressed_file)['sizes']) > 3
+    stats = bikeshare.parallel_stream_stats(compressed_file, workers=3)
+    assert_same_stats(stats, bikeshare.stream_stats(city_csv))
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bikeshare
+
+
+def naive_top(df, n, start_station=None):
+    """
+    the n most common (start, end) pairs by a plain groupby,
+    most common first and ties in station order
+    """
+    if(start_station is not None):
+        df = df[df['Start Station'] == start_station]
+    counts = (df.astype({'Start Station': object, 'End Station': object})
+              .groupby(['Start Station', 'End Station']).size().reset_index(name='count'))
+    counts = counts.sort_values(['count', 'Start Station', 'End Station'], ascending=[False, True, True])
+    return [(start, end, int(count)) for start, end, count in counts.head(n).itertuples(index=False)]
+
+
+@pytest.mark.parametrize('n', [1, 5, 40])
+@pytest.mark.parametrize('bincount_max', [bikeshare.PAIR_BINCOUNT_MAX, 1])
+def test_ranking_matches_groupby(synthetic_files, n, bincount_max, monkeypatch):
+    #with a maximum of 1 the pairs are counted by np.unique instead
+    monkeypatch.setattr(bikeshare, 'PAIR_BINCOUNT_MAX', bincount_max)
+    df = bikeshare.load_data(synthetic_files['chicago'])
+    station = df['Start Station'].iloc[0]
+    assert bikeshare.rank_station_pairs(df['Start Station'], df['End Station'], n) == naive_top(df, n)
+    assert bikeshare.rank_station_pairs(df['Start Station'], df['End Station'], n, station) == \
+        naive_top(df, n, station)
+    pairs = bikeshare.compute_stats(df).station_pairs
+    assert pairs.top(n) == naive_top(df, n)
+    assert pairs.top(n, station) == naive_top(df, n, station)
+
+
+def test_ties_and_missing_stations():
+    df = pd.DataFrame({'Start Station': ['b', 'a', 'b', 'a', np.nan, 'c', 'c', 'a'],
+                       'End Station': ['x', 'y', 'x', 'y', 'x', 'x', np.nan, 'x']})
+    for n in range(1, 6):
+        assert bikeshare.rank_station_pairs(df['Start Station'], df['End Station'], n) == naive_top(df, n)
+    categorical = df.astype('category')
+    assert bikeshare.rank_station_pairs(categorical['Start Station'], categorical['End Station'], 3) == \
+        naive_top(df, 3)
+    assert bikeshare.rank_station_pairs(df['Start Station'], df['End Station'], 3, 'unknown') == []
+
+
+def test_n_below_one_is_rejected():
+    df = pd.DataFrame({'Start Station': ['a'], 'End Station': ['b']})
+    with pytest.raises(ValueError):
+        bikeshare.rank_station_pairs(df['Start Station'], df['End Station'], 0)
@@ -0,0 +1,87 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+import bikeshare
+from conftest import assert_same_stats
+
+#lines of the city file there before the rest are appended
+FIRST_LINES = 3000
+
+
+@pytest.fixture
+def appended_csv(city_csv, tmp_path):
+    """
+    a city file cut to its header and first lines, and a function that
+    appends the rest of the lines (returning a copy of the whole file
+    in another directory)
+    """
+    with open(city_csv, 'rb') as f:
+        lines = f.readlines()
+    with open(city_csv, 'wb') as f:
+        f.writelines(lines[:FIRST_LINES + 1])
+
+    def append_rest():
+        with open(city_csv, 'ab') as f:
+            f.writelines(lines[FIRST_LINES + 1:])
+        whole = tmp_path / 'whole'
+        whole.mkdir()
+        return shutil.copy(city_csv, str(whole))
+    return city_csv, append_rest
+
+
+def test_refreshed_index_matches_rebuilt(appended_csv):
+    datafile, append_rest = appended_csv
+    assert bikeshare.build_stats_index(datafile).total_rows() == FIRST_LINES
+    whole = append_rest()
+    index = bikeshare._load_stats_index(datafile)
+    #only the appended rows are counted
+    assert bikeshare.appended_offset(datafile, index['source'], index['tail']) is not None
+    refreshed = bikeshare.refresh_stats_index(datafile)
+    rebuilt = bikeshare.build_stats_index(whole)
+    for month in [None, (1, 'January'), (6, 'June')]:
+        for dow in [None, (0, 'Monday')]:
+            assert_same_stats(refreshed.stats(month, dow), rebuilt.stats(month, dow))
+    bikeshare._STATS_INDEX_CACHE.clear()
+    assert_same_stats(bikeshare.read_stats_index(datafile).stats(), rebuilt.stats())
+
+
+def test_appended_columnar_cache_matches_parsed(appended_csv):
+    pytest.importorskip('pyarrow')
+    datafile, append_rest = appended_csv
+    assert len(bikeshare.read_city_data(datafile)) == FIRST_LINES
+    whole = append_rest()
+    bikeshare.DATASET_CACHE.clear()
+    df = bikeshare.read_appended_columnar_cache(datafile)
+    expected = bikeshare.parse_city_csv(whole)
+    pd.testing.assert_frame_equal(df, expected, check_categorical=False)
+    #the cache rewritten with the appended rows is current again
+    bikeshare.DATASET_CACHE.clear()
+    pd.testing.assert_frame_equal(bikeshare.read_columnar_cache(datafile), df)
+
+
+def test_appended_metadata_matches_probed(appended_csv):
+    datafile, append_rest = appended_csv
+    saved = bikeshare.probe_city_file(datafile)
+    assert saved['rows'] == FIRST_LINES
+    whole = append_rest()
+    assert bikeshare.appended_offset(datafile, saved['source'], saved['tail']) is not None
+    refreshed = bikeshare.probe_city_file(datafile)
+    expected = bikeshare.probe_city_file(whole)
+    for key in ['rows', 'first_start', 'last_start', 'months', 'weekdays', 'columns']:
+        assert refreshed[key] == expected[key]
+
+
+def test_changed_file_is_rebuilt(appended_csv):
+    datafile, append_rest = appended_csv
+    bikeshare.build_stats_index(datafile)
+    bikeshare.probe_city_file(datafile)
+    whole = append_rest()
+    #not only appended to -- the first row is dropped
+    with open(whole, 'rb') as f:
+        lines = f.readlines()
+    with open(datafile, 'wb') as f:
+        f.writelines(lines[:1] + lines[2:])
+    assert bikeshare.refresh_stats_index(datafile).total_rows() == len(lines) - 2
+    assert bikeshare.probe_city_file(datafile)['rows'] == len(lines) - 2
@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+import bikeshare
+from conftest import FILTERS
+
+
+def plain(df):
+    """
+    returns df with its categorical columns as plain values (a page has
+    only the categories of its own rows)
+    """
+    return df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+
+
+def assert_pages_match(pager, expected, count):
+    for start in range(0, len(expected) + count, count):
+        page = pager.page(start, count)
+        if(start >= len(expected)):
+            assert len(page) == 0
+            continue
+        pd.testing.assert_frame_equal(plain(page), plain(expected.iloc[start:start + count]), check_dtype=False)
+
+
+@pytest.mark.parametrize('month, dow', FILTERS)
+def test_pages_match_loaded_rows(city_csv, month, dow, monkeypatch):
+    #blocks much smaller than the file, so pages span several blocks
+    monkeypatch.setattr(bikeshare, 'PAGER_BLOCK_BYTES', 50000)
+    expected = bikeshare.load_data(city_csv, month, dow)
+    pager = bikeshare.RowPager(city_csv, month, dow)
+    assert_pages_match(pager, expected, 997)
+    assert pager.scanned()
+
+
+def test_pages_of_compressed_file(city_csv, monkeypatch):
+    monkeypatch.setattr(bikeshare, 'PAGER_BLOCK_BYTES', 50000)
+    month = (4, 'April')
+    expected = bikeshare.load_data(city_csv, month)
+    pager = bikeshare.RowPager(bikeshare.compress_city_file(city_csv), month)
+    assert_pages_match(pager, expected, 1500)
+
+
+def test_pages_out_of_order(city_csv):
+    expected = bikeshare.load_data(city_csv, None, (5, 'Saturday'))
+    pager = bikeshare.RowPager(city_csv, None, (5, 'Saturday'))
+    for start in [800, 0, 400]:
+        pd.testing.assert_frame_equal(plain(pager.page(start, 5)), plain(expected.iloc[start:start + 5]),
+                                      check_dtype=False)
@@ -0,0 +1,67 @@
+import collections
+
+import numpy as np
+import pytest
+
+import bikeshare
+from conftest import assert_same_stats
+
+
+def random_batches(seed, batches=30, size=500, values=300):
+    """
+    batches of counts of skewed random values, as a stream would give them
+    """
+    rng = np.random.default_rng(seed)
+    return [collections.Counter(rng.zipf(1.3, size) % values) for _ in range(batches)]
+
+
+def assert_bounds_hold(sketch, counts):
+    for value, count in counts.items():
+        low, high = sketch.bounds(value)
+        assert low <= count <= high
+    assert all(value in counts for value in sketch.counts)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('capacity', [5, 20, 100])
+def test_bounds_hold(seed, capacity):
+    sketch = bikeshare.SpaceSaving(capacity)
+    counts = collections.Counter()
+    for batch in random_batches(seed):
+        sketch.update(batch)
+        counts.update(batch)
+        assert len(sketch.counts) <= capacity
+        assert_bounds_hold(sketch, counts)
+    #a proven top is the true top
+    ranked = sorted(sketch.counts, key=sketch.counts.get, reverse=True)
+    for top in [ranked[:1], ranked[:3]]:
+        if(sketch.proves_top(top)):
+            lowest = min(counts[value] for value in top)
+            assert all(count <= lowest for value, count in counts.items() if value not in top)
+
+
+def test_exact_without_drops():
+    sketch = bikeshare.SpaceSaving(1000)
+    counts = collections.Counter()
+    for batch in random_batches(0):
+        sketch.update(batch)
+        counts.update(batch)
+    assert sketch.exact
+    assert sketch.counts == dict(counts)
+    assert sketch.proves_top([counts.most_common(1)[0][0]])
+
+
+@pytest.mark.parametrize('capacity', [10, 100000])
+def test_approx_stream_stats_bounds(synthetic_files, capacity):
+    datafile = synthetic_files['chicago']
+    exact = bikeshare.stream_stats(datafile, chunksize=2000)
+    stats = bikeshare.approx_stream_stats(datafile, capacity=capacity, chunksize=2000)
+    for name in bikeshare.TripStats.SKETCHED:
+        sketch = stats.sketches[name]
+        assert sketch.exact == (capacity > len(getattr(exact, name)))
+        assert_bounds_hold(sketch, collections.Counter(dict(getattr(exact, name).items())))
+    #the other counts are exact
+    stats.sketches = None
+    for name in bikeshare.TripStats.SKETCHED:
+        setattr(stats, name, getattr(exact, name))
+    assert_same_stats(stats, exact)
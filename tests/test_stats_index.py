@@ -0,0 +1,53 @@
+import bikeshare
+from conftest import assert_same_stats, filter_frame
+
+MONTHS = [None] + [(m, bikeshare.month_name(m)) for m in range(1, 8)]
+WEEKDAYS = [None] + [(d, bikeshare.weekday_name(d)) for d in range(7)]
+
+
+def test_index_cells_match_compute_stats(city_csv):
+    df = bikeshare.load_data(city_csv)
+    cells = bikeshare.build_stats_index(city_csv)
+    for month in MONTHS:
+        for dow in WEEKDAYS:
+            expected = bikeshare.compute_stats(filter_frame(df, month, dow))
+            stats = cells.stats(month, dow)
+            assert stats.top_trips(3) == expected.top_trips(3)
+            assert_same_stats(stats, expected)
+    station = df['Start Station'].iloc[0]
+    assert cells.stats().top_trips(3, station) == bikeshare.compute_stats(df).top_trips(3, station)
+    assert cells.months() == sorted(df['Month'].unique())
+    assert cells.total_rows() == len(df)
+
+
+def test_merged_cells_match_whole(city_csv):
+    df = bikeshare.load_data(city_csv)
+    #the halves have different station categories
+    first = bikeshare.apply_dtype_plan(df.iloc[:8000].astype({'Start Station': str, 'End Station': str}))
+    second = bikeshare.apply_dtype_plan(df.iloc[8000:].astype({'Start Station': str, 'End Station': str}))
+    merged = bikeshare.compute_cell_stats(first).merge(bikeshare.compute_cell_stats(second))
+    whole = bikeshare.compute_cell_stats(df)
+    for month in MONTHS:
+        for dow in WEEKDAYS[:3]:
+            assert_same_stats(merged.stats(month, dow), whole.stats(month, dow))
+
+
+def test_saved_index_round_trip(city_csv):
+    cells = bikeshare.build_stats_index(city_csv)
+    bikeshare._STATS_INDEX_CACHE.clear()
+    read = bikeshare.read_stats_index(city_csv)
+    assert read is not cells
+    assert_same_stats(read.stats((2, 'February'), None), cells.stats((2, 'February'), None))
+
+
+def test_unusable_index_is_not_read(city_csv, monkeypatch):
+    bikeshare.build_stats_index(city_csv)
+    bikeshare._STATS_INDEX_CACHE.clear()
+    monkeypatch.setattr(bikeshare, 'STATS_INDEX_VERSION', bikeshare.STATS_INDEX_VERSION + 1)
+    assert bikeshare.read_stats_index(city_csv) is None
+    with open(bikeshare.stats_index_file(city_csv), 'wb') as f:
+        f.write(b'not an index')
+    assert bikeshare.read_stats_index(city_csv) is None
+    #an unreadable index is built again
+    assert bikeshare.refresh_stats_index(city_csv).total_rows() == len(bikeshare.load_data(city_csv))
+    assert bikeshare.read_stats_index(city_csv) is not None
@@ -0,0 +1,47 @@
+import csv
+import io
+import json
+
+import bikeshare
+
+FILTERS = [(None, None), ((2, 'February'), (0, 'Monday'))]
+
+
+def make_records(datafile):
+    records = [bikeshare.stats_record('chicago', month, dow,
+                                      bikeshare.compute_stats(bikeshare.load_data(datafile, month, dow)))
+               for month, dow in FILTERS]
+    #only some of the stages
+    stats = bikeshare.compute_stats(bikeshare.load_data(datafile))
+    return records + [bikeshare.stats_record('chicago', None, None, stats, ['station'])]
+
+
+def written(records, fmt):
+    fp = io.StringIO()
+    with bikeshare.StatsWriter(fp, fmt) as writer:
+        for record in records:
+            writer.write(record)
+    return fp.getvalue()
+
+
+def test_json_round_trip(synthetic_files):
+    records = make_records(synthetic_files['chicago'])
+    expected = json.loads(json.dumps(records))
+    assert json.loads(written(records, 'json')) == expected
+    assert [json.loads(line) for line in written(records, 'ndjson').splitlines()] == expected
+    assert json.loads(written([], 'json')) == []
+    assert records[1]['weekday'] == 'Monday' and set(records[2]) == {'city', 'month', 'weekday', 'rows', 'station'}
+
+
+def test_csv_rows(synthetic_files):
+    records = make_records(synthetic_files['chicago'])
+    rows = list(csv.DictReader(io.StringIO(written(records, 'csv'))))
+    stats = bikeshare.compute_stats(bikeshare.load_data(synthetic_files['chicago']))
+    first = [row for row in rows if row['month'] == '']
+    assert first[0]['statistic'] == 'rows' and int(first[0]['value']) == stats.rows
+    trips = [(row['statistic'], row['value']) for row in first if row['statistic'].startswith('top_trips')]
+    expected = []
+    for start, end, count in stats.station_stats().top_trips:
+        expected += [('top_trips', '{} to {}'.format(start, end)), ('top_trips.count', str(count))]
+    assert trips[:len(expected)] == expected
+    assert {row['month'] for row in rows} == {'', 'February'}
@@ -0,0 +1,25 @@
+import pytest
+
+import bikeshare
+from conftest import FILTERS, assert_same_stats, filter_frame
+
+
+@pytest.mark.parametrize('month, dow', FILTERS)
+def test_stream_stats_matches_compute_stats(city_csv, month, dow):
+    expected = bikeshare.compute_stats(filter_frame(bikeshare.load_data(city_csv), month, dow))
+    stats = bikeshare.stream_stats(city_csv, month, dow, chunksize=3000)
+    assert_same_stats(stats, expected)
+
+
+def test_merged_parts_match_whole(city_csv):
+    df = bikeshare.load_data(city_csv)
+    stats = bikeshare.TripStats()
+    for start in range(0, len(df), 7000):
+        stats.merge(bikeshare.compute_stats(df.iloc[start:start + 7000]))
+    assert_same_stats(stats, bikeshare.compute_stats(df))
+
+
+def test_merge_keeps_missing_columns_missing(synthetic_files):
+    df = bikeshare.load_data(synthetic_files['washington'])
+    stats = bikeshare.TripStats().merge(bikeshare.compute_stats(df))
+    assert stats.genders is None and stats.birth_years is None